@@ -10,11 +10,20 @@ chmod -R 755 /app/static
 echo "----- Apply database migrations -----"
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
+# Room shards, see voting.sharding
+i=0
+while [ "$i" -lt "${VOTING_SHARDS:-0}" ]; do
+    python manage.py migrate --noinput --database "shard_$i"
+    i=$((i + 1))
+done
 
 if [ "$DEBUG" = "True" ]; then
     echo "----- Starting development server -----"
     python manage.py runserver 0.0.0.0:8000
 else
     echo "----- Starting production server -----"
-    exec gunicorn --bind 0.0.0.0:8000 --workers 2 evaluator.wsgi
+    # Several ASGI workers; realtime updates reach all of them through the
+    # shared channel layer (CHANNEL_LAYER_HOSTS, see voting.realtime)
+    exec gunicorn --bind 0.0.0.0:8000 --workers "${WEB_CONCURRENCY:-2}" \
+        --worker-class uvicorn_worker.UvicornWorker evaluator.asgi:application
 fi
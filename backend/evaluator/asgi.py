@@ -2,6 +2,8 @@
 ASGI config for evaluator project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django, WebSockets (``/ws/...``) to the Channels consumers in
+``evaluator.routing``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'evaluator.settings')
 
-application = get_asgi_application()
+# Set up Django before the consumers import any models
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from users.authentication import WebSocketTokenAuthMiddleware  # noqa: E402
+
+from evaluator.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter(
+    {
+        "http": django_asgi_app,
+        "websocket": AllowedHostsOriginValidator(
+            AuthMiddlewareStack(
+                WebSocketTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+            )
+        ),
+    }
+)
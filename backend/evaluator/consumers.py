@@ -1,18 +1,45 @@
 # Real-time Updates (WebSocket support with Channels)
-# class RankingConsumer(WebsocketConsumer):
-#     def connect(self):
-#         self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
-#         self.user = self.scope["user"]
-
-#         if not self.user.rooms.filter(id=self.room_id).exists():
-#             self.close()
-#             return
-
-#         async_to_sync(self.channel_layer.group_add)(
-#             f"room_{self.room_id}", self.channel_name
-#         )
-#         self.accept()
-
-#     def receive(self, text_data):
-#         data = json.loads(text_data)
-#         # Handle ranking updates and broadcast to group
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from voting import realtime
+
+
+class RankingConsumer(AsyncWebsocketConsumer):
+    """
+    Read-only stream of a room's participation progress and results.
+
+    Sends the current state on connect, then the latest state whenever
+    :func:`voting.realtime.publish_room_update` announces a new revision. Only
+    the room's participants and staff may follow a room.
+    """
+
+    async def connect(self):
+        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
+        self.group = None
+        user = self.scope.get("user")
+        if not await database_sync_to_async(realtime.can_follow_room)(
+            user, self.room_id
+        ):
+            await self.close()
+            return
+
+        self.group = realtime.room_group(self.room_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        # Echo the token subprotocol back, browsers drop the socket otherwise
+        subprotocols = self.scope.get("subprotocols", [])
+        await self.accept(subprotocol="token" if "token" in subprotocols else None)
+
+        snapshot = await database_sync_to_async(realtime.room_update)(self.room_id)
+        if snapshot is not None:
+            await self.send(text_data=snapshot)
+
+    async def disconnect(self, code):
+        if self.group is not None:
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def room_update(self, event):
+        text = await database_sync_to_async(realtime.latest_room_update)(
+            self.room_id, event["revision"]
+        )
+        if text is not None:
+            await self.send(text_data=text)
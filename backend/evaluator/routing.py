@@ -0,0 +1,7 @@
+from django.urls import path
+
+from evaluator.consumers import RankingConsumer
+
+websocket_urlpatterns = [
+    path("ws/rooms/<uuid:room_id>/", RankingConsumer.as_asgi()),
+]
@@ -4,6 +4,8 @@ from pathlib import Path
 from django.utils.translation import gettext_lazy as _
 from dotenv import load_dotenv
 
+from evaluator.database import plain_sqlite_database, sqlite_database
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,12 +15,65 @@ SECRET_KEY = os.getenv("DJANGO_SECRET_KEY")
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "").split(",")
 
-# Database
-DATABASES = {
+# Database, see evaluator.database for the SQLite profile
+DB_PATH = os.getenv("DB_PATH", BASE_DIR / "db.sqlite3")
+
+
+def _sqlite(path):
+    if os.getenv("DB_PROFILE", "production") != "production":
+        return plain_sqlite_database(path)
+    return sqlite_database(
+        path,
+        timeout=float(os.getenv("DB_TIMEOUT", "5")),
+        conn_max_age=int(os.getenv("DB_CONN_MAX_AGE", "600")),
+    )
+
+
+DATABASES = {"default": _sqlite(DB_PATH)}
+
+# Optional room shards, see voting.sharding: VOTING_SHARDS=4 keeps rooms in
+# shard_0.sqlite3 ... shard_3.sqlite3 next to the main database, or wherever
+# DB_PATH_SHARD_0 ... DB_PATH_SHARD_3 point to spread them over disks
+VOTING_SHARDS = [f"shard_{i}" for i in range(int(os.getenv("VOTING_SHARDS", "0")))]
+VOTING_SHARD_DIR = Path(os.getenv("VOTING_SHARD_DIR", Path(DB_PATH).parent))
+for alias in VOTING_SHARDS:
+    DATABASES[alias] = _sqlite(
+        os.getenv(f"DB_PATH_{alias.upper()}", VOTING_SHARD_DIR / f"{alias}.sqlite3")
+    )
+if VOTING_SHARDS:
+    DATABASE_ROUTERS = ["voting.sharding.RoomShardRouter"]
+
+# Cache shared by all gunicorn workers (room results, ...)
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.getenv("DB_PATH", BASE_DIR / "db.sqlite3"),
-    }
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", BASE_DIR / "cache"),
+    },
+    # Unconfirmed ranking drafts, see voting.drafts: one entry per participant
+    # until flush_vote_drafts writes it back and deletes it. Keep MAX_ENTRIES
+    # above the number of participants, beyond it entries are culled at random.
+    "drafts": {
+        "BACKEND": os.getenv(
+            "DRAFT_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("DRAFT_CACHE_LOCATION", BASE_DIR / "cache" / "drafts"),
+        "OPTIONS": {"MAX_ENTRIES": 1_000_000},
+    },
+    # Shared tier of the API token lookups, see users.token_cache: one small
+    # entry per token used within AUTH_TOKEN_CACHE_TTL. Keep MAX_ENTRIES above
+    # the number of attendees active at once.
+    "auth_tokens": {
+        "BACKEND": os.getenv(
+            "AUTH_TOKEN_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.getenv(
+            "AUTH_TOKEN_CACHE_LOCATION", BASE_DIR / "cache" / "auth_tokens"
+        ),
+        "OPTIONS": {"MAX_ENTRIES": 100_000},
+    },
 }
 
 if not DEBUG:
@@ -79,6 +134,8 @@ AUTH_USER_MODEL = "users.CustomUser"
 
 
 INSTALLED_APPS = [
+    # ASGI runserver, for the WebSockets in evaluator.routing
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -104,7 +161,11 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.locale.LocaleMiddleware",
+    # Only active with DEBUG, see voting.query_budget
+    "voting.middleware.QueryBudgetMiddleware",
 ]
+# Fail requests over their query budget instead of logging them
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "False").lower() == "true"
 
 TEMPLATES = [
     {
@@ -124,6 +185,23 @@ TEMPLATES = [
 
 ROOT_URLCONF = "evaluator.urls"
 WSGI_APPLICATION = "evaluator.wsgi.application"
+ASGI_APPLICATION = "evaluator.asgi.application"
+
+# Realtime room updates, see voting.realtime. The in-memory layer only reaches
+# WebSockets served by the same process; use e.g.
+# CHANNEL_LAYER_BACKEND=channels_redis.core.RedisChannelLayer and
+# CHANNEL_LAYER_HOSTS=redis://redis:6379 to run several.
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CHANNEL_LAYER_BACKEND", "channels.layers.InMemoryChannelLayer"
+        ),
+    }
+}
+if os.getenv("CHANNEL_LAYER_HOSTS"):
+    CHANNEL_LAYERS["default"]["CONFIG"] = {
+        "hosts": os.getenv("CHANNEL_LAYER_HOSTS").split(",")
+    }
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -146,7 +224,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.UUIDTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
@@ -154,6 +232,31 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Token lookups cached per process (LRU, 0 = off) and in a shared cache alias
+# ("" = none), see users.token_cache. The TTL bounds how long a deactivated
+# user stays logged in on other processes.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+AUTH_TOKEN_SHARED_CACHE = os.getenv("AUTH_TOKEN_SHARED_CACHE", "auth_tokens")
+
+# Voting
+# "numpy" (vectorized) or "python" (reference implementation)
+VOTING_SKATING_ENGINE = os.getenv("VOTING_SKATING_ENGINE", "numpy")
+# Resamples and worker processes for the ?stability=1 results (0 = all CPUs)
+VOTING_BOOTSTRAP_SAMPLES = int(os.getenv("VOTING_BOOTSTRAP_SAMPLES", "2000"))
+VOTING_BOOTSTRAP_WORKERS = int(os.getenv("VOTING_BOOTSTRAP_WORKERS", "0")) or None
+# Keep unconfirmed drafts in the "drafts" cache, written back by flush_vote_drafts
+VOTING_DRAFT_BUFFER = os.getenv("VOTING_DRAFT_BUFFER", "True").lower() == "true"
+# Widths of the resized object images, made by the ranking worker after an
+# upload unless turned off (then run generate_image_variants), see voting.images
+VOTING_IMAGE_WIDTHS = [
+    int(width)
+    for width in os.getenv("VOTING_IMAGE_WIDTHS", "160,320,640,1280").split(",")
+]
+VOTING_IMAGE_VARIANTS_ON_SAVE = (
+    os.getenv("VOTING_IMAGE_VARIANTS_ON_SAVE", "True").lower() == "true"
+)
+
 LANGUAGES = [
     ("ru", _("Русский")),
     ("en", _("Английский")),
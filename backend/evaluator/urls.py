@@ -2,13 +2,18 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from users.views import UUIDLoginView, login_view, rooms_view
+from users.views import TokenCacheStatsView, UUIDLoginView, login_view, rooms_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", login_view, name="login"),
     path("rooms/", rooms_view, name="rooms"),
     path("api/auth/login/", UUIDLoginView.as_view(), name="api_login"),
+    path(
+        "api/auth/token-cache/",
+        TokenCacheStatsView.as_view(),
+        name="token_cache_stats",
+    ),
     # Include voting.urls without the api prefix since it's already defined there
     path("", include("voting.urls")),  # This includes all of voting/urls.py at root
 ]
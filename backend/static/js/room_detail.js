@@ -9,10 +9,10 @@
 // Configuration constants
 const CONFIG = {
   ENDPOINTS: {
-    ROOMS: (id) => `/api/voting/rooms/${id}/`,
-    PARTICIPANT_STATUS: (id) => `/api/voting/rooms/${id}/participant-status/`,
-    OBJECTS: (id) => `/api/voting/rooms/${id}/objects/`,
+    BOOTSTRAP: (id) => `/api/voting/rooms/${id}/bootstrap/`,
     UPDATE_RANKING: (id) => `/api/voting/rooms/${id}/update-ranking/`,
+    PATCH_RANKING: (id) => `/api/voting/rooms/${id}/ranking/`,
+    ROOM_UPDATES: (id) => `/ws/rooms/${id}/`,
     VERIFY_TOKEN: `/api/auth/verify-token/`,
   },
   AUTOSAVE: {
@@ -23,6 +23,12 @@ const CONFIG = {
     DURATION: 3000,
     FADE_DURATION: 300,
   },
+  // Rendered width of the card images, picks the variant from srcset
+  IMAGE_DISPLAY_SIZE: "64px",
+  LIVE_UPDATES: {
+    RETRY_DELAY: 1000,
+    MAX_RETRY_DELAY: 30000,
+  },
 };
 
 // Global state
@@ -32,6 +38,10 @@ let comments = "";
 let isConfirmed = false;
 let saveTimeout = null;
 let roomId = null;
+// Last draft acknowledged by the server, autosave only sends the difference
+let savedRanking = {};
+let savedComments = "";
+let revision = 0;
 
 // Page initialization
 document.addEventListener("DOMContentLoaded", () => {
@@ -60,24 +70,24 @@ async function initializeRoomDetail() {
     // Show skeleton loaders
     showObjectsSkeletonLoader();
 
-    // Load room details in parallel with participant status
-    const [room, participantData] = await Promise.all([
-      fetchRoomDetails(roomId),
-      fetchParticipantStatus(roomId),
-    ]);
+    // Load the room, its objects and our participant state in one request
+    const { room, objects: objectsData, participant } =
+      await fetchRoomBootstrap(roomId);
 
     // Update page with room details
     updatePageTitle(room.name);
 
     // Initialize state from participant data
-    initializeUserState(participantData);
+    initializeUserState(participant);
 
-    // Load objects and render them
-    const objectsData = await fetchRoomObjects(roomId);
+    // Render the objects
     renderObjects(objectsData);
 
     // Set up event listeners
     setupEventListeners();
+
+    // Voting progress is pushed by the server from now on
+    followRoomUpdates(roomId);
   } catch (error) {
     hideLoadingIndicators();
     displayError(`Error: ${error.message}`);
@@ -85,6 +95,72 @@ async function initializeRoomDetail() {
   }
 }
 
+/**
+ * Card image: resized AVIF/WebP/JPEG variants when the server has them,
+ * otherwise the original upload. Loaded lazily either way.
+ * @param {Object} object - Voting object
+ * @returns {string} HTML
+ */
+function objectImageHtml(object) {
+  const className = "w-16 h-16 object-cover rounded-lg";
+  const size = CONFIG.IMAGE_DISPLAY_SIZE;
+  if (!object.image) {
+    return `<img src="${object.image_url}" alt="" class="${className}" loading="lazy" decoding="async">`;
+  }
+  const { src, srcset, sources, width, height } = object.image;
+  const sourceTags = sources
+    .map((source) => `<source type="${source.type}" srcset="${source.srcset}" sizes="${size}">`)
+    .join("");
+  return `
+    <picture>
+      ${sourceTags}
+      <img src="${src}" srcset="${srcset}" sizes="${size}" width="${width}" height="${height}"
+        alt="" class="${className}" loading="lazy" decoding="async">
+    </picture>
+  `;
+}
+
+// ===== Live Updates =====
+
+/**
+ * Follows the room's live updates over a WebSocket, reconnecting with
+ * exponential backoff when the connection drops
+ * @param {string} roomId - Room ID
+ * @param {number} attempt - Reconnection attempts so far
+ */
+function followRoomUpdates(roomId, attempt = 0) {
+  const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+  const url = `${scheme}://${window.location.host}${CONFIG.ENDPOINTS.ROOM_UPDATES(roomId)}`;
+  // Browsers can't send headers with a WebSocket, the token goes as subprotocol
+  const socket = new WebSocket(url, ["token", localStorage.getItem("token")]);
+
+  socket.addEventListener("open", () => {
+    attempt = 0;
+  });
+  socket.addEventListener("message", (event) => {
+    const update = JSON.parse(event.data);
+    if (update.type === "room.update") {
+      updateVotingProgress(update);
+    }
+  });
+  socket.addEventListener("close", () => {
+    const { RETRY_DELAY, MAX_RETRY_DELAY } = CONFIG.LIVE_UPDATES;
+    const delay = Math.min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** attempt);
+    setTimeout(() => followRoomUpdates(roomId, attempt + 1), delay);
+  });
+}
+
+/**
+ * Shows how many participants have confirmed their vote
+ * @param {Object} update - Room update pushed by the server
+ */
+function updateVotingProgress(update) {
+  const progress = document.getElementById("votingProgress");
+  if (!progress) return;
+  progress.textContent = `Проголосовали: ${update.confirmed} из ${update.participants}`;
+  progress.classList.remove("hidden");
+}
+
 // ===== Authentication Functions =====
 
 /**
@@ -112,64 +188,21 @@ function extractRoomIdFromUrl() {
 // ===== API Functions =====
 
 /**
- * Fetches room details from the API
- * @param {string} roomId - ID of the room
- * @returns {Promise<Object>} Room data
- */
-async function fetchRoomDetails(roomId) {
-  try {
-    const token = verifyAuthentication();
-    const response = await fetch(CONFIG.ENDPOINTS.ROOMS(roomId), {
-      headers: { Authorization: `Token ${token}` },
-    });
-
-    return await handleApiResponse(response);
-  } catch (error) {
-    console.error("Error fetching room details:", error);
-    throw new Error(`Failed to load room details: ${error.message}`);
-  }
-}
-
-/**
- * Fetches participant status for the current user in this room
+ * Fetches everything the page needs to open a room
  * @param {string} roomId - ID of the room
- * @returns {Promise<Object>} Participant data
+ * @returns {Promise<Object>} Room, objects and participant data
  */
-async function fetchParticipantStatus(roomId) {
+async function fetchRoomBootstrap(roomId) {
   try {
     const token = verifyAuthentication();
-    const response = await fetch(CONFIG.ENDPOINTS.PARTICIPANT_STATUS(roomId), {
-      headers: { Authorization: `Token ${token}` },
-    });
-
-    if (!response.ok) {
-      // Not an error if participant status doesn't exist yet
-      return {};
-    }
-
-    return await response.json();
-  } catch (error) {
-    console.error("Error fetching participant status:", error);
-    return {}; // Continue anyway with empty data
-  }
-}
-
-/**
- * Fetches objects in the room that can be ranked
- * @param {string} roomId - ID of the room
- * @returns {Promise<Array>} Array of objects
- */
-async function fetchRoomObjects(roomId) {
-  try {
-    const token = verifyAuthentication();
-    const response = await fetch(CONFIG.ENDPOINTS.OBJECTS(roomId), {
+    const response = await fetch(CONFIG.ENDPOINTS.BOOTSTRAP(roomId), {
       headers: { Authorization: `Token ${token}` },
     });
 
     return await handleApiResponse(response);
   } catch (error) {
-    console.error("Error fetching room objects:", error);
-    throw new Error(`Failed to load voting objects: ${error.message}`);
+    console.error("Error fetching room:", error);
+    throw new Error(`Failed to load room: ${error.message}`);
   }
 }
 
@@ -179,28 +212,16 @@ async function fetchRoomObjects(roomId) {
  * @returns {Promise<boolean>} Whether save was successful
  */
 async function saveRanking(shouldShowIndicator = true) {
+  // Drafts are saved as deltas, only the confirmation sends the full ranking
+  if (!isConfirmed) return saveDraft(shouldShowIndicator);
+
   // Clear any pending save
   if (saveTimeout) clearTimeout(saveTimeout);
 
   try {
-    const token = verifyAuthentication();
-    const csrfToken = document.querySelector(
-      "[name=csrfmiddlewaretoken]",
-    )?.value;
-
-    const headers = {
-      Authorization: `Token ${token}`,
-      "Content-Type": "application/json",
-    };
-
-    // Add CSRF token if available
-    if (csrfToken) {
-      headers["X-CSRFToken"] = csrfToken;
-    }
-
     const response = await fetch(CONFIG.ENDPOINTS.UPDATE_RANKING(roomId), {
       method: "POST",
-      headers: headers,
+      headers: buildHeaders(),
       body: JSON.stringify({
         vote_data: userRanking,
         comments: comments,
@@ -208,7 +229,8 @@ async function saveRanking(shouldShowIndicator = true) {
       }),
     });
 
-    await handleApiResponse(response);
+    const data = await handleApiResponse(response);
+    revision = data.revision;
 
     if (shouldShowIndicator) {
       showAutosaveIndicator();
@@ -229,6 +251,104 @@ async function saveRanking(shouldShowIndicator = true) {
   }
 }
 
+/**
+ * Saves the changes since the last acknowledged draft
+ * @param {boolean} shouldShowIndicator - Whether to show save indicator
+ * @returns {Promise<boolean>} Whether save was successful
+ */
+async function saveDraft(shouldShowIndicator = true) {
+  // Clear any pending save
+  if (saveTimeout) clearTimeout(saveTimeout);
+
+  try {
+    let data = await patchRanking();
+    if (data.conflict) {
+      // Saved from another tab: rebase our changes on the server draft once
+      savedRanking = data.vote_data;
+      savedComments = data.comments;
+      revision = data.revision;
+      data = await patchRanking();
+      if (data.conflict) throw new Error(data.error);
+    }
+
+    if (shouldShowIndicator && data.changed) {
+      showAutosaveIndicator();
+    }
+    return true;
+  } catch (error) {
+    console.error("Error saving ranking:", error);
+    if (shouldShowIndicator) {
+      showToast(`Failed to save changes: ${error.message}`, "error");
+    }
+    return false;
+  }
+}
+
+/**
+ * Sends the ranking delta against the last acknowledged draft
+ * @returns {Promise<Object>} Server response, with `conflict` set on 409
+ */
+async function patchRanking() {
+  const sentRanking = { ...userRanking };
+  const sentComments = comments;
+  const body = { revision, moves: rankingDelta(savedRanking, sentRanking) };
+  if (sentComments !== savedComments) {
+    body.comments = sentComments;
+  }
+
+  const response = await fetch(CONFIG.ENDPOINTS.PATCH_RANKING(roomId), {
+    method: "PATCH",
+    headers: buildHeaders(),
+    body: JSON.stringify(body),
+  });
+  if (response.status === 409) {
+    return { conflict: true, ...(await response.json()) };
+  }
+
+  const data = await handleApiResponse(response);
+  revision = data.revision;
+  savedRanking = sentRanking;
+  savedComments = sentComments;
+  return data;
+}
+
+/**
+ * Builds the moves that turn one ranking into another
+ * @param {Object} oldRanking - Ranking the server has
+ * @param {Object} newRanking - Current ranking
+ * @returns {Object} New position per moved object, null for unranked ones
+ */
+function rankingDelta(oldRanking, newRanking) {
+  const moves = {};
+  for (const [objectId, position] of Object.entries(newRanking)) {
+    if (oldRanking[objectId] !== position) moves[objectId] = position;
+  }
+  for (const objectId of Object.keys(oldRanking)) {
+    if (!(objectId in newRanking)) moves[objectId] = null;
+  }
+  return moves;
+}
+
+/**
+ * Builds the headers for authenticated JSON requests
+ * @returns {Object} Request headers
+ */
+function buildHeaders() {
+  const token = verifyAuthentication();
+  const csrfToken = document.querySelector("[name=csrfmiddlewaretoken]")?.value;
+
+  const headers = {
+    Authorization: `Token ${token}`,
+    "Content-Type": "application/json",
+  };
+
+  // Add CSRF token if available
+  if (csrfToken) {
+    headers["X-CSRFToken"] = csrfToken;
+  }
+  return headers;
+}
+
 /**
  * Handles API responses consistently
  * @param {Response} response - Fetch API response
@@ -275,12 +395,15 @@ function updatePageTitle(roomName) {
 
 /**
  * Initializes user state from participant data
- * @param {Object} participantData - Data from the participant status API
+ * @param {Object} participantData - Participant data from the bootstrap API
  */
 function initializeUserState(participantData) {
   userRanking = participantData.vote_data || {};
   comments = participantData.comments || "";
   isConfirmed = participantData.vote_confirmed || false;
+  savedRanking = { ...userRanking };
+  savedComments = comments;
+  revision = participantData.revision || 0;
 
   // Update UI with saved comments
   document.getElementById("commentsInput").value = comments;
@@ -354,10 +477,10 @@ function renderObjectCard(object, position) {
   objectCard.setAttribute("tabindex", "0");
 
   let imageHtml = "";
-  if (object.image_url) {
+  if (object.image || object.image_url) {
     imageHtml = `
             <div class="flex-shrink-0 mr-4">
-                <img src="${object.image_url}" alt="" class="w-16 h-16 object-cover rounded-lg">
+                ${objectImageHtml(object)}
             </div>
         `;
   }
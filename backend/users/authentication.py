@@ -1,13 +1,22 @@
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
 
+from .token_cache import token_cache
+
 
 class UUIDTokenAuthentication(TokenAuthentication):
     keyword = "Token"
     model = Token  # Explicitly set the model
 
     def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
         try:
             token = self.model.objects.select_related("user").get(key=key)
         except self.model.DoesNotExist:
@@ -16,4 +25,58 @@ class UUIDTokenAuthentication(TokenAuthentication):
         if not token.user.is_active:
             raise AuthenticationFailed("User inactive or deleted")
 
+        token_cache.set(key, (token.user, token))
         return (token.user, token)
+
+
+def websocket_token(scope):
+    """
+    The token a WebSocket handshake carries, if any.
+
+    Browsers can't set headers on WebSockets, so the page sends the token as
+    the subprotocol pair ``["token", <key>]`` rather than in the URL, where it
+    would end up in access logs. Other clients may use the usual
+    ``Authorization: Token <key>`` header.
+    """
+    subprotocols = scope.get("subprotocols", [])
+    if "token" in subprotocols[:-1]:
+        return subprotocols[subprotocols.index("token") + 1]
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            keyword, _, key = value.decode("latin1").partition(" ")
+            if keyword == UUIDTokenAuthentication.keyword and key:
+                return key
+    return None
+
+
+def event_stream_token(request):
+    """
+    The token of a Server-Sent Events request, if any.
+
+    ``EventSource`` can't set headers either, so browsers pass the token as the
+    ``token`` query parameter; nginx keeps that route out of its access log.
+    """
+    keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+    if keyword == UUIDTokenAuthentication.keyword and key:
+        return key
+    return request.GET.get("token")
+
+
+@database_sync_to_async
+def token_user(key):
+    """The active user owning ``key``, or an anonymous user."""
+    try:
+        user, _ = UUIDTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return AnonymousUser()
+    return user
+
+
+class WebSocketTokenAuthMiddleware(BaseMiddleware):
+    """Channels middleware setting ``scope["user"]`` from the handshake token."""
+
+    async def __call__(self, scope, receive, send):
+        key = websocket_token(scope)
+        if key is not None:
+            scope = dict(scope, user=await token_user(key))
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_customuser_user_id'),
+        ('voting', '0014_unconstrained_room_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='vote_rooms',
+            field=models.ManyToManyField(blank=True, db_constraint=False, to='voting.votingroom'),
+        ),
+    ]
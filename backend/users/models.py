@@ -3,25 +3,52 @@ from __future__ import annotations
 import random
 import string
 import uuid
+from typing import List, Set
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 USER_ID_LENGTH = 6
+USER_ID_ALPHABET = string.ascii_uppercase + string.digits  # A-Z and 0-9
+
+# User IDs are login codes: draw them from the OS generator
+_random = random.SystemRandom()
+
+
+def random_user_id() -> str:
+    return "".join(_random.choices(USER_ID_ALPHABET, k=USER_ID_LENGTH))
+
+
+def generate_user_ids(count: int, taken: Set[str]) -> List[str]:
+    """
+    ``count`` new unique user IDs, checked against the IDs in ``taken`` without
+    querying and added to it. Raises ``ValueError`` when they can't all fit.
+    """
+    if len(taken) + count > len(USER_ID_ALPHABET) ** USER_ID_LENGTH:
+        raise ValueError(f"No room left for {count} more user IDs")
+    user_ids = []
+    while len(user_ids) < count:
+        uid = random_user_id()
+        if uid not in taken:
+            taken.add(uid)
+            user_ids.append(uid)
+    return user_ids
 
 
 class CustomUser(AbstractUser):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    vote_rooms = models.ManyToManyField("voting.VotingRoom", blank=True)
+    # Rooms may live in shard databases, see voting.sharding
+    vote_rooms = models.ManyToManyField(
+        "voting.VotingRoom", blank=True, db_constraint=False
+    )
     user_id = models.CharField(
         max_length=USER_ID_LENGTH, unique=True, blank=True, null=True
     )
 
     def generate_user_id(self):
         """Generate a unique user ID consisting of only letters and numbers."""
-        characters = string.ascii_uppercase + string.digits  # A-Z and 0-9
         while True:
-            uid = "".join(random.choices(characters, k=USER_ID_LENGTH))
+            uid = random_user_id()
             if not CustomUser.objects.filter(user_id=uid).exists():
                 return uid
 
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import CustomUser
+from .token_cache import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_user_tokens(sender, instance, **kwargs):
+    """
+    Cached lookups carry a copy of the user: drop them on every save, so that
+    clearing ``is_active`` (or ``is_staff``) takes effect.
+    """
+    for key in Token.objects.filter(user_id=instance.pk).values_list(
+        "key", flat=True
+    ):
+        token_cache.invalidate(key)
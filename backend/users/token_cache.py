@@ -0,0 +1,189 @@
+"""
+Cache of the token -> user lookups of
+:class:`users.authentication.UUIDTokenAuthentication`.
+
+Every API call authenticates its token, which costs a query joining the token
+and its user. Each process keeps a bounded LRU of recent lookups with a short
+TTL, in front of a shared Django cache (``AUTH_TOKEN_SHARED_CACHE``, the
+``auth_tokens`` alias by default) so that a lookup made by one worker serves
+the others. The shared tier only holds the token's user ID and creation time
+and the user fields of :data:`SHARED_USER_FIELDS`: never the password hash.
+Other user fields are loaded from the database if a request reads them.
+
+Deleting a token and saving a user (e.g. clearing ``is_active``) invalidate
+the entry through :mod:`users.signals`: in the shared cache and in the
+process that made the change. Other processes notice at the latest after
+``AUTH_TOKEN_CACHE_TTL`` seconds, the bound on how long a deactivated user
+or deleted token may still authenticate. ``QuerySet.update()`` bypasses the
+signals and relies on the TTL alone.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULT_SIZE = 10_000
+DEFAULT_TTL = 60  # seconds
+
+# What requests read of request.user; the rest is deferred
+SHARED_USER_FIELDS = (
+    "id",
+    "username",
+    "user_id",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+Credentials = Tuple[object, object]  # (user, token)
+
+
+def _shared_key(key: str) -> str:
+    # Keep raw tokens out of cache keys (and cache file names)
+    return "auth:token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _from_db(model, values: Dict):
+    """An instance of ``model`` as loaded with ``values``, other fields deferred."""
+    fields = model._meta.concrete_fields
+    names = [field.attname for field in fields if field.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def _project(credentials: Credentials) -> Dict:
+    user, token = credentials
+    return {
+        "user": {name: getattr(user, name) for name in SHARED_USER_FIELDS},
+        "token": {"user_id": token.user_id, "created": token.created},
+    }
+
+
+def _restore(key: str, entry: Dict) -> Credentials:
+    from rest_framework.authtoken.models import Token
+
+    user = _from_db(get_user_model(), entry["user"])
+    token = _from_db(Token, {"key": key, **entry["token"]})
+    token.user = user
+    return user, token
+
+
+class TokenCache:
+    """Per-process LRU with a TTL, backed by an optional shared cache."""
+
+    def __init__(self):
+        self._entries: OrderedDict[str, Tuple[float, Credentials]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def maxsize(self) -> int:
+        return getattr(settings, "AUTH_TOKEN_CACHE_SIZE", DEFAULT_SIZE)
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, "AUTH_TOKEN_CACHE_TTL", DEFAULT_TTL)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, "AUTH_TOKEN_SHARED_CACHE", None)
+        return caches[alias] if alias else None
+
+    def get(self, key: str) -> Optional[Credentials]:
+        """Copies of the cached user and token, so requests can't alter them."""
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+                self.expired += 1
+
+        shared = self.shared
+        entry = shared.get(_shared_key(key)) if shared is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        credentials = _restore(key, entry)
+        with self._lock:
+            self._store(key, credentials, now)
+        return self._copy(credentials)
+
+    def set(self, key: str, credentials: Credentials) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._store(key, credentials, time.monotonic())
+        shared = self.shared
+        if shared is not None:
+            shared.set(_shared_key(key), _project(credentials), timeout=self.ttl)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(_shared_key(key))
+
+    def clear(self) -> None:
+        """Empty this process's entries (the shared cache is left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self) -> None:
+        self.hits = self.shared_hits = self.misses = 0
+        self.expired = self.evictions = 0
+
+    def stats(self) -> Dict[str, float]:
+        """This process's counters; ``hit_rate`` counts hits of both tiers."""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": (
+                    (self.hits + self.shared_hits) / lookups if lookups else 0.0
+                ),
+            }
+
+    def _store(self, key: str, credentials: Credentials, now: float) -> None:
+        self._entries[key] = (now + self.ttl, credentials)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _copy(credentials: Credentials) -> Credentials:
+        user, token = credentials
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+
+token_cache = TokenCache()
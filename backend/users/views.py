@@ -3,11 +3,12 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from users.models import CustomUser  # Add this import
+from users.token_cache import token_cache
 
 
 def login_view(request):
@@ -43,3 +44,12 @@ class UUIDLoginView(APIView):
             return Response(
                 {"error": "Invalid user ID"}, status=status.HTTP_401_UNAUTHORIZED
             )
+
+
+class TokenCacheStatsView(APIView):
+    """Hit rate of the token cache, as seen by the process serving the request."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats())
@@ -1,10 +1,85 @@
+from typing import Optional
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import QueryDict
+from django.shortcuts import get_object_or_404, render
+from django.urls import path, reverse
+from django.utils.html import format_html
+from users.models import CustomUser
 
-from voting.service import calculate_room_ranking
+from voting.analysis import cached_ballot_influence
+from voting.jobs import enqueue_ranking
+from voting.sharding import room_databases, shard_for_room, sharding_enabled
 
 from .models import *
 
 
+class RoomDatabaseFilter(admin.SimpleListFilter):
+    """With sharding, the changelists of room rows show one database at a time."""
+
+    title = "database"
+    parameter_name = "db"
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in room_databases()]
+
+    def value(self):
+        return super().value() or room_databases()[0]
+
+    def queryset(self, request, queryset):
+        # RoomDatabaseAdminMixin.get_queryset already picked the database
+        return queryset
+
+    def choices(self, changelist):
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == alias,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: alias}
+                ),
+                "display": title,
+            }
+
+
+def _selected_database(request) -> Optional[str]:
+    """The database picked in the changelist, also on the pages linked from it."""
+    name = RoomDatabaseFilter.parameter_name
+    alias = request.GET.get(name)
+    if alias is None:
+        alias = QueryDict(request.GET.get("_changelist_filters", "")).get(name)
+    return alias if alias in room_databases() else None
+
+
+class RoomListFilter(admin.RelatedFieldListFilter):
+    """The rooms of the selected database (the default lists ``default``'s)."""
+
+    def field_choices(self, field, request, model_admin):
+        rooms = VotingRoom.objects.using(model_admin.room_database(request))
+        return [(room.pk, str(room)) for room in rooms.order_by("name")]
+
+
+class RoomDatabaseAdminMixin:
+    """Read and write room-scoped rows in their room database, see voting.sharding."""
+
+    def room_database(self, request) -> str:
+        return _selected_database(request) or room_databases()[0]
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding_enabled():
+            return (RoomDatabaseFilter, *list_filter)
+        return list_filter
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(self.room_database(request))
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.related_model is VotingRoom:
+            kwargs["using"] = self.room_database(request)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 class VotingObjectInline(admin.TabularInline):
     model = VotingObject
     extra = 1
@@ -19,36 +94,125 @@ class RoomParticipantInline(admin.TabularInline):
 
 
 @admin.register(VotingRoom)
-class VotingRoomAdmin(admin.ModelAdmin):
+class VotingRoomAdmin(RoomDatabaseAdminMixin, admin.ModelAdmin):
     inlines = [VotingObjectInline, RoomParticipantInline]
     # inlines = [VotingObjectInline]
-    list_display = ("name", "created_at", "is_active")
-    list_filter = ("is_active", "created_at")
+    list_display = (
+        "name",
+        "created_at",
+        "is_active",
+        "ranking_method",
+        "influence",
+    )
+    list_filter = ("is_active", "created_at", "ranking_method")
     actions = ["calculate_grades"]
     # Remove filter_horizontal for participants since we're using through model
     # filter_horizontal = ('participants',)  # Remove this line
     #
 
+    def room_database(self, request) -> str:
+        # Change pages linked from elsewhere only know the room
+        object_id = getattr(request.resolver_match, "kwargs", {}).get("object_id")
+        if _selected_database(request) is None and object_id:
+            try:
+                return shard_for_room(object_id)
+            except ValueError:
+                pass
+        return super().room_database(request)
+
+    def get_urls(self):
+        return [
+            path(
+                "<uuid:room_id>/influence/",
+                self.admin_site.admin_view(self.influence_view),
+                name="voting_votingroom_influence",
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="Ballot influence")
+    def influence(self, obj):
+        url = reverse("admin:voting_votingroom_influence", args=[obj.pk])
+        return format_html('<a href="{}">Influence</a>', url)
+
+    def influence_view(self, request, room_id):
+        room = get_object_or_404(VotingRoom, pk=room_id)
+        if not self.has_view_permission(request, room):
+            raise PermissionDenied
+        report = cached_ballot_influence(room, room.ballot_revision)
+        if report is None:
+            # Computed by the ranking worker, the page asks to reload
+            enqueue_ranking(room, influence=True)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": room,
+            "title": f"Ballot influence: {room.name}",
+            "report": report,
+        }
+        return render(
+            request,
+            "admin/voting/votingroom/influence.html",
+            context,
+            status=202 if report is None else 200,
+        )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and "ranking_method" in form.changed_data:
+            enqueue_ranking(obj, full_rebuild=True)
+
     def calculate_grades(self, request, queryset):
-        for room in queryset:
-            calculate_room_ranking(room)
+        # Handed off to the ranking worker / recalculate_rankings command
+        for room_id in queryset.values_list("id", flat=True):
+            enqueue_ranking(room_id, full_rebuild=True)
         self.message_user(request, "Grades calculation initiated")
 
 
 @admin.register(VotingObject)
-class VotingObjectAdmin(admin.ModelAdmin):
+class VotingObjectAdmin(RoomDatabaseAdminMixin, admin.ModelAdmin):
     list_display = ("title", "room", "created_at")
-    list_filter = ("room",)
+    list_filter = (("room", RoomListFilter),)
 
 
 @admin.register(RoomParticipant)
-class RoomParticipantAdmin(admin.ModelAdmin):
+class RoomParticipantAdmin(RoomDatabaseAdminMixin, admin.ModelAdmin):
     # list_display = ("user", "room", "has_voted", "vote_confirmed")
     list_display = ("user", "room", "vote_confirmed")
-    list_filter = ("room", "vote_confirmed")
+    list_filter = (("room", RoomListFilter), "vote_confirmed")
     readonly_fields = ("vote_data",)
     search_fields = ("user__username", "room__name")
 
+    def get_list_select_related(self, request):
+        # Users stay in default: a join from a shard database finds none
+        if sharding_enabled():
+            return ("room",)
+        return super().get_list_select_related(request)
+
+    def get_search_fields(self, request):
+        return ("room__name",) if sharding_enabled() else self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        results, duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if sharding_enabled() and search_term:
+            users = CustomUser.objects.filter(username__icontains=search_term)
+            results |= queryset.filter(
+                user_id__in=list(users.values_list("pk", flat=True))
+            )
+        return results, duplicates
+
+
+@admin.register(RankingJob)
+class RankingJobAdmin(admin.ModelAdmin):
+    list_display = ("room", "status", "requested_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = ("requested", "processed", "error")
+
+    def get_list_select_related(self, request):
+        # Jobs stay in default, their rooms may not
+        return () if sharding_enabled() else super().get_list_select_related(request)
+
 
 @admin.register(NickName)
 class NickNameAdmin(admin.ModelAdmin):
@@ -0,0 +1,215 @@
+"""
+Inter-voter agreement: voter x voter rank correlation matrices for a room.
+
+Both coefficients are computed over the objects the two voters both ranked, so
+incomplete ballots are compared on what they have in common, re-ranked within
+that subset. Pairs sharing fewer than two objects have no defined correlation
+and get NaN.
+"""
+
+from __future__ import annotations
+
+import csv
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from django.core.cache import cache
+
+from voting.analysis import dense_ballots
+from voting.service import RESULTS_CACHE_TIMEOUT, get_room_objects
+
+# Upper bound on voters x object pairs held at once while counting concordant
+# and discordant pairs for Kendall's tau
+KENDALL_BLOCK_CELLS = 1 << 23
+
+AGREEMENT_METHODS = ("spearman", "kendall")
+
+
+class Agreement(NamedTuple):
+    participant_ids: List[int]
+    voters: List[str]
+    spearman: np.ndarray
+    kendall: np.ndarray
+
+
+def position_matrix(ballots: List[np.ndarray], n_objects: int) -> np.ndarray:
+    """Voters x objects matrix of 1-based positions, NaN where not ranked."""
+    positions = np.full((len(ballots), n_objects), np.nan)
+    for voter, rows in enumerate(ballots):
+        positions[voter, rows] = np.arange(1, len(rows) + 1)
+    return positions
+
+
+def spearman_matrix(positions: np.ndarray) -> np.ndarray:
+    """
+    Pairwise-complete Spearman correlation between every two voters.
+
+    For each pair, the objects both voters ranked are re-ranked 1..k within
+    that common subset, so objects only one of them ranked don't open gaps in
+    the other's ranks. Between voters who ranked the same objects that changes
+    nothing: their correlation is the Pearson correlation of the positions,
+    computed for all pairs at once from masked matrix products of the
+    positions, their squares and the "ranked" mask. The rows of the voters
+    outside the largest such group, usually the few who voted before objects
+    were added, are then redone by :func:`_reranked_spearman_rows`.
+    """
+    mask = ~np.isnan(positions)
+    m = mask.astype(np.float64)
+    x = np.where(mask, positions, 0.0)
+    common = m @ m.T
+    sum_a = x @ m.T
+    sum_b = sum_a.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = x @ x.T - sum_a * sum_b / common
+        var_a = (x * x) @ m.T - sum_a * sum_a / common
+        var_b = var_a.T
+        rho = cov / np.sqrt(var_a * var_b)
+
+    if len(mask):
+        _, group, sizes = np.unique(
+            mask, axis=0, return_inverse=True, return_counts=True
+        )
+        others = np.flatnonzero(group.ravel() != sizes.argmax())
+        if len(others):
+            rows = _reranked_spearman_rows(positions, others)
+            rho[others] = rows
+            rho[:, others] = rows.T
+    rho[(common < 2) | ~np.isfinite(rho)] = np.nan
+    return np.clip(rho, -1.0, 1.0)
+
+
+def _reranked_spearman_rows(positions: np.ndarray, voters: np.ndarray) -> np.ndarray:
+    """
+    Spearman correlation of ``voters`` with every voter, re-ranking each pair's
+    common objects.
+
+    Ballots have no ties, so ``rho = 1 - 6 * sum(d^2) / (k * (k^2 - 1))``,
+    where ``sum(d^2)`` only depends on the sum of the products of the two
+    re-ranks. Those are cumulative sums of the "ranked" masks along the ballot
+    orders, O(voters x objects) per row.
+    """
+    n_voters, n = positions.shape
+    mask = ~np.isnan(positions)
+    m = mask.astype(np.float64)
+    # Every voter's objects from best to worst, unranked ones last
+    order = np.argsort(np.where(mask, positions, np.inf), axis=1, kind="stable")
+    ranked_in_order = np.take_along_axis(m, order, axis=1)
+
+    rows = np.empty((len(voters), n_voters))
+    own_ranks = np.empty((n_voters, n))
+    for index, voter in enumerate(voters):
+        # [b, j]: whether the j-th object of voter b was ranked by both
+        both = ranked_in_order * m[voter][order]
+        # Places of that object among the common ones, by b and by this voter
+        other = np.cumsum(both, axis=1)
+        own = order[voter]
+        own_ranks[:, own] = np.cumsum(m[:, own] * m[voter, own], axis=1)
+        own = np.take_along_axis(own_ranks, order, axis=1)
+
+        k = both.sum(axis=1)
+        products = (own * other * both).sum(axis=1)
+        squared_differences = k * (k + 1) * (2 * k + 1) / 3 - 2 * products
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rows[index] = 1 - 6 * squared_differences / (k * (k * k - 1))
+    return rows
+
+
+def kendall_matrix(positions: np.ndarray) -> np.ndarray:
+    """
+    Pairwise-complete Kendall tau between every two voters.
+
+    Every voter's object pairs are encoded as +1/-1 (which of the two they
+    ranked higher, 0 when either is unranked), so concordant minus discordant
+    pairs for all voter pairs is one matrix product. The object pairs are
+    processed in blocks of rows to bound memory.
+    """
+    voters, n = positions.shape
+    mask = ~np.isnan(positions)
+    m = mask.astype(np.float64)
+    common = m @ m.T
+    filled = np.where(mask, positions, 0.0).astype(np.float32)
+
+    score = np.zeros((voters, voters), dtype=np.float64)
+    block = max(1, KENDALL_BLOCK_CELLS // max(voters * n, 1))
+    for start in range(0, n, block):
+        rows = slice(start, min(start + block, n))
+        signs = np.sign(filled[:, rows, None] - filled[:, None, :])
+        signs *= mask[:, rows, None] & mask[:, None, :]
+        # Only count each unordered object pair once
+        signs *= np.arange(rows.start, rows.stop)[:, None] < np.arange(n)[None, :]
+        flat = signs.reshape(voters, -1)
+        score += flat @ flat.T
+
+    pairs = common * (common - 1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau = score / pairs
+    tau[pairs < 1] = np.nan
+    return tau
+
+
+def room_agreement(room) -> Agreement:
+    """Both agreement matrices for the room's confirmed ballots."""
+    _, slot_by_object_id = get_room_objects(room)
+    object_id_by_row, ballots = dense_ballots(room, slot_by_object_id)
+    positions = position_matrix(
+        [rows for _, _, rows in ballots], len(object_id_by_row)
+    )
+    return Agreement(
+        participant_ids=[participant_id for participant_id, _, _ in ballots],
+        voters=[username for _, username, _ in ballots],
+        spearman=spearman_matrix(positions),
+        kendall=kendall_matrix(positions),
+    )
+
+
+def get_room_agreement(room, revision: int) -> Agreement:
+    """:func:`room_agreement` cached per ballot revision."""
+    key = f"voting:agreement:{room.pk}:{revision}"
+    agreement = cache.get(key)
+    if agreement is None:
+        agreement = room_agreement(room)
+        cache.set(key, agreement, RESULTS_CACHE_TIMEOUT)
+    return agreement
+
+
+def _rounded(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    return [
+        [None if np.isnan(value) else round(float(value), 4) for value in row]
+        for row in matrix
+    ]
+
+
+def agreement_report(agreement: Agreement, method: str) -> Dict[str, object]:
+    """
+    JSON-friendly view of one matrix, with every voter's mean agreement with
+    the others so outliers stand out.
+    """
+    matrix = getattr(agreement, method)
+    others = matrix.copy()
+    np.fill_diagonal(others, np.nan)
+    counts = (~np.isnan(others)).sum(axis=1)
+    means = np.nansum(others, axis=1) / np.maximum(counts, 1)
+    means[counts == 0] = np.nan
+    return {
+        "method": method,
+        "voters": [
+            {
+                "participant_id": participant_id,
+                "user": username,
+                "mean_agreement": None if np.isnan(mean) else round(float(mean), 4),
+            }
+            for participant_id, username, mean in zip(
+                agreement.participant_ids, agreement.voters, means
+            )
+        ],
+        "matrix": _rounded(matrix),
+    }
+
+
+def write_agreement_csv(agreement: Agreement, method: str, stream) -> None:
+    """Write one matrix as CSV, with voter names as the header row and column."""
+    writer = csv.writer(stream)
+    writer.writerow(["user", *agreement.voters])
+    matrix = _rounded(getattr(agreement, method))
+    for username, row in zip(agreement.voters, matrix):
+        writer.writerow([username, *("" if value is None else value for value in row)])
@@ -0,0 +1,436 @@
+"""
+Ballot-level analysis of room rankings.
+
+These are read-only reports for organizers: nothing here touches the stored
+results or the ranking aggregate.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from voting.codecs import BALLOT_DTYPE, decode_ballot
+from voting.engines import (
+    POSITION_DTYPE,
+    BallotMatrices,
+    build_matrices,
+    get_ranking_method,
+)
+from voting.service import (
+    BALLOT_CHUNK_SIZE,
+    RESULTS_CACHE_TIMEOUT,
+    SKATING,
+    ballot_from_vote_data,
+    get_room_objects,
+)
+
+# Stays under SQLite's bound parameter limit
+USERNAME_CHUNK_SIZE = 900
+
+
+def iter_participant_ballots(
+    room, slot_by_object_id: Dict[str, int]
+) -> Iterator[Tuple[int, str, np.ndarray]]:
+    """
+    Like :func:`voting.service.iter_confirmed_ballots`, but yield
+    ``(participant_id, user_id, slots)`` so each ballot can be attributed.
+    """
+    from voting.models import RoomParticipant
+
+    confirmed = RoomParticipant.objects.filter(room=room, vote_confirmed=True)
+    for participant_id, user_id, packed in (
+        confirmed.filter(ballot__isnull=False)
+        .order_by("id")
+        .values_list("id", "user_id", "ballot")
+        .iterator(chunk_size=BALLOT_CHUNK_SIZE)
+    ):
+        yield participant_id, user_id, decode_ballot(packed)
+
+    for participant_id, user_id, vote_data in (
+        confirmed.filter(ballot__isnull=True)
+        .order_by("id")
+        .values_list("id", "user_id", "vote_data")
+        .iterator(chunk_size=BALLOT_CHUNK_SIZE)
+    ):
+        if vote_data:
+            yield participant_id, user_id, np.asarray(
+                [
+                    slot_by_object_id[obj_id]
+                    for obj_id in ballot_from_vote_data(vote_data)
+                    if obj_id in slot_by_object_id
+                ],
+                dtype=BALLOT_DTYPE,
+            )
+
+
+def dense_ballots(
+    room, slot_by_object_id: Dict[str, int]
+) -> Tuple[List[str], List[Tuple[int, str, np.ndarray]]]:
+    """
+    Return the room's object IDs in slot order and its confirmed ballots as
+    ``(participant_id, username, rows)``, where ``rows`` index into that list.
+
+    Slots left behind by deleted objects are dropped, so the analysis matrices
+    only have rows for the room's current objects.
+    """
+    object_id_by_row = sorted(slot_by_object_id, key=slot_by_object_id.get)
+    present = np.asarray(
+        [slot_by_object_id[obj_id] for obj_id in object_id_by_row], dtype=np.int64
+    )
+    row_by_slot = np.full(int(present.max()) + 1 if len(present) else 0, -1)
+    row_by_slot[present] = np.arange(len(present))
+
+    ballots: List[Tuple[int, int, np.ndarray]] = []
+    for participant_id, user_id, slots in iter_participant_ballots(
+        room, slot_by_object_id
+    ):
+        slots = slots[slots < len(row_by_slot)]
+        rows = row_by_slot[slots]
+        rows = rows[rows >= 0]
+        if len(rows):
+            ballots.append((participant_id, user_id, rows))
+
+    # Looked up apart from the ballots, users stay in the default database when
+    # rooms are sharded
+    usernames = _usernames([user_id for _, user_id, _ in ballots])
+    return object_id_by_row, [
+        (participant_id, usernames.get(user_id, ""), rows)
+        for participant_id, user_id, rows in ballots
+    ]
+
+
+def _usernames(user_ids: List[int]) -> Dict[int, str]:
+    from users.models import CustomUser
+
+    usernames: Dict[int, str] = {}
+    for start in range(0, len(user_ids), USERNAME_CHUNK_SIZE):
+        usernames.update(
+            CustomUser.objects.filter(
+                pk__in=user_ids[start : start + USERNAME_CHUNK_SIZE]
+            ).values_list("id", "username")
+        )
+    return usernames
+
+
+def _places(rank, matrices: BallotMatrices) -> np.ndarray:
+    """Placement of every row, in row order."""
+    order, places = rank(matrices)
+    by_row = np.empty(len(order), dtype=np.int64)
+    by_row[order] = places
+    return by_row
+
+
+def ballot_influence(room) -> Dict[str, object]:
+    """
+    For every confirmed ballot, how the room's placements would change if that
+    ballot alone were removed.
+
+    The rank counts (and, for the pairwise methods, the preference matrix) of
+    the whole room are built once. Each ballot's own contribution is then
+    subtracted in place, the room re-ranked and the contribution added back, so
+    the cost per ballot is one ranking pass instead of a full recompute.
+    """
+    method = getattr(room, "ranking_method", SKATING)
+    rank = get_ranking_method(method)
+    object_id_to_title, slot_by_object_id = get_room_objects(room)
+
+    object_id_by_row, ballots = dense_ballots(room, slot_by_object_id)
+    n_objects = len(object_id_by_row)
+
+    matrices = build_matrices(
+        (rows for _, _, rows in ballots),
+        n_objects,
+        pairwise=method != SKATING,
+    )
+    report: Dict[str, object] = {
+        "method": method,
+        "ballot_count": matrices.ballot_count,
+        "ballots": [],
+    }
+    if not matrices.ballot_count:
+        return report
+
+    baseline = _places(rank, matrices)
+    counts, pairwise = matrices.counts, matrices.pairwise
+    unranked = np.iinfo(POSITION_DTYPE).max
+    without = BallotMatrices(counts, pairwise, matrices.ballot_count - 1)
+
+    entries = []
+    for participant_id, username, rows in ballots:
+        ranks = np.arange(len(rows))
+        counts[rows, ranks] -= 1
+        if pairwise is not None:
+            positions = np.full(n_objects, unranked, dtype=POSITION_DTYPE)
+            positions[rows] = ranks
+            delta = positions[:, None] < positions[None, :]
+            pairwise -= delta
+        try:
+            places = _places(rank, without)
+        finally:
+            counts[rows, ranks] += 1
+            if pairwise is not None:
+                pairwise += delta
+
+        shift = places - baseline
+        moved = np.flatnonzero(shift)
+        entries.append(
+            {
+                "participant_id": participant_id,
+                "user": username,
+                "moved": len(moved),
+                "max_shift": int(np.abs(shift).max()),
+                "total_shift": int(np.abs(shift).sum()),
+                "changes": [
+                    {
+                        "object_id": object_id_by_row[row],
+                        "title": object_id_to_title[object_id_by_row[row]],
+                        "place": int(baseline[row]),
+                        "place_without": int(places[row]),
+                    }
+                    for row in moved.tolist()
+                ],
+            }
+        )
+
+    entries.sort(key=lambda entry: (-entry["total_shift"], -entry["max_shift"]))
+    report["ballots"] = entries
+    return report
+
+
+def _influence_key(room, revision: int) -> str:
+    method = getattr(room, "ranking_method", SKATING)
+    return f"voting:influence:{room.pk}:{method}:{revision}"
+
+
+def get_ballot_influence(room, revision: int) -> Dict[str, object]:
+    """
+    :func:`ballot_influence` cached per ballot revision and ranking method, the
+    same way :func:`voting.service.get_room_results` caches the results.
+
+    Run by the ranking worker (see ``RankingJob.influence``): leaving out every
+    ballot in turn takes seconds for a large room.
+    """
+    key = _influence_key(room, revision)
+    report = cache.get(key)
+    if report is None:
+        report = ballot_influence(room)
+        cache.set(key, report, RESULTS_CACHE_TIMEOUT)
+    return report
+
+
+def cached_ballot_influence(room, revision: int) -> Optional[Dict[str, object]]:
+    """The report :func:`get_ballot_influence` cached, or ``None``."""
+    return cache.get(_influence_key(room, revision))
+
+
+# Samples drawn per process pool task. Fixed, so that a given seed produces the
+# same intervals whatever the number of workers.
+BOOTSTRAP_TASK_SAMPLES = 250
+# Upper bound on samples x objects x ranks cells ranked in one batched pass
+BOOTSTRAP_BATCH_CELLS = 1 << 22
+
+# Per-process copy of the ballots being resampled, see _init_bootstrap_worker
+_bootstrap_ballots: Optional[Tuple[np.ndarray, Tuple[int, int]]] = None
+
+
+def pack_descending(counts: np.ndarray) -> np.ndarray:
+    """
+    Pack the columns of a non-negative count matrix into as few int64 columns
+    as possible, such that sorting rows by the packed columns in ascending
+    order sorts them by the original columns in descending order.
+
+    Fewer sort keys make the lexsort proportionally cheaper.
+    """
+    rows, width = counts.shape
+    top = int(counts.max()) if counts.size else 0
+    bits = max(top.bit_length(), 1)
+    per_key = max(63 // bits, 1)
+    keys = -(-width // per_key)
+
+    inverted = np.zeros((rows, keys * per_key), dtype=np.int64)
+    inverted[:, :width] = top - counts
+    inverted[:, width:] = top
+    shifts = np.arange(per_key - 1, -1, -1, dtype=np.int64) * bits
+    return (inverted.reshape(rows, keys, per_key) << shifts).sum(axis=2)
+
+
+def skating_places_batch(counts: np.ndarray) -> np.ndarray:
+    """
+    Batched :func:`voting.service.skating_placements`.
+
+    :param counts: samples x objects x ranks count matrices
+    :return: samples x objects placements
+
+    All samples are ranked with one lexsort whose primary key is the sample
+    index, so tie groups never span two samples.
+    """
+    samples, n, width = counts.shape
+    totals = counts.sum(axis=2)
+    reached = np.cumsum(counts, axis=2) >= (totals // 2 + 1)[..., None]
+    majority = np.where(reached.any(axis=2), reached.argmax(axis=2) + 1, width + 1)
+
+    keys = np.column_stack(
+        [
+            np.repeat(np.arange(samples), n),
+            majority.reshape(-1),
+            pack_descending(counts.reshape(samples * n, width)),
+        ]
+    )
+    order = np.lexsort(keys.T[::-1])
+
+    sorted_keys = keys[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    index = np.arange(len(order))
+    first = np.maximum.accumulate(np.where(starts, index, 0))
+    places = np.empty(len(order), dtype=np.int64)
+    # Rows are grouped by sample, so each sample starts at a multiple of n
+    places[order] = first - index // n * n + 1
+    return places.reshape(samples, n)
+
+
+def _init_bootstrap_worker(ballot_cells: np.ndarray, shape: Tuple[int, int]) -> None:
+    global _bootstrap_ballots
+    _bootstrap_ballots = (ballot_cells, shape)
+
+
+def _bootstrap_task(seed: np.random.SeedSequence, samples: int) -> np.ndarray:
+    """Rank ``samples`` resamples of the ballots set by _init_bootstrap_worker."""
+    ballot_cells, shape = _bootstrap_ballots
+    n_ballots = len(ballot_cells)
+    rng = np.random.default_rng(seed)
+    cells = shape[0] * shape[1]
+    batch_size = max(1, BOOTSTRAP_BATCH_CELLS // max(cells, 1))
+
+    places = []
+    for start in range(0, samples, batch_size):
+        batch = min(batch_size, samples - start)
+        counts = np.empty((batch, cells), dtype=np.int64)
+        for sample in range(batch):
+            # Draw n_ballots ballots with replacement and count their cells;
+            # the padding cell past the end is cut off again
+            drawn = ballot_cells[rng.integers(0, n_ballots, n_ballots)]
+            counts[sample] = np.bincount(drawn.ravel(), minlength=cells + 1)[:cells]
+        places.append(skating_places_batch(counts.reshape(batch, *shape)))
+    return np.concatenate(places)
+
+
+def bootstrap_placements(
+    ballots: List[np.ndarray],
+    n_objects: int,
+    samples: int,
+    seed: int = 0,
+    workers: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Skating placements of ``samples`` bootstrap resamples of ``ballots``.
+
+    Each resample draws as many ballots as there are, with replacement. The
+    samples are split into fixed size tasks, each with its own child of
+    ``SeedSequence(seed)``, and spread over a process pool.
+
+    :return: samples x objects placements
+    """
+    # ballot_cells[b, r]: objects x ranks cell that ballot b adds one to for
+    # rank r, padded past the ballot's end with one extra cell
+    width = max(map(len, ballots), default=0)
+    cells = n_objects * width
+    ballot_cells = np.full((len(ballots), width), cells, dtype=np.int64)
+    for index, rows in enumerate(ballots):
+        ballot_cells[index, : len(rows)] = rows.astype(np.int64) * width + np.arange(
+            len(rows)
+        )
+    init_args = (ballot_cells, (n_objects, width))
+
+    tasks = [
+        min(BOOTSTRAP_TASK_SAMPLES, samples - start)
+        for start in range(0, samples, BOOTSTRAP_TASK_SAMPLES)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    if workers <= 1:
+        _init_bootstrap_worker(*init_args)
+        return np.concatenate(list(map(_bootstrap_task, seeds, tasks)))
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_bootstrap_worker,
+        initargs=init_args,
+    ) as executor:
+        return np.concatenate(list(executor.map(_bootstrap_task, seeds, tasks)))
+
+
+def placement_stability(
+    room,
+    samples: Optional[int] = None,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    level: float = 0.95,
+) -> Dict[str, Dict[str, object]]:
+    """
+    Bootstrap the room's skating placements.
+
+    Returns ``{object_id: {"placement_interval": [low, high], "confidence": p}}``
+    where the interval holds ``level`` of the resampled placements and
+    ``confidence`` is the share of resamples that reproduce the actual place.
+    """
+    if getattr(room, "ranking_method", SKATING) != SKATING:
+        raise ValueError("Stability intervals are only available for skating")
+    if samples is None:
+        samples = getattr(settings, "VOTING_BOOTSTRAP_SAMPLES", 2000)
+    if workers is None:
+        workers = getattr(settings, "VOTING_BOOTSTRAP_WORKERS", None)
+
+    _, slot_by_object_id = get_room_objects(room)
+    object_id_by_row, ballots = dense_ballots(room, slot_by_object_id)
+    rows = [rows for _, _, rows in ballots]
+    if not rows or not samples:
+        return {}
+
+    counts = build_matrices(rows, len(object_id_by_row), pairwise=False).counts
+    actual = skating_places_batch(counts[None])[0]
+    places = bootstrap_placements(rows, len(object_id_by_row), samples, seed, workers)
+    tail = (1 - level) / 2
+    low, high = np.quantile(places, [tail, 1 - tail], axis=0, method="inverted_cdf")
+    confidence = (places == actual).mean(axis=0)
+
+    return {
+        obj_id: {
+            "placement_interval": [int(low[row]), int(high[row])],
+            "confidence": round(float(confidence[row]), 3),
+        }
+        for row, obj_id in enumerate(object_id_by_row)
+    }
+
+
+def _stability_key(room, revision: int) -> str:
+    return f"voting:stability:{room.pk}:{revision}"
+
+
+def get_placement_stability(room, revision: int) -> Dict[str, Dict[str, object]]:
+    """
+    :func:`placement_stability` with default settings, cached per revision.
+
+    Run by the ranking worker (see ``RankingJob.stability``): the bootstrap
+    starts a process pool and must not run in a request.
+    """
+    key = _stability_key(room, revision)
+    stability = cache.get(key)
+    if stability is None:
+        stability = placement_stability(room)
+        cache.set(key, stability, RESULTS_CACHE_TIMEOUT)
+    return stability
+
+
+def cached_placement_stability(
+    room, revision: int
+) -> Optional[Dict[str, Dict[str, object]]]:
+    """The intervals :func:`get_placement_stability` cached, or ``None``."""
+    return cache.get(_stability_key(room, revision))
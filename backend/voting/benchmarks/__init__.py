@@ -0,0 +1,5 @@
+"""
+Reproducible benchmarks for the ranking pipeline.
+
+Run them with ``python manage.py benchmark_ranking``.
+"""
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple
+
+import numpy as np
+
+
+class SyntheticRoom(NamedTuple):
+    object_ids: List[str]
+    ballots: List[List[str]]
+
+
+def generate_room(
+    n_objects: int,
+    n_ballots: int,
+    seed: int = 0,
+    incomplete: float = 0.1,
+    ties: float = 0.3,
+    noise: float = 1.0,
+) -> SyntheticRoom:
+    """
+    Generate a room of synthetic ballots.
+
+    Every object gets a latent quality and each voter ranks objects by quality
+    plus Gaussian ``noise``. A ``ties`` fraction of the objects share their
+    quality with another object, which produces many skating ties, and an
+    ``incomplete`` fraction of the ballots only rank a random prefix.
+
+    The same arguments always produce the same room.
+    """
+    rng = np.random.default_rng(seed)
+    object_ids = [str(i) for i in range(1, n_objects + 1)]
+
+    quality = rng.normal(size=n_objects)
+    n_tied = int(n_objects * ties) // 2
+    if n_tied:
+        tied = rng.choice(n_objects, size=2 * n_tied, replace=False)
+        quality[tied[1::2]] = quality[tied[::2]]
+
+    lengths = np.full(n_ballots, n_objects)
+    short = rng.random(n_ballots) < incomplete
+    lengths[short] = rng.integers(1, n_objects + 1, size=short.sum())
+
+    labels = np.asarray(object_ids, dtype=object)
+    ballots: List[List[str]] = []
+    # Generate in chunks to keep the score matrix small for big rooms
+    chunk = max(1, 2_000_000 // max(n_objects, 1))
+    for start in range(0, n_ballots, chunk):
+        stop = min(start + chunk, n_ballots)
+        scores = quality + rng.normal(scale=noise, size=(stop - start, n_objects))
+        orders = np.argsort(-scores, axis=1, kind="stable")
+        for order, length in zip(orders, lengths[start:stop]):
+            ballots.append(labels[order[:length]].tolist())
+
+    return SyntheticRoom(object_ids, ballots)
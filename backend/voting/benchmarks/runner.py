@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import gc
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from voting.benchmarks.generator import SyntheticRoom, generate_room
+from voting.codecs import encode_ballot
+
+# (objects, ballots) from a small room up to the largest event we plan for
+SIZES: List[Tuple[int, int]] = [
+    (10, 10),
+    (50, 500),
+    (200, 2_000),
+    (500, 10_000),
+    (2_000, 50_000),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+def measure(func: Callable[[], Any], repeat: int = 1) -> Dict[str, Any]:
+    """
+    Run ``func`` ``repeat`` times and report the best wall time, the peak
+    traced memory and the number of database queries of a single run.
+    """
+    best = float("inf")
+    peak = 0
+    queries = 0
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        _, run_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        best = min(best, elapsed)
+        peak = max(peak, run_peak)
+        queries = len(captured)
+    return {"seconds": round(best, 6), "peak_bytes": peak, "queries": queries}
+
+
+def bench_algorithms(
+    room: SyntheticRoom, engines: Iterable[str], repeat: int = 1
+) -> List[Dict[str, Any]]:
+    """Benchmark the pure ranking algorithms on in-memory ballots."""
+    from voting.service import add_ballot, get_skating_engine, rank_from_histogram
+
+    rows = []
+    for name in engines:
+        engine = get_skating_engine(name)
+        rows.append(
+            {"path": "algorithm", "engine": name}
+            | measure(lambda: engine(room.ballots), repeat)
+        )
+
+    def aggregate():
+        histogram: Dict[str, List[int]] = {}
+        for ballot in room.ballots:
+            add_ballot(histogram, ballot)
+        rank_from_histogram(histogram, {obj_id: obj_id for obj_id in room.object_ids})
+
+    rows.append({"path": "algorithm", "engine": "histogram"} | measure(aggregate, repeat))
+    return rows
+
+
+def bench_orm(room: SyntheticRoom, repeat: int = 1) -> List[Dict[str, Any]]:
+    """
+    Benchmark the database-backed ranking paths.
+
+    The room is written inside a transaction that is rolled back afterwards, so
+    the database is left untouched.
+    """
+    from users.models import CustomUser
+    from voting.models import RoomParticipant, VotingObject, VotingRoom
+    from voting.service import calculate_room_ranking, refresh_room_ranking
+
+    rows: List[Dict[str, Any]] = []
+    try:
+        with transaction.atomic():
+            db_room = VotingRoom.objects.create(
+                name="Benchmark room", next_slot=len(room.object_ids)
+            )
+            objects = VotingObject.objects.bulk_create(
+                VotingObject(
+                    room=db_room, title=f"Object {obj_id}", image="bench.png", slot=slot
+                )
+                for slot, obj_id in enumerate(room.object_ids)
+            )
+            db_ids = {
+                obj_id: str(obj.id) for obj_id, obj in zip(room.object_ids, objects)
+            }
+            slots = {obj_id: slot for slot, obj_id in enumerate(room.object_ids)}
+            users = CustomUser.objects.bulk_create(
+                (
+                    CustomUser(username=f"benchmark-{db_room.id}-{i}")
+                    for i in range(len(room.ballots))
+                ),
+                batch_size=1000,
+            )
+            RoomParticipant.objects.bulk_create(
+                (
+                    RoomParticipant(
+                        user=user,
+                        room=db_room,
+                        vote_confirmed=True,
+                        vote_data={
+                            db_ids[obj_id]: position
+                            for position, obj_id in enumerate(ballot, start=1)
+                        },
+                        ballot=encode_ballot([slots[obj_id] for obj_id in ballot]),
+                    )
+                    for user, ballot in zip(users, room.ballots)
+                ),
+                batch_size=1000,
+            )
+
+            rows.append(
+                {"path": "orm", "engine": "calculate_room_ranking"}
+                | measure(lambda: calculate_room_ranking(db_room), repeat)
+            )
+            rows.append(
+                {"path": "orm", "engine": "refresh_room_ranking"}
+                | measure(lambda: refresh_room_ranking(db_room), repeat)
+            )
+            raise _Rollback
+    except _Rollback:
+        pass
+    return rows
+
+
+def run(
+    sizes: Iterable[Tuple[int, int]] = SIZES,
+    engines: Iterable[str] = ("python", "numpy"),
+    seed: int = 0,
+    repeat: int = 1,
+    orm_max_ballots: int = 10_000,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """Run the benchmark suite and return a JSON-serialisable report."""
+    engines = list(engines)
+    results = []
+    for n_objects, n_ballots in sizes:
+        if progress:
+            progress(f"{n_objects} objects x {n_ballots} ballots")
+        room = generate_room(n_objects, n_ballots, seed=seed)
+        case = {"objects": n_objects, "ballots": n_ballots}
+        for row in bench_algorithms(room, engines, repeat):
+            results.append(case | row)
+        if n_ballots <= orm_max_ballots:
+            for row in bench_orm(room, repeat):
+                results.append(case | row)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "database": connection.vendor,
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,161 @@
+"""
+Concurrency stress test for the SQLite database profiles.
+
+Worker processes hammer a scratch database with confirmation-shaped
+transactions: read a participant's revision, write the ballot back and bump
+the room's revision, all in one transaction. That read-then-write pattern is
+what fails with "database is locked" under Django's default SQLite settings,
+and what the production profile (see :mod:`evaluator.database`) serializes
+instead.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.utils import load_backend
+
+from evaluator.database import plain_sqlite_database, sqlite_database
+
+STRESS_ALIAS = "sqlite_stress"
+PARTICIPANTS = 200
+
+PROFILES: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    "plain": plain_sqlite_database,
+    # Single short-lived connection per worker, as persistence is not measured
+    "production": lambda name: sqlite_database(name, conn_max_age=0),
+}
+
+
+def create_scratch_database(path: str) -> None:
+    with sqlite3.connect(path) as db:
+        db.executescript(
+            """
+            CREATE TABLE stress_room (id INTEGER PRIMARY KEY, revision INTEGER);
+            CREATE TABLE stress_participant (
+                id INTEGER PRIMARY KEY,
+                revision INTEGER,
+                vote_data TEXT,
+                vote_confirmed INTEGER
+            );
+            INSERT INTO stress_room VALUES (1, 0);
+            """
+        )
+        db.executemany(
+            "INSERT INTO stress_participant VALUES (?, 0, '', 0)",
+            [(pk,) for pk in range(1, PARTICIPANTS + 1)],
+        )
+    db.close()
+
+
+def _connect(profile: str, path: str):
+    """
+    A private connection to ``path`` with the given profile, kept out of
+    ``django.db.connections`` so the stress test runs the same from tests.
+    """
+    settings_dict = connections.configure_settings(
+        {DEFAULT_DB_ALIAS: PROFILES[profile](path)}
+    )[DEFAULT_DB_ALIAS]
+    backend = load_backend(settings_dict["ENGINE"])
+    return backend.DatabaseWrapper(settings_dict, STRESS_ALIAS)
+
+
+def confirm(cursor, participant_id: int, vote_data: str) -> None:
+    cursor.execute(
+        "SELECT revision FROM stress_participant WHERE id = %s", [participant_id]
+    )
+    (revision,) = cursor.fetchone()
+    cursor.execute(
+        "UPDATE stress_participant SET revision = %s, vote_data = %s, "
+        "vote_confirmed = 1 WHERE id = %s",
+        [revision + 1, vote_data, participant_id],
+    )
+    cursor.execute("UPDATE stress_room SET revision = revision + 1 WHERE id = 1")
+
+
+def _stress_worker(args: Tuple[str, str, int, int]) -> Tuple[int, List[float]]:
+    profile, path, transactions, seed = args
+    connection = _connect(profile, path)
+    rng = random.Random(seed)
+    lock_errors = 0
+    latencies: List[float] = []
+    for _ in range(transactions):
+        participant_id = rng.randint(1, PARTICIPANTS)
+        vote_data = ",".join(str(rng.randrange(100)) for _ in range(20))
+        start = time.perf_counter()
+        try:
+            # Starts the transaction the way an outermost atomic() does, with
+            # the profile's transaction mode
+            connection.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True
+            )
+            with connection.cursor() as cursor:
+                confirm(cursor, participant_id, vote_data)
+            connection.commit()
+        except OperationalError as e:
+            connection.rollback()
+            if "locked" not in str(e):
+                raise
+            lock_errors += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+        finally:
+            connection.set_autocommit(True)
+    connection.close()
+    return lock_errors, latencies
+
+
+def run_stress(
+    profile: str, workers: int = 8, transactions: int = 200, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Run ``workers`` processes of ``transactions`` confirmations each against a
+    fresh scratch database and report lock errors, throughput and latency.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stress.sqlite3")
+        create_scratch_database(path)
+        # fork keeps the configured Django settings in the workers
+        context = multiprocessing.get_context("fork")
+        start = time.perf_counter()
+        with context.Pool(workers) as pool:
+            results = pool.map(
+                _stress_worker,
+                [(profile, path, transactions, seed + i) for i in range(workers)],
+            )
+        elapsed = time.perf_counter() - start
+        with sqlite3.connect(path) as db:
+            (room_revision,) = db.execute(
+                "SELECT revision FROM stress_room WHERE id = 1"
+            ).fetchone()
+        db.close()
+
+    lock_errors = sum(errors for errors, _ in results)
+    latencies = sorted(latency for _, worker in results for latency in worker)
+    committed = len(latencies)
+    return {
+        "profile": profile,
+        "workers": workers,
+        "transactions": workers * transactions,
+        "committed": committed,
+        "lock_errors": lock_errors,
+        # Every committed confirmation must be counted exactly once
+        "consistent": room_revision == committed,
+        "seconds": round(elapsed, 3),
+        "tx_per_second": round(committed / elapsed, 1) if elapsed else None,
+        "p95_ms": (
+            round(latencies[int(0.95 * (committed - 1))] * 1000, 2)
+            if latencies
+            else None
+        ),
+    }
@@ -0,0 +1,54 @@
+"""
+Compact binary ballot format.
+
+A ballot is stored as the per-room ``VotingObject.slot`` of every ranked object,
+from best to worst, packed as little-endian unsigned 16-bit integers. Decoding
+is a single ``np.frombuffer`` call and the array index is the rank, so scoring
+needs no per-ballot sorting or string handling.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+BALLOT_DTYPE = np.dtype("<u2")
+
+# Largest slot that fits in a packed ballot entry
+MAX_SLOT = np.iinfo(BALLOT_DTYPE).max
+
+
+def encode_ballot(slots: Sequence[int]) -> bytes:
+    """Pack an ordered sequence of object slots."""
+    return np.asarray(slots, dtype=BALLOT_DTYPE).tobytes()
+
+
+def decode_ballot(data: bytes | memoryview) -> np.ndarray:
+    """Unpack a ballot into an array of object slots ordered best to worst."""
+    return np.frombuffer(data, dtype=BALLOT_DTYPE)
+
+
+def encode_vote_data(
+    vote_data: Mapping[str, Any], slot_by_object_id: Mapping[str, int]
+) -> Optional[bytes]:
+    """
+    Encode ``{object_id: position}`` vote data.
+
+    Returns ``None`` when the vote data mentions an object that is not in
+    ``slot_by_object_id``, in which case readers fall back to ``vote_data``.
+    """
+    positions = sorted(vote_data.items(), key=lambda item: int(item[1]))
+    try:
+        return encode_ballot(
+            [slot_by_object_id[str(obj_id)] for obj_id, _ in positions]
+        )
+    except KeyError:
+        return None
+
+
+def decode_to_object_ids(
+    data: bytes | memoryview, object_id_by_slot: Dict[int, str]
+) -> List[str]:
+    """Decode a ballot back into object IDs ordered from best to worst."""
+    return [object_id_by_slot[slot] for slot in decode_ballot(data).tolist()]
@@ -0,0 +1,194 @@
+"""
+Write-behind buffer for unconfirmed ranking drafts.
+
+With ``VOTING_DRAFT_BUFFER`` on, autosaves are kept in the ``drafts`` cache
+instead of being written to ``RoomParticipant``. The ``flush_vote_drafts``
+command periodically writes them back in bulk, and confirming a vote saves the
+latest draft along with it. A buffered draft only wins over the database row
+while its revision is ahead of the row's.
+
+Each participant has a single draft entry, and the flusher deletes the ones it
+wrote back, so the cache only holds drafts still to be saved and never gets
+near the size at which a cache backend starts culling entries.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+DRAFT_CACHE_ALIAS = "drafts"
+# Long enough to survive a flusher outage, drafts are on disk until then
+DRAFT_TIMEOUT = 7 * 24 * 3600
+# Lock held while a draft entry is read and replaced, deleted right after. The
+# timeout only matters for a process that died holding it.
+LOCK_TIMEOUT = 10
+FLUSH_BATCH_SIZE = 500
+
+Draft = Dict[str, Any]
+
+
+def draft_buffer_enabled() -> bool:
+    return getattr(settings, "VOTING_DRAFT_BUFFER", False)
+
+
+def _draft_cache():
+    return caches[DRAFT_CACHE_ALIAS]
+
+
+def draft_key(participant_id: int, using: str = DEFAULT_DB_ALIAS) -> str:
+    # Participant IDs are only unique per database, see voting.sharding
+    if using != DEFAULT_DB_ALIAS:
+        return f"voting:draft:{using}:{participant_id}"
+    return f"voting:draft:{participant_id}"
+
+
+def _participant_key(participant) -> str:
+    return draft_key(participant.pk, participant._state.db or DEFAULT_DB_ALIAS)
+
+
+def get_draft(participant) -> Optional[Draft]:
+    """The buffered draft of ``participant`` if it is newer than the row."""
+    if not draft_buffer_enabled():
+        return None
+    draft = _draft_cache().get(_participant_key(participant))
+    if draft is None or draft["revision"] <= participant.revision:
+        return None
+    return draft
+
+
+def overlay_draft(participant):
+    """Apply the participant's buffered draft, if any, to the (unsaved) instance."""
+    draft = get_draft(participant)
+    if draft is not None:
+        participant.vote_data = draft["vote_data"]
+        participant.comments = draft["comments"]
+        participant.revision = draft["revision"]
+    return participant
+
+
+@contextmanager
+def _draft_lock(cache, key: str) -> Iterator[bool]:
+    """Whether the participant's draft entry could be locked for this block."""
+    lock = f"{key}:lock"
+    locked = cache.add(lock, True, LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+def save_draft(participant, vote_data, comments: str, revision: int) -> bool:
+    """
+    Buffer a draft at ``revision``.
+
+    Returns ``False`` when the buffered draft is already at ``revision`` or
+    later, or another save of the same participant is in progress, so the
+    caller can answer with a conflict. The check is atomic on cache backends
+    with an atomic ``add()``, and best effort on the file-based one.
+    """
+    cache = _draft_cache()
+    key = _participant_key(participant)
+    with _draft_lock(cache, key) as locked:
+        if not locked:
+            return False
+        current = cache.get(key)
+        if current is not None and current["revision"] >= revision:
+            return False
+        cache.set(
+            key,
+            {"vote_data": vote_data, "comments": comments, "revision": revision},
+            DRAFT_TIMEOUT,
+        )
+    return True
+
+
+def discard_draft(participant) -> None:
+    if draft_buffer_enabled():
+        _draft_cache().delete(_participant_key(participant))
+
+
+def flush_drafts(
+    participant_ids: Optional[Iterable[int]] = None,
+    using: Optional[Iterable[str]] = None,
+) -> int:
+    """
+    Write buffered drafts that are ahead of their rows back to the database.
+
+    Candidates are the unconfirmed participants (or the given subset) of every
+    room database (or of ``using``); their drafts are fetched with one
+    ``get_many`` and written with ``bulk_update`` in a single transaction per
+    database. Returns the number of participants updated.
+    """
+    from voting.sharding import room_databases
+
+    if participant_ids is not None:
+        participant_ids = list(participant_ids)
+    return sum(
+        _flush_database_drafts(alias, participant_ids)
+        for alias in (room_databases() if using is None else using)
+    )
+
+
+def _flush_database_drafts(using: str, participant_ids: Optional[List[int]]) -> int:
+    from voting.models import RoomParticipant
+
+    participants = RoomParticipant.objects.using(using)
+    pending = participants.filter(vote_confirmed=False)
+    if participant_ids is not None:
+        pending = pending.filter(pk__in=participant_ids)
+    revisions = dict(pending.values_list("id", "revision"))
+    if not revisions:
+        return 0
+
+    drafts = _draft_cache().get_many([draft_key(pk, using) for pk in revisions])
+    now = timezone.now()
+    updates: List[RoomParticipant] = []
+    for pk, revision in revisions.items():
+        draft = drafts.get(draft_key(pk, using))
+        if draft is not None and draft["revision"] > revision:
+            updates.append(
+                RoomParticipant(
+                    pk=pk,
+                    vote_data=draft["vote_data"],
+                    comments=draft["comments"],
+                    revision=draft["revision"],
+                    updated_at=now,
+                )
+            )
+    if not updates:
+        return 0
+
+    with transaction.atomic(using=using):
+        # A vote confirmed since the read above must keep its confirmed data
+        still_open = set(
+            participants.select_for_update()
+            .filter(pk__in=[p.pk for p in updates], vote_confirmed=False)
+            .values_list("id", flat=True)
+        )
+        updates = [p for p in updates if p.pk in still_open]
+        participants.bulk_update(
+            updates,
+            ["vote_data", "comments", "revision", "updated_at"],
+            batch_size=FLUSH_BATCH_SIZE,
+        )
+
+    for participant in updates:
+        _delete_flushed_draft(draft_key(participant.pk, using), participant.revision)
+    return len(updates)
+
+
+def _delete_flushed_draft(key: str, revision: int) -> None:
+    """Delete a written back draft, unless a newer one was saved meanwhile."""
+    cache = _draft_cache()
+    with _draft_lock(cache, key) as locked:
+        # Left for the next flush otherwise
+        draft = cache.get(key) if locked else None
+        if draft is not None and draft["revision"] == revision:
+            cache.delete(key)
@@ -0,0 +1,149 @@
+"""
+Pluggable ranking methods.
+
+Every method receives the :class:`BallotMatrices` of a room and returns the
+row order from best to worst together with competition-style placements.
+The rank counts and the pairwise preference matrix are built once, in a single
+vectorized pass over the packed ballots, and shared by all methods.
+"""
+
+from __future__ import annotations
+
+from itertools import islice
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Upper bound on ballots x objects x objects cells compared per vectorized step
+MATRIX_CELLS = 1 << 24
+
+POSITION_DTYPE = np.uint16
+
+
+class BallotMatrices(NamedTuple):
+    # counts[i, r]: ballots placing object i at rank r + 1
+    counts: np.ndarray
+    # pairwise[i, j]: ballots preferring object i over object j
+    pairwise: Optional[np.ndarray]
+    ballot_count: int
+
+
+Placements = Tuple[np.ndarray, np.ndarray]
+RankingMethod = Callable[[BallotMatrices], Placements]
+
+RANKING_METHODS: Dict[str, RankingMethod] = {}
+
+
+def register_method(name: str):
+    """Register a ranking method under ``name``."""
+
+    def decorator(func: RankingMethod) -> RankingMethod:
+        RANKING_METHODS[name] = func
+        return func
+
+    return decorator
+
+
+def get_ranking_method(name: str) -> RankingMethod:
+    try:
+        return RANKING_METHODS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown ranking method {name!r}, expected one of {sorted(RANKING_METHODS)}"
+        ) from None
+
+
+def build_matrices(
+    ballots: Iterable[np.ndarray], n_objects: int, pairwise: bool = True
+) -> BallotMatrices:
+    """
+    Build the rank counts and, optionally, the pairwise preference matrix.
+
+    ``ballots`` are arrays of object indexes ordered from best to worst; indexes
+    outside ``range(n_objects)`` are ignored. An object missing from a ballot is
+    considered worse than every object on it, and tied with the other missing
+    ones.
+    """
+    counts = np.zeros((n_objects, 0), dtype=np.int64)
+    preferences = np.zeros((n_objects, n_objects), dtype=np.int64) if pairwise else None
+    ballot_count = 0
+    # Bound the ballots x objects x objects comparison done per step
+    chunk_size = max(1, MATRIX_CELLS // max(n_objects * n_objects, 1))
+    unranked = np.iinfo(POSITION_DTYPE).max
+
+    iterator = iter(ballots)
+    while chunk := list(islice(iterator, chunk_size)):
+        chunk = [ballot for ballot in chunk if len(ballot)]
+        if not chunk:
+            continue
+        lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk))
+        rows = np.repeat(np.arange(len(chunk)), lengths)
+        objects = np.concatenate(chunk).astype(np.int64)
+        ranks = np.arange(len(objects)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        known = objects < n_objects
+        rows, objects, ranks = rows[known], objects[known], ranks[known]
+
+        width = max(counts.shape[1], int(lengths.max()))
+        chunk_counts = np.bincount(
+            objects * width + ranks, minlength=n_objects * width
+        ).reshape(n_objects, width)
+        chunk_counts[:, : counts.shape[1]] += counts
+        counts = chunk_counts
+
+        if preferences is not None:
+            positions = np.full((len(chunk), n_objects), unranked, dtype=POSITION_DTYPE)
+            positions[rows, objects] = ranks
+            preferences += (positions[:, :, None] < positions[:, None, :]).sum(axis=0)
+        ballot_count += len(chunk)
+
+    return BallotMatrices(counts, preferences, ballot_count)
+
+
+def restrict(matrices: BallotMatrices, rows: np.ndarray) -> BallotMatrices:
+    """Keep only the given object rows (and pairwise columns)."""
+    pairwise = matrices.pairwise
+    if pairwise is not None:
+        pairwise = pairwise[np.ix_(rows, rows)]
+    return BallotMatrices(matrices.counts[rows], pairwise, matrices.ballot_count)
+
+
+def placements_from_scores(scores: np.ndarray) -> Placements:
+    """Order by descending score; equal scores share a competition-style place."""
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = sorted_scores[1:] != sorted_scores[:-1]
+    places = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0)) + 1
+    return order, places
+
+
+@register_method("borda")
+def borda(matrices: BallotMatrices) -> Placements:
+    """One point for every object ranked below, summed over all ballots."""
+    return placements_from_scores(matrices.pairwise.sum(axis=1))
+
+
+@register_method("copeland")
+def copeland(matrices: BallotMatrices) -> Placements:
+    """Pairwise wins minus pairwise losses."""
+    margins = matrices.pairwise - matrices.pairwise.T
+    return placements_from_scores(np.sign(margins).sum(axis=1))
+
+
+@register_method("schulze")
+def schulze(matrices: BallotMatrices) -> Placements:
+    """
+    Schulze method.
+
+    Strongest path strengths are computed with an array-based Floyd-Warshall:
+    one ``np.maximum``/``np.minimum`` over the whole matrix per intermediate
+    object. Objects are then ordered by how many others they beat.
+    """
+    d = matrices.pairwise
+    strength = np.where(d > d.T, d, 0)
+    for k in range(len(strength)):
+        strength = np.maximum(
+            strength, np.minimum(strength[:, k, None], strength[None, k, :])
+        )
+    np.fill_diagonal(strength, 0)
+    return placements_from_scores((strength > strength.T).sum(axis=1))
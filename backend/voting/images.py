@@ -0,0 +1,213 @@
+"""
+Responsive variants of the voting object images.
+
+Originals are often multi-megabyte phone photos, while the ranking cards show
+them at a few dozen pixels. :func:`generate_variants` resizes an image to every
+width of ``VOTING_IMAGE_WIDTHS`` (never upscaling) in AVIF (when Pillow
+supports it), WebP and JPEG, and :func:`set_variants` records the result in
+``VotingObject.image_variants``::
+
+    {
+        "source": "objects/cat.jpg",   # the image the variants were made from
+        "width": 3024, "height": 4032,
+        "formats": {"avif": [[160, "objects/variants/cat.jpg/160.avif"], ...],
+                    "webp": [...], "jpeg": [...]},
+    }
+
+The serializer turns that into ``srcset`` strings. When an object's image
+changes, :mod:`voting.signals` queues its room for the ranking worker, which
+resizes it with :func:`backfill_room_variants` outside the request. Existing
+images are handled by the ``generate_image_variants`` command with a pool of
+processes. Variant names derive from the source name, so existing files are
+reused unless forced.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_DIR = "objects/variants"
+# Preferred first: the order of the <picture> sources
+FORMATS = {
+    "avif": {"extension": ".avif", "pillow": "AVIF", "quality": 55, "speed": 8},
+    "webp": {"extension": ".webp", "pillow": "WEBP", "quality": 75, "method": 4},
+    "jpeg": {"extension": ".jpg", "pillow": "JPEG", "quality": 80, "optimize": True},
+}
+CONTENT_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def variant_widths() -> Tuple[int, ...]:
+    return tuple(getattr(settings, "VOTING_IMAGE_WIDTHS", DEFAULT_WIDTHS))
+
+
+def supported_formats() -> List[str]:
+    """The formats this Pillow build can write (older builds lack AVIF)."""
+    extensions = Image.registered_extensions()
+    return [fmt for fmt, spec in FORMATS.items() if spec["extension"] in extensions]
+
+
+def variant_name(source: str, width: int, fmt: str) -> str:
+    return (
+        f"{VARIANT_DIR}/{PurePosixPath(source).name}/"
+        f"{width}{FORMATS[fmt]['extension']}"
+    )
+
+
+def _encode(image: Image.Image, width: int, fmt: str) -> bytes:
+    keep_alpha = fmt != "jpeg" and ("A" in image.mode or "transparency" in image.info)
+    image = image.convert("RGBA" if keep_alpha else "RGB")
+    height = max(1, round(image.height * width / image.width))
+    image = image.resize((width, height), Image.Resampling.LANCZOS)
+    spec = FORMATS[fmt]
+    options = {
+        key: value for key, value in spec.items() if key not in ("extension", "pillow")
+    }
+    buffer = io.BytesIO()
+    image.save(buffer, spec["pillow"], **options)
+    return buffer.getvalue()
+
+
+def generate_variants(source: str, force: bool = False) -> Dict:
+    """
+    Store the variants of the stored image ``source`` and describe them in the
+    ``image_variants`` format. Variants already stored are kept unless
+    ``force``.
+    """
+    with default_storage.open(source) as stream, Image.open(stream) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    widths = sorted({min(width, image.width) for width in variant_widths()})
+
+    formats: Dict[str, List[List]] = {}
+    for fmt in supported_formats():
+        formats[fmt] = []
+        for width in widths:
+            name = variant_name(source, width, fmt)
+            if force or not default_storage.exists(name):
+                default_storage.delete(name)
+                content = ContentFile(_encode(image, width, fmt))
+                stored = default_storage.save(name, content)
+                if stored != name:
+                    # Written concurrently: srcset must name the file as planned
+                    default_storage.delete(stored)
+                    raise RuntimeError(f"Storage saved {name} as {stored}")
+            formats[fmt].append([width, name])
+    return {
+        "source": source,
+        "width": image.width,
+        "height": image.height,
+        "formats": formats,
+    }
+
+
+def picture(variants: Dict, url: Callable[[str], str]) -> Optional[Dict]:
+    """
+    ``srcset`` strings for a ``<picture>``: one ``<source>`` per modern format
+    and the JPEG variants for the ``<img>``. ``url`` maps storage names to URLs.
+    """
+    formats = variants.get("formats") or {}
+    if not formats.get("jpeg"):
+        return None
+
+    def srcset(entries):
+        return ", ".join(f"{url(name)} {width}w" for width, name in entries)
+
+    return {
+        "src": url(formats["jpeg"][0][1]),
+        "srcset": srcset(formats["jpeg"]),
+        "sources": [
+            {"type": CONTENT_TYPES[fmt], "srcset": srcset(entries)}
+            for fmt, entries in formats.items()
+            if fmt != "jpeg" and entries
+        ],
+        "width": variants["width"],
+        "height": variants["height"],
+    }
+
+
+def needs_variants(obj) -> bool:
+    """Whether ``obj.image`` changed since its variants were made."""
+    source = (obj.image_variants or {}).get("source")
+    return source != (obj.image.name if obj.image else None)
+
+
+def set_variants(obj, force: bool = False) -> Dict:
+    """Generate the variants of ``obj.image`` and save them on the object."""
+    from voting.models import VotingObject
+
+    variants = generate_variants(obj.image.name, force=force) if obj.image else {}
+    # update() rather than save(): the post_save handler would run again
+    VotingObject.objects.using(obj._state.db).filter(pk=obj.pk).update(
+        image_variants=variants
+    )
+    obj.image_variants = variants
+    return variants
+
+
+def backfill_room_variants(room) -> List[str]:
+    """Make the missing variants of ``room``'s images. Returns the errors."""
+    from voting.models import VotingObject
+
+    alias = room._state.db
+    objects = VotingObject.objects.using(alias).filter(room=room).exclude(image="")
+    targets = [
+        (alias, obj.pk)
+        for obj in objects.only("pk", "image", "image_variants")
+        if needs_variants(obj)
+    ]
+    return [error for _, error in backfill_variants(targets, workers=1) if error]
+
+
+def _init_pool_worker():
+    import django
+
+    django.setup()
+    # Never share the parent's database connections with a forked child
+    connections.close_all()
+
+
+def _set_variants_by_id(alias: str, pk: int, force: bool) -> Tuple[int, Optional[str]]:
+    from voting.models import VotingObject
+
+    obj = VotingObject.objects.using(alias).get(pk=pk)
+    try:
+        set_variants(obj, force=force)
+    except Exception as exc:  # a broken upload must not stop the backfill
+        return pk, f"{obj.image.name}: {exc}"
+    return pk, None
+
+
+def backfill_variants(
+    targets: Iterable[Tuple[str, int]],
+    force: bool = False,
+    workers: Optional[int] = None,
+) -> Iterable[Tuple[int, Optional[str]]]:
+    """
+    Generate variants for the objects ``targets`` (``(database, pk)`` pairs) in
+    a pool of ``workers`` processes. Yields ``(pk, error or None)``.
+    """
+    targets = list(targets)
+    workers = min(workers or os.cpu_count() or 1, len(targets))
+    if workers <= 1:
+        for alias, pk in targets:
+            yield _set_variants_by_id(alias, pk, force)
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_pool_worker
+    ) as executor:
+        aliases, pks = zip(*targets)
+        yield from executor.map(
+            _set_variants_by_id, aliases, pks, [force] * len(pks), chunksize=4
+        )
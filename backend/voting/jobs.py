@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable, Optional, Tuple
+
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from voting.models import RankingJob, VotingRoom
+
+logger = logging.getLogger(__name__)
+
+# Attempts to repeat a recompute that failed with "database is locked"
+LOCK_RETRIES = 3
+
+# Running jobs started longer ago than this are assumed to be abandoned
+STALE_JOB_TIMEOUT = 15 * 60  # seconds
+
+
+def enqueue_ranking(
+    room,
+    ranking: bool = True,
+    full_rebuild: bool = False,
+    stability: bool = False,
+    influence: bool = False,
+    variants: bool = False,
+) -> None:
+    """
+    Mark a room's ranking as dirty.
+
+    Repeated marks for the same room collapse into one pending job that the
+    ``run_ranking_worker`` command picks up. With ``stability`` the job also
+    caches the room's bootstrap placement intervals, with ``influence`` its
+    ballot influence report, with ``variants`` it resizes the room's new
+    images. A job marked only with ``ranking=False`` skips the recompute.
+    """
+    room_id = getattr(room, "pk", room)
+    changes = {
+        "requested": F("requested") + 1,
+        # A running job stays claimed, run_job requeues it when it sees the mark
+        "status": Case(
+            When(status=RankingJob.RUNNING, then=Value(RankingJob.RUNNING)),
+            default=Value(RankingJob.PENDING),
+        ),
+        "requested_at": timezone.now(),
+    }
+    if ranking:
+        changes["ranking"] = True
+    if full_rebuild:
+        changes["full_rebuild"] = True
+    if stability:
+        changes["stability"] = True
+    if influence:
+        changes["influence"] = True
+    if variants:
+        changes["variants"] = True
+
+    if RankingJob.objects.filter(room_id=room_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            RankingJob.objects.create(
+                room_id=room_id,
+                requested=1,
+                ranking=ranking,
+                full_rebuild=full_rebuild,
+                stability=stability,
+                influence=influence,
+                variants=variants,
+            )
+    except IntegrityError:
+        # Another request created the job in the meantime
+        RankingJob.objects.filter(room_id=room_id).update(**changes)
+
+
+def claim_next_job(exclude_failed: bool = True) -> Optional[RankingJob]:
+    """Atomically move the oldest pending job to ``running`` and return it."""
+    statuses = [RankingJob.PENDING]
+    if not exclude_failed:
+        statuses.append(RankingJob.FAILED)
+    while True:
+        job = (
+            RankingJob.objects.filter(status__in=statuses)
+            .order_by("requested_at")
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = RankingJob.objects.filter(
+            pk=job.pk, status=job.status, requested=job.requested
+        ).update(status=RankingJob.RUNNING, started_at=timezone.now(), error="")
+        if claimed:
+            job.status = RankingJob.RUNNING
+            return job
+        # Lost the race against another worker or a new mark; try again
+
+
+def run_job(job: RankingJob) -> bool:
+    """
+    Recompute the ranking of a claimed job's room.
+
+    Image variants are resized first and on their own, so a failing recompute
+    never holds them back. If the room was marked dirty again while the job
+    ran, the job goes back to ``pending`` instead of ``done``. Returns whether
+    the recompute succeeded.
+    """
+    from voting.analysis import get_ballot_influence, get_placement_stability
+    from voting.images import backfill_room_variants
+
+    snapshot = job.requested
+    try:
+        room = VotingRoom.objects.get(pk=job.room_id)
+    except VotingRoom.DoesNotExist as e:
+        return _fail_job(job, e)
+    if job.variants:
+        # Uploads are independent of the ballots: resize even if ranking fails
+        try:
+            for error in backfill_room_variants(room):
+                # The upload is saved: generate_image_variants can retry later
+                logger.warning("Could not resize %s", error)
+        except Exception:
+            logger.exception("Image variants failed for room %s", job.room_id)
+    try:
+        if job.ranking:
+            _recompute(job, room)
+        if job.stability:
+            get_placement_stability(room, room.ballot_revision)
+        if job.influence:
+            get_ballot_influence(room, room.ballot_revision)
+    except Exception as e:
+        return _fail_job(job, e)
+
+    finished = {"processed": snapshot, "finished_at": timezone.now()}
+    done = RankingJob.objects.filter(pk=job.pk, requested=snapshot).update(
+        status=RankingJob.DONE,
+        ranking=False,
+        full_rebuild=False,
+        stability=False,
+        influence=False,
+        variants=False,
+        **finished,
+    )
+    if not done:
+        # Marked dirty again while running: keep the job queued
+        RankingJob.objects.filter(pk=job.pk).update(
+            status=RankingJob.PENDING, **finished
+        )
+    return True
+
+
+def _recompute(job: RankingJob, room: VotingRoom) -> None:
+    from voting.realtime import publish_room_update
+    from voting.service import (
+        cache_room_results,
+        calculate_room_ranking,
+        refresh_room_ranking,
+    )
+
+    for attempt in range(LOCK_RETRIES + 1):
+            try:
+                if job.full_rebuild:
+                    ranking = calculate_room_ranking(room)
+                else:
+                    ranking = refresh_room_ranking(room)
+                break
+            except OperationalError as e:
+                # SQLite refuses concurrent write upgrades instead of waiting
+                if "locked" not in str(e) or attempt == LOCK_RETRIES:
+                    raise
+                time.sleep(0.1 * 2**attempt)
+    # Requests waiting on this recompute serve the stored ranking until then
+    if cache_room_results(room, room.ballot_revision, ranking):
+        publish_room_update(room.pk)
+
+
+def _fail_job(job: RankingJob, error: Exception) -> bool:
+    logger.exception("Ranking recompute failed for room %s", job.room_id)
+    RankingJob.objects.filter(pk=job.pk).update(
+        status=RankingJob.FAILED, error=str(error), finished_at=timezone.now()
+    )
+    return False
+
+
+def run_pending_jobs(limit: Optional[int] = None) -> int:
+    """Process pending jobs until the queue is empty. Returns the number run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def requeue_stale_jobs(timeout: float = STALE_JOB_TIMEOUT) -> int:
+    """
+    Put jobs left ``running`` by a crashed worker back in the queue.
+
+    Only jobs started more than ``timeout`` seconds ago are requeued, so the
+    ones a live worker is still recomputing are left alone.
+    """
+    started_before = timezone.now() - timedelta(seconds=timeout)
+    return RankingJob.objects.filter(
+        status=RankingJob.RUNNING, started_at__lt=started_before
+    ).update(status=RankingJob.PENDING)
+
+
+def _init_pool_worker():
+    import django
+
+    django.setup()
+    # Never share the parent's database connections with a forked child
+    connections.close_all()
+
+
+def _run_job_by_id(job_id: int) -> Tuple[str, bool]:
+    job = RankingJob.objects.get(pk=job_id)
+    return str(job.room_id), run_job(job)
+
+
+def run_pending_jobs_parallel(
+    workers: int,
+    include_failed: bool = False,
+    progress: Optional[Callable[[int, int, str, bool], None]] = None,
+) -> int:
+    """
+    Drain the queue with a pool of ``workers`` processes.
+
+    Jobs are claimed in this process and recomputed in the pool. ``progress`` is
+    called as ``progress(done, total, room_id, ok)`` after every job. Returns
+    the number of jobs run.
+    """
+    statuses = [RankingJob.PENDING]
+    if include_failed:
+        statuses.append(RankingJob.FAILED)
+    queued = RankingJob.objects.filter(status__in=statuses).count()
+    connections.close_all()
+    done = 0
+    submitted = 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_pool_worker
+    ) as executor:
+        pending = set()
+        while True:
+            # Keep every worker busy without claiming the whole queue up front,
+            # so a crash leaves unclaimed jobs pending.
+            while len(pending) < workers * 2:
+                job = claim_next_job(exclude_failed=not include_failed)
+                if job is None:
+                    break
+                pending.add(executor.submit(_run_job_by_id, job.pk))
+                submitted += 1
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                room_id, ok = future.result()
+                done += 1
+                if progress:
+                    progress(done, max(queued, submitted), room_id, ok)
+    return done
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.benchmarks.runner import SIZES, run
+
+
+def parse_size(value):
+    try:
+        n_objects, n_ballots = value.lower().split("x")
+        return int(n_objects), int(n_ballots)
+    except ValueError:
+        raise CommandError(f"Invalid size {value!r}, expected OBJECTSxBALLOTS")
+
+
+class Command(BaseCommand):
+    help = "Benchmark the ranking pipeline on seeded synthetic rooms"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            action="append",
+            dest="sizes",
+            help="Room size as OBJECTSxBALLOTS, may be repeated "
+            f"(default: {', '.join(f'{o}x{b}' for o, b in SIZES)})",
+        )
+        parser.add_argument(
+            "--engine",
+            action="append",
+            dest="engines",
+            help="Skating engine to benchmark, may be repeated (default: all)",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument(
+            "--orm-max-ballots",
+            type=int,
+            default=10_000,
+            help="Skip the database benchmarks for rooms with more ballots",
+        )
+        parser.add_argument(
+            "--output", "-o", help="Write the JSON report to this file"
+        )
+
+    def handle(self, *args, **options):
+        from voting.service import SKATING_ENGINES
+
+        sizes = [parse_size(size) for size in options["sizes"] or []] or SIZES
+        engines = options["engines"] or list(SKATING_ENGINES)
+
+        report = run(
+            sizes=sizes,
+            engines=engines,
+            seed=options["seed"],
+            repeat=options["repeat"],
+            orm_max_ballots=options["orm_max_ballots"],
+            progress=lambda message: self.stderr.write(f"Benchmarking {message}"),
+        )
+
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data)
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from voting.drafts import flush_drafts
+
+
+class Command(BaseCommand):
+    help = "Write buffered ranking drafts back to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Flush once and exit instead of flushing periodically",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10.0,
+            help="Seconds between flushes (default: 10)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Draft flusher started")
+        while True:
+            close_old_connections()
+            flushed = flush_drafts()
+            if flushed:
+                self.stdout.write(f"Flushed {flushed} draft(s)")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from voting.images import backfill_variants, needs_variants
+from voting.models import VotingObject
+from voting.sharding import room_databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized WebP/AVIF/JPEG variants of voting object images "
+        "that don't have them yet (see voting.images)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate the variants of every image",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: number of CPUs)",
+        )
+
+    def handle(self, *args, **options):
+        targets = []
+        for alias in room_databases():
+            objects = VotingObject.objects.using(alias).exclude(image="")
+            for obj in objects.only("pk", "image", "image_variants"):
+                if options["force"] or needs_variants(obj):
+                    targets.append((alias, obj.pk))
+        self.stdout.write(f"Resizing {len(targets)} image(s)")
+
+        failed = 0
+        for done, (pk, error) in enumerate(
+            backfill_variants(targets, options["force"], options["workers"]), start=1
+        ):
+            if error:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f"[{done}/{len(targets)}] {error}"))
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Done, {failed} failed"))
@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.room_import import import_rooms, load_manifest, parse_rooms
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update rooms and their objects from a JSON or YAML manifest "
+        "(see voting.room_import). Safe to run again after editing the manifest"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="Manifest file, .json, .yaml or .yml")
+        parser.add_argument(
+            "--images",
+            help="Directory the image paths are relative to "
+            "(default: the manifest's directory)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes checking and storing images (default: number of CPUs)",
+        )
+
+    def handle(self, *args, **options):
+        manifest = Path(options["manifest"])
+        images = Path(options["images"]) if options["images"] else manifest.parent
+        try:
+            rooms = parse_rooms(load_manifest(manifest))
+            result = import_rooms(rooms, images, workers=options["workers"])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rooms: {result.rooms_created} created, "
+                f"{result.rooms_updated} updated. "
+                f"Objects: {result.objects_created} created, "
+                f"{result.objects_updated} updated. "
+                f"Images: {result.images_stored} stored, "
+                f"{result.variants_generated} resized"
+            )
+        )
+        for error in result.variant_errors:
+            self.stderr.write(self.style.ERROR(f"Could not resize {error}"))
@@ -0,0 +1,69 @@
+import csv
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.provisioning import BATCH_SIZE, provision_users, read_roster
+
+
+class Command(BaseCommand):
+    help = (
+        "Create attendees from a CSV or JSONL roster (see voting.provisioning) "
+        "and write their login codes as CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("roster", help="Roster file, .csv or .jsonl")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Roster format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--room",
+            action="append",
+            default=[],
+            help="Add every attendee to this room ID (repeatable)",
+        )
+        parser.add_argument(
+            "--output",
+            help="Write username, user_id and token to this CSV (default: stdout)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Users per transaction (default: {BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["roster"])
+        fmt = options["format"] or path.suffix.lstrip(".").lower()
+        try:
+            with path.open(newline="", encoding="utf-8-sig") as stream:
+                entries = read_roster(stream, fmt)
+            result = provision_users(
+                entries, rooms=options["room"], batch_size=options["batch_size"]
+            )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        output = options["output"]
+        stream = open(output, "w", newline="") if output else sys.stdout
+        try:
+            writer = csv.writer(stream)
+            writer.writerow(["username", "user_id", "token"])
+            writer.writerows(result.created)
+        finally:
+            if output:
+                stream.close()
+
+        for username in result.skipped:
+            self.stderr.write(f"Skipped existing username {username}")
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Created {len(result.created)} user(s) and "
+                f"{result.participations} room participation(s)"
+            )
+        )
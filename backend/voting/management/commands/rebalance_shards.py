@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.sharding import misplaced_rooms, move_room, sharding_enabled
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every room to the shard its UUID hashes to. Run after turning "
+        "sharding on or changing VOTING_SHARDS, with the app stopped and every "
+        "database migrated (migrate --database shard_N)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the rooms that would move",
+        )
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError("Sharding is off, set VOTING_SHARDS first")
+
+        moved = 0
+        for room_id, source, target in misplaced_rooms():
+            if options["dry_run"]:
+                self.stdout.write(f"{room_id}: {source} -> {target}")
+                continue
+            counts = move_room(room_id, source, target)
+            moved += 1
+            self.stdout.write(
+                f"{room_id}: {source} -> {target} "
+                f"({counts['objects']} objects, {counts['participants']} participants)"
+            )
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} room(s)"))
@@ -0,0 +1,79 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from voting.jobs import (
+    STALE_JOB_TIMEOUT,
+    enqueue_ranking,
+    requeue_stale_jobs,
+    run_pending_jobs_parallel,
+)
+from voting.models import RankingJob, VotingRoom
+from voting.sharding import room_databases
+
+
+class Command(BaseCommand):
+    help = "Fully recompute room rankings in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "rooms", nargs="*", help="Room IDs to recompute (default: all rooms)"
+        )
+        parser.add_argument(
+            "--active", action="store_true", help="Only recompute active rooms"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Do not queue any rooms, finish the jobs left by an interrupted run",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=STALE_JOB_TIMEOUT,
+            help=(
+                "With --resume, requeue running jobs started this many seconds "
+                f"ago (default: {STALE_JOB_TIMEOUT})"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            stale = requeue_stale_jobs(options["stale_after"])
+            if stale:
+                self.stdout.write(f"Requeued {stale} interrupted job(s)")
+        else:
+            room_ids = []
+            for alias in room_databases():
+                rooms = VotingRoom.objects.using(alias)
+                if options["rooms"]:
+                    rooms = rooms.filter(id__in=options["rooms"])
+                if options["active"]:
+                    rooms = rooms.filter(is_active=True)
+                room_ids.extend(rooms.values_list("id", flat=True))
+            for room_id in room_ids:
+                enqueue_ranking(room_id, full_rebuild=True)
+            self.stdout.write(f"Queued {len(room_ids)} room(s)")
+
+        def progress(done, total, room_id, ok):
+            status = "ok" if ok else self.style.ERROR("failed")
+            self.stdout.write(f"[{done}/{total}] {room_id} {status}")
+
+        processed = run_pending_jobs_parallel(
+            options["workers"], include_failed=options["resume"], progress=progress
+        )
+
+        failed = RankingJob.objects.filter(status=RankingJob.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {processed} room(s)"))
+        if failed:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{failed} room(s) failed, rerun with --resume to retry them"
+                )
+            )
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from voting.jobs import run_pending_jobs, run_pending_jobs_parallel
+
+
+class Command(BaseCommand):
+    help = "Process queued room ranking recomputes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue once and exit instead of polling forever",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty (default: 1)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Recompute rooms in this many processes (default: 1)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Ranking worker started")
+        while True:
+            close_old_connections()
+            if options["workers"] > 1:
+                processed = run_pending_jobs_parallel(options["workers"])
+            else:
+                processed = run_pending_jobs()
+            if processed:
+                self.stdout.write(f"Recomputed {processed} room ranking(s)")
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["interval"])
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from voting.benchmarks.sqlite_stress import PROFILES, run_stress
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent confirmations against a scratch SQLite database and "
+        "count 'database is locked' errors per database profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="append",
+            dest="profiles",
+            choices=list(PROFILES),
+            help="Database profile to test, may be repeated (default: all)",
+        )
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=200,
+            help="Confirmations per worker (default: 200)",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        report = []
+        for profile in options["profiles"] or list(PROFILES):
+            self.stderr.write(f"Stressing the {profile} profile")
+            report.append(
+                run_stress(
+                    profile,
+                    workers=options["workers"],
+                    transactions=options["transactions"],
+                    seed=options["seed"],
+                )
+            )
+        self.stdout.write(json.dumps(report, indent=2))
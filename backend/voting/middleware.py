@@ -1,6 +1,19 @@
 # voting/middleware.py
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
 
+from voting.query_budget import (
+    QueryBudgetExceeded,
+    QueryCounter,
+    count_queries,
+    get_query_budget,
+)
+
+logger = logging.getLogger(__name__)
+
 
 class FingerprintMiddleware:
     def __init__(self, get_response):
@@ -19,3 +32,37 @@ class FingerprintMiddleware:
     @staticmethod
     def is_valid_fingerprint(fp):
         return fp and len(fp) == 32  # Add more checks as needed
+
+
+class QueryBudgetMiddleware:
+    """
+    Debug-only check of the budgets declared with
+    ``voting.query_budget.query_budget``.
+
+    Requests that go over their view's budget are logged, or fail with
+    ``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT`` is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with count_queries(counter):
+            response = self.get_response(request)
+
+        budget = getattr(request, "_query_budget", None)
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path} ran {counter.count} queries, "
+                f"budget is {budget}"
+            )
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_query_budget(view_func, request.method)
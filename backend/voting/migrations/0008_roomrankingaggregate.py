@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0007_nickname'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomRankingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('histogram', models.JSONField(default=dict)),
+                ('ballot_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking_aggregate', to='voting.votingroom')),
+            ],
+        ),
+    ]
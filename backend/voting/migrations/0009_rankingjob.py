@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_roomrankingaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('requested', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('full_rebuild', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking_job', to='voting.votingroom')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'requested_at'], name='voting_rank_status_125de0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0009_rankingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votingroom',
+            name='ballot_revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:05
+
+import struct
+
+from django.db import migrations, models
+
+
+def encode_vote_data(vote_data, slot_by_object_id):
+    # Frozen copy of voting.codecs.encode_vote_data: little-endian uint16 slots
+    positions = sorted(vote_data.items(), key=lambda item: int(item[1]))
+    try:
+        slots = [slot_by_object_id[str(obj_id)] for obj_id, _ in positions]
+    except KeyError:
+        return None
+    return struct.pack(f"<{len(slots)}H", *slots)
+
+
+def assign_slots_and_encode_ballots(apps, schema_editor):
+    VotingObject = apps.get_model("voting", "VotingObject")
+    RoomParticipant = apps.get_model("voting", "RoomParticipant")
+    db_alias = schema_editor.connection.alias
+
+    slots_by_room = {}
+    objects = list(VotingObject.objects.using(db_alias).order_by("room_id", "id"))
+    for obj in objects:
+        room_slots = slots_by_room.setdefault(obj.room_id, {})
+        obj.slot = len(room_slots)
+        room_slots[str(obj.id)] = obj.slot
+    VotingObject.objects.using(db_alias).bulk_update(objects, ["slot"], batch_size=500)
+
+    participants = []
+    voted = RoomParticipant.objects.using(db_alias).exclude(vote_data=None)
+    for participant in voted.iterator():
+        if participant.vote_data:
+            participant.ballot = encode_vote_data(
+                participant.vote_data, slots_by_room.get(participant.room_id, {})
+            )
+            participants.append(participant)
+    RoomParticipant.objects.using(db_alias).bulk_update(
+        participants, ["ballot"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0010_votingroom_ballot_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomparticipant',
+            name='ballot',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='votingobject',
+            name='slot',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            assign_slots_and_encode_ballots, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='votingobject',
+            name='slot',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='votingobject',
+            constraint=models.UniqueConstraint(fields=('room', 'slot'), name='unique_room_slot'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0011_compact_ballots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votingroom',
+            name='ranking_method',
+            field=models.CharField(choices=[('skating', 'Skating system'), ('borda', 'Borda count'), ('schulze', 'Schulze method'), ('copeland', 'Copeland method')], default='skating', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0012_votingroom_ranking_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomparticipant',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
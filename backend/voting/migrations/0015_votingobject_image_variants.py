@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0014_unconstrained_room_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votingobject',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+def start_after_used_slots(apps, schema_editor):
+    VotingObject = apps.get_model("voting", "VotingObject")
+    VotingRoom = apps.get_model("voting", "VotingRoom")
+    db_alias = schema_editor.connection.alias
+
+    last_slots = (
+        VotingObject.objects.using(db_alias)
+        .values("room_id")
+        .annotate(last=models.Max("slot"))
+    )
+    for row in last_slots:
+        VotingRoom.objects.using(db_alias).filter(pk=row["room_id"]).update(
+            next_slot=row["last"] + 1
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0015_votingobject_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votingroom',
+            name='next_slot',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(start_after_used_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0016_votingroom_next_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingjob',
+            name='stability',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0017_rankingjob_stability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingjob',
+            name='variants',
+            field=models.BooleanField(default=False),
+        ),
+    ]
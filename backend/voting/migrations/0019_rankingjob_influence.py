@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0018_rankingjob_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingjob',
+            name='influence',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0019_rankingjob_influence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingjob',
+            name='ranking',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -1,10 +1,19 @@
 import uuid
 
-from django.db import models
+from django.db import models, router, transaction
 from users.models import CustomUser
 
+from voting.sharding import RoomShardQuerySet
+
 
 class VotingRoom(models.Model):
+    RANKING_METHOD_CHOICES = [
+        ("skating", "Skating system"),
+        ("borda", "Borda count"),
+        ("schulze", "Schulze method"),
+        ("copeland", "Copeland method"),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -12,10 +21,31 @@ class VotingRoom(models.Model):
     is_active = models.BooleanField(default=True)
     participants = models.ManyToManyField(CustomUser, through="RoomParticipant")
     final_results = models.JSONField(blank=True, null=True)  # Add this field if missing
+    ranking_method = models.CharField(
+        max_length=20, choices=RANKING_METHOD_CHOICES, default="skating"
+    )
+    # Bumped on every RoomParticipant change, see voting.signals
+    ballot_revision = models.PositiveIntegerField(default=0, editable=False)
+    # Slot of the room's next new object. Slots are never reused: packed ballots
+    # would otherwise credit a deleted object's votes to its successor
+    next_slot = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RoomShardQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def reserve_slots(cls, room_id, count: int = 1, using=None) -> int:
+        """Take ``count`` consecutive object slots of a room, return the first."""
+        rooms = cls.objects.filter(pk=room_id)
+        if using is not None:
+            rooms = rooms.using(using)
+        with transaction.atomic(using=rooms.db):
+            first = rooms.select_for_update().values_list("next_slot", flat=True).get()
+            rooms.update(next_slot=models.F("next_slot") + count)
+        return first
+
 
 class VotingObject(models.Model):
     room = models.ForeignKey(VotingRoom, on_delete=models.CASCADE)
@@ -23,18 +53,44 @@ class VotingObject(models.Model):
     content = models.TextField(help_text="HTML/Markdown content", blank=True)
     image = models.ImageField(upload_to="objects/")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Index of the object within its room, used by the packed RoomParticipant.ballot
+    slot = models.PositiveIntegerField(editable=False)
+    # Resized WebP/AVIF/JPEG copies of the image, see voting.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = RoomShardQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["room", "slot"], name="unique_room_slot")
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.room.name})"
 
+    def save(self, *args, **kwargs):
+        if self.slot is None:
+            using = kwargs.get("using") or router.db_for_write(
+                VotingObject, instance=self
+            )
+            self.slot = VotingRoom.reserve_slots(self.room_id, using=using)
+        super().save(*args, **kwargs)
+
 
 class RoomParticipant(models.Model):
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Users stay in the default database when rooms are sharded
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_constraint=False)
     room = models.ForeignKey(VotingRoom, on_delete=models.CASCADE)
     vote_confirmed = models.BooleanField(default=False)
     vote_data = models.JSONField(blank=True, null=True)
+    # vote_data packed with voting.codecs, set when the vote is confirmed
+    ballot = models.BinaryField(blank=True, null=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
     comments = models.TextField(blank=True)
+    # Bumped on every draft change, the client echoes it back with its deltas
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RoomShardQuerySet.as_manager()
 
     class Meta:
         unique_together = ("user", "room")
@@ -43,6 +99,74 @@ class RoomParticipant(models.Model):
         return f"{self.user} in {self.room}"
 
 
+class RoomRankingAggregate(models.Model):
+    """Running rank-count histogram of a room's confirmed ballots."""
+
+    room = models.OneToOneField(
+        VotingRoom, on_delete=models.CASCADE, related_name="ranking_aggregate"
+    )
+    # {object_id: [ballots placing it 1st, 2nd, ...]}
+    histogram = models.JSONField(default=dict)
+    ballot_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RoomShardQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Ranking aggregate for {self.room}"
+
+
+class RankingJob(models.Model):
+    """
+    Pending ranking recompute for a room.
+
+    There is at most one job per room: marking a room dirty again while its job
+    is pending or running only bumps ``requested``, so repeated marks collapse
+    into a single recompute.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    # The job queue stays in the default database when rooms are sharded
+    room = models.OneToOneField(
+        VotingRoom,
+        on_delete=models.CASCADE,
+        related_name="ranking_job",
+        db_constraint=False,
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    requested = models.PositiveIntegerField(default=0)  # dirty marks so far
+    processed = models.PositiveIntegerField(default=0)  # marks covered by a recompute
+    # False for a job that only resizes images and leaves the ranking alone
+    ranking = models.BooleanField(default=True)
+    full_rebuild = models.BooleanField(default=False)
+    # Also bootstrap the placement intervals served by ?stability=1
+    stability = models.BooleanField(default=False)
+    # Also cache the leave-one-out ballot influence report
+    influence = models.BooleanField(default=False)
+    # Also resize the room's images that have no variants yet (voting.images)
+    variants = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "requested_at"])]
+
+    def __str__(self):
+        return f"Ranking job for {self.room} ({self.status})"
+
+
 class NickName(models.Model):
     name = models.CharField(max_length=200)
     fingerprint = models.CharField(max_length=255, unique=True)  # Added unique
@@ -0,0 +1,202 @@
+"""
+Bulk creation of attendees from a roster.
+
+A roster is a CSV file with a header row, or a JSONL file with one object per
+line, with the fields ``username`` (required), ``first_name``, ``last_name``,
+``email`` and ``rooms`` (room IDs: a list in JSONL, separated by spaces or
+``;`` in CSV).
+
+:func:`provision_users` loads the taken usernames and user IDs once, generates
+the new user IDs in memory (:func:`users.models.generate_user_ids`) and
+inserts users, their API tokens and their room participations with
+``bulk_create``, one transaction per batch that spans the default database
+and the room databases. ``CustomUser.save()`` and the
+``post_save`` signals don't run for these rows.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import re
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser, generate_user_ids
+
+from voting.models import RoomParticipant, VotingRoom
+from voting.realtime import publish_room_update
+from voting.sharding import room_databases
+
+BATCH_SIZE = 1000
+
+
+@dataclass
+class RosterEntry:
+    username: str
+    first_name: str = ""
+    last_name: str = ""
+    email: str = ""
+    rooms: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ProvisionResult:
+    # (username, user_id, token key) of every created user
+    created: List[Tuple[str, str, str]] = field(default_factory=list)
+    # Usernames already taken, in the database or earlier in the roster
+    skipped: List[str] = field(default_factory=list)
+    participations: int = 0
+
+
+def _entry(row: Dict, line: int) -> RosterEntry:
+    username = str(row.get("username") or "").strip()
+    if not username:
+        raise ValueError(f"Line {line}: missing username")
+    rooms = row.get("rooms") or []
+    if isinstance(rooms, str):
+        rooms = re.split(r"[;\s]+", rooms.strip())
+    return RosterEntry(
+        username=username,
+        first_name=str(row.get("first_name") or "").strip(),
+        last_name=str(row.get("last_name") or "").strip(),
+        email=str(row.get("email") or "").strip(),
+        rooms=[str(room) for room in rooms if room],
+    )
+
+
+def read_roster(stream: io.TextIOBase, fmt: str) -> List[RosterEntry]:
+    """Parse a roster in ``fmt`` ("csv" or "jsonl"). Raises ``ValueError``."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        return [_entry(row, line) for line, row in enumerate(reader, start=2)]
+    if fmt == "jsonl":
+        entries = []
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"Line {line}: {exc}") from exc
+            if not isinstance(row, dict):
+                raise ValueError(f"Line {line}: expected an object")
+            entries.append(_entry(row, line))
+        return entries
+    raise ValueError(f"Unknown roster format {fmt!r}")
+
+
+def _locate_rooms(room_ids: Set[str]) -> Dict[str, str]:
+    """Map every existing room in ``room_ids`` to the database holding it."""
+    try:
+        ids = {uuid.UUID(room_id) for room_id in room_ids}
+    except ValueError as exc:
+        raise ValueError(f"Invalid room ID: {exc}") from exc
+    # Rooms may sit outside their shard until rebalance_shards runs
+    located = {}
+    for alias in room_databases():
+        rooms = VotingRoom.objects.using(alias).filter(pk__in=ids)
+        located.update((str(pk), alias) for pk in rooms.values_list("pk", flat=True))
+    return located
+
+
+def _batches(items: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def provision_users(
+    entries: Sequence[RosterEntry],
+    rooms: Sequence[str] = (),
+    batch_size: int = BATCH_SIZE,
+) -> ProvisionResult:
+    """
+    Create a user with a token for every new username in ``entries`` and add
+    it to its rooms and to ``rooms``. Existing usernames are skipped. Raises
+    ``ValueError`` naming unknown rooms before anything is created.
+    """
+    result = ProvisionResult()
+    taken_usernames = set(CustomUser.objects.values_list("username", flat=True))
+    new_entries = []
+    for entry in entries:
+        if entry.username in taken_usernames:
+            result.skipped.append(entry.username)
+            continue
+        taken_usernames.add(entry.username)
+        new_entries.append(entry)
+
+    room_ids = {str(room) for room in rooms}
+    wanted = room_ids.union(*(entry.rooms for entry in new_entries))
+    located = _locate_rooms(wanted)
+    missing = wanted - located.keys()
+    if missing:
+        raise ValueError(f"Unknown room(s): {', '.join(sorted(missing))}")
+
+    taken_ids = set(
+        CustomUser.objects.exclude(user_id=None).values_list("user_id", flat=True)
+    )
+    user_ids = generate_user_ids(len(new_entries), taken_ids)
+    # No usable password: attendees log in with their user ID
+    password = make_password(None)
+    touched_rooms = set()
+
+    for batch in _batches(list(zip(new_entries, user_ids)), batch_size):
+        users = [
+            CustomUser(
+                username=entry.username,
+                first_name=entry.first_name,
+                last_name=entry.last_name,
+                email=entry.email,
+                user_id=user_id,
+                password=password,
+            )
+            for entry, user_id in batch
+        ]
+        participants = [
+            RoomParticipant(user=user, room_id=uuid.UUID(room_id))
+            for (entry, _), user in zip(batch, users)
+            for room_id in dict.fromkeys([*entry.rooms, *room_ids])
+        ]
+        by_database: Dict[str, List[RoomParticipant]] = {}
+        for participant in participants:
+            alias = located[str(participant.room_id)]
+            by_database.setdefault(alias, []).append(participant)
+
+        with ExitStack() as stack:
+            for alias in sorted({DEFAULT_DB_ALIAS, *by_database}):
+                stack.enter_context(transaction.atomic(using=alias))
+            CustomUser.objects.bulk_create(users)
+            if any(user.pk is None for user in users):
+                # Backends that can't return the inserted keys
+                pks = dict(
+                    CustomUser.objects.filter(
+                        username__in=[user.username for user in users]
+                    ).values_list("username", "pk")
+                )
+                for user in users:
+                    user.pk = pks[user.username]
+            tokens = [Token(key=Token.generate_key(), user=user) for user in users]
+            Token.objects.bulk_create(tokens)
+            for alias, group in by_database.items():
+                RoomParticipant.objects.using(alias).bulk_create(group)
+        touched_rooms.update(str(p.room_id) for p in participants)
+        result.participations += len(participants)
+        result.created.extend(
+            (user.username, user.user_id, token.key)
+            for user, token in zip(users, tokens)
+        )
+
+    # bulk_create skips the signal that invalidates cached results
+    for room_id in touched_rooms:
+        VotingRoom.objects.using(located[room_id]).filter(pk=room_id).update(
+            ballot_revision=F("ballot_revision") + 1
+        )
+        publish_room_update(room_id)
+    return result
@@ -0,0 +1,98 @@
+"""
+Per-view query budgets.
+
+Views declare how many SQL queries a request may take with
+:func:`query_budget`. :class:`voting.middleware.QueryBudgetMiddleware` checks
+them on every request in debug mode, and :class:`QueryBudgetTestMixin` checks
+them in tests, so N+1 regressions show up before they reach production.
+"""
+
+from __future__ import annotations
+
+from contextlib import ExitStack
+from typing import Optional
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries: int):
+    """
+    Declare the most queries a view may run per request, authentication
+    included. ``queries`` may be a callable for budgets that depend on the
+    settings.
+
+    Works on function views (above or below ``@api_view``), on viewset actions
+    and methods, and on view classes as the default for all their handlers.
+    """
+
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
+
+
+def get_query_budget(view_func, method: str) -> Optional[int]:
+    """The budget declared for the handler ``view_func`` runs for ``method``."""
+    budget = None
+    cls = getattr(view_func, "cls", None)
+    if cls is not None:
+        actions = getattr(view_func, "actions", None) or {}
+        handler = getattr(cls, actions.get(method.lower(), method.lower()), None)
+        budget = getattr(handler, "query_budget", None)
+        if budget is None:
+            budget = getattr(cls, "query_budget", None)
+    if budget is None:
+        budget = getattr(view_func, "query_budget", None)
+    return budget() if callable(budget) else budget
+
+
+class QueryCounter:
+    """``execute_wrapper`` hook counting the queries run on a connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def count_queries(counter: QueryCounter) -> ExitStack:
+    """Count the queries on every configured database while the stack is open."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(counter))
+    return stack
+
+
+class QueryBudgetTestMixin:
+    """``TestCase`` mixin checking requests against their view's budget."""
+
+    def assertWithinQueryBudget(self, method: str, path: str, *args, **kwargs):
+        """
+        Run ``self.client.<method>(path, ...)`` and fail if the view has no
+        budget or went over it. Returns the response.
+        """
+        budget = get_query_budget(resolve(path).func, method)
+        self.assertIsNotNone(budget, f"{path} declares no query budget")
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            response = getattr(self.client, method.lower())(path, *args, **kwargs)
+        queries = [query["sql"] for context in captured for query in context]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{method} {path} ran {len(queries)} queries, budget is {budget}:\n"
+            + "\n".join(queries),
+        )
+        return response
@@ -0,0 +1,145 @@
+"""
+Realtime room updates.
+
+When a room's ballots change, :func:`publish_room_update` sends the room ID
+and its new ballot revision to the room's channel group, leaving the results
+off the write path. Every WebSocket following the room
+(:class:`evaluator.consumers.RankingConsumer`), and the room's Server-Sent
+Events producer (:mod:`voting.streams`), then sends :func:`latest_room_update`:
+the participation progress and the cached results, serialized once per
+revision in each process and shared by all of its followers.
+
+The in-memory channel layer only reaches consumers in the same process, which
+is enough for a single server. ``CHANNEL_LAYER_BACKEND`` and
+``CHANNEL_LAYER_HOSTS`` switch to a shared layer (e.g. Redis) for several.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Q
+
+from voting.service import cached_room_results, stored_room_results
+from voting.sharding import room_db
+
+ROOM_UPDATE = "room.update"
+# Rooms whose latest update each process keeps for its followers
+UPDATE_CACHE_SIZE = 256
+
+_updates: OrderedDict[str, Tuple[int, str]] = OrderedDict()
+_updates_lock = threading.Lock()
+
+
+def room_group(room_id) -> str:
+    return f"room_{room_id}"
+
+
+def can_follow_room(user, room_id) -> bool:
+    """Only a room's participants and staff may follow its updates."""
+    from voting.models import RoomParticipant
+
+    if user is None or not user.is_authenticated:
+        return False
+    return (
+        user.is_staff
+        or RoomParticipant.objects.filter(room_id=room_id, user=user).exists()
+    )
+
+
+def room_progress(room_id) -> Dict[str, int]:
+    """How many participants the room has and how many confirmed their vote."""
+    from voting.models import RoomParticipant
+
+    return RoomParticipant.objects.filter(room_id=room_id).aggregate(
+        participants=Count("id"),
+        confirmed=Count("id", filter=Q(vote_confirmed=True)),
+    )
+
+
+def room_update(room_id) -> Optional[str]:
+    """The serialized update for the room's current ballot revision."""
+    from voting.models import VotingRoom
+
+    room = (
+        VotingRoom.objects.filter(id=room_id)
+        .only("id", "ballot_revision", "ranking_method")
+        .first()
+    )
+    if room is None:
+        return None
+    update = {
+        "type": ROOM_UPDATE,
+        "room": str(room.id),
+        "revision": room.ballot_revision,
+        "method": room.ranking_method,
+        **room_progress(room.id),
+        "results": cached_room_results(room, room.ballot_revision),
+    }
+    if update["results"] is None:
+        # The ranking worker publishes again once it has recomputed them
+        update["results"] = stored_room_results(room)
+        update["pending"] = True
+    return json.dumps(update, cls=DjangoJSONEncoder)
+
+
+def latest_room_update(room_id, revision: int) -> Optional[str]:
+    """
+    :func:`room_update` for ``revision`` or later, built once in this process
+    whatever the number of followers.
+    """
+    key = str(room_id)
+    with _updates_lock:
+        cached = _updates.get(key)
+        if cached is not None and cached[0] >= revision:
+            _updates.move_to_end(key)
+            return cached[1]
+    text = room_update(room_id)
+    if text is None:
+        return None
+    update = json.loads(text)
+    if update.get("pending"):
+        return text
+    with _updates_lock:
+        cached = _updates.get(key)
+        latest = update["revision"]
+        if cached is None or cached[0] < latest:
+            _updates[key] = (latest, text)
+            _updates.move_to_end(key)
+            while len(_updates) > UPDATE_CACHE_SIZE:
+                _updates.popitem(last=False)
+    return text
+
+
+def publish_room_update(room_id) -> None:
+    """Tell everyone following the room that its ballots changed."""
+    from voting.models import VotingRoom
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    group = room_group(room_id)
+    # Nobody in this process is listening, don't query for nothing
+    if isinstance(layer, InMemoryChannelLayer) and not layer.groups.get(group):
+        return
+    revision = (
+        VotingRoom.objects.filter(id=room_id)
+        .values_list("ballot_revision", flat=True)
+        .first()
+    )
+    if revision is not None:
+        async_to_sync(layer.group_send)(
+            group, {"type": ROOM_UPDATE, "room": str(room_id), "revision": revision}
+        )
+
+
+def publish_room_update_on_commit(room) -> None:
+    """:func:`publish_room_update` once the current transaction commits."""
+    transaction.on_commit(lambda: publish_room_update(room.pk), using=room_db(room))
@@ -0,0 +1,334 @@
+"""
+Import rooms and their voting objects from a manifest.
+
+A manifest is a JSON or YAML document (YAML needs PyYAML, the ``yaml`` extra)
+holding a list of rooms, or ``{"rooms": [...]}``::
+
+    rooms:
+      - name: Cat of the Year
+        id: 1b4e28ba-2fa1-11d2-883f-0016d3cca427   # optional
+        description: ...
+        ranking_method: skating
+        is_active: true
+        objects:
+          - title: Tom
+            image: tom.jpg        # relative to the image directory
+            content: ...
+
+Imports are idempotent. A room is identified by its ``id``, or else by a UUID
+derived from its name, and an object by its title within the room: running
+the import again updates them instead of adding copies. Objects missing from
+the manifest are left alone, since ballots may refer to them.
+
+Images are checked with Pillow and stored under a name derived from their
+content by a pool of worker processes, before the database work starts, so an
+unchanged image is neither stored again nor counted as a change. Rooms and
+objects are then written with ``bulk_create``/``bulk_update`` in one
+transaction per room database, and the resized variants of new or changed
+images (:mod:`voting.images`) are made by the same number of processes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from PIL import Image, UnidentifiedImageError
+
+from voting.images import backfill_variants, needs_variants
+from voting.jobs import enqueue_ranking
+from voting.models import VotingObject, VotingRoom
+from voting.sharding import room_databases, shard_for_room
+
+# Namespace of the room IDs derived from room names
+ROOM_NAMESPACE = uuid.UUID("6f0e7d3c-54b4-4c1e-9d8a-2f7c1b9e4a10")
+ROOM_FIELDS = ("name", "description", "ranking_method", "is_active")
+IMAGE_DIR = "objects"
+
+
+@dataclass
+class ObjectSpec:
+    title: str
+    image: str
+    content: str = ""
+
+
+@dataclass
+class RoomSpec:
+    id: uuid.UUID
+    fields: Dict[str, object]
+    objects: List[ObjectSpec] = field(default_factory=list)
+
+
+@dataclass
+class ImportResult:
+    rooms_created: int = 0
+    rooms_updated: int = 0
+    objects_created: int = 0
+    objects_updated: int = 0
+    images_stored: int = 0
+    variants_generated: int = 0
+    # Images whose variants failed, generate_image_variants can retry
+    variant_errors: List[str] = field(default_factory=list)
+
+
+def load_manifest(path: Path) -> List[Dict]:
+    """The list of rooms in a ``.json``, ``.yaml`` or ``.yml`` manifest."""
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML manifests need PyYAML: pip install pyyaml")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as exc:
+            raise ValueError(f"Invalid YAML: {exc}") from exc
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON: {exc}") from exc
+    if isinstance(data, dict):
+        data = data.get("rooms")
+    if not isinstance(data, list):
+        raise ValueError("The manifest must be a list of rooms or have a 'rooms' list")
+    return data
+
+
+def parse_rooms(data: Sequence[Dict]) -> List[RoomSpec]:
+    """Validate the manifest's rooms. Raises ``ValueError``."""
+    methods = {choice for choice, _ in VotingRoom.RANKING_METHOD_CHOICES}
+    rooms: Dict[uuid.UUID, RoomSpec] = {}
+    for index, room in enumerate(data, start=1):
+        name = str(room.get("name") or "").strip() if isinstance(room, dict) else ""
+        if not name:
+            raise ValueError(f"Room {index}: missing name")
+        try:
+            room_id = (
+                uuid.UUID(str(room["id"]))
+                if room.get("id")
+                else uuid.uuid5(ROOM_NAMESPACE, name)
+            )
+        except ValueError:
+            raise ValueError(f"Room {name!r}: invalid id {room['id']!r}")
+        if room_id in rooms:
+            raise ValueError(f"Room {name!r} appears twice")
+
+        fields = {key: room[key] for key in ROOM_FIELDS if key in room}
+        fields["name"] = name
+        if fields.get("ranking_method", "skating") not in methods:
+            raise ValueError(
+                f"Room {name!r}: unknown ranking method {fields['ranking_method']!r}"
+            )
+
+        objects: Dict[str, ObjectSpec] = {}
+        for obj in room.get("objects") or []:
+            title = str(obj.get("title") or "").strip()
+            if not title or not obj.get("image"):
+                raise ValueError(f"Room {name!r}: objects need a title and an image")
+            if title in objects:
+                raise ValueError(f"Room {name!r}: object {title!r} appears twice")
+            objects[title] = ObjectSpec(
+                title=title, image=str(obj["image"]), content=obj.get("content") or ""
+            )
+        rooms[room_id] = RoomSpec(room_id, fields, list(objects.values()))
+    return list(rooms.values())
+
+
+def store_image(path: str) -> Tuple[str, bool]:
+    """
+    Check that ``path`` is an image and store it under a name derived from its
+    content, unless an identical file is already stored. Returns the name and
+    whether the file was stored now.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            digest.update(chunk)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError) as exc:
+        raise ValueError(f"{path}: not a valid image ({exc})") from exc
+
+    name = f"{IMAGE_DIR}/{digest.hexdigest()[:32]}{Path(path).suffix.lower()}"
+    if default_storage.exists(name):
+        return name, False
+    with open(path, "rb") as source:
+        return default_storage.save(name, File(source)), True
+
+
+def _init_image_worker():
+    import django
+
+    django.setup()
+
+
+def store_images(
+    paths: Iterable[str], workers: Optional[int] = None
+) -> Dict[str, Tuple[str, bool]]:
+    """:func:`store_image` for every path, in a pool of ``workers`` processes."""
+    paths = list(dict.fromkeys(paths))
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return {path: store_image(path) for path in paths}
+    # Never share the parent's database connections with a forked child
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_image_worker
+    ) as executor:
+        return dict(zip(paths, executor.map(store_image, paths)))
+
+
+def import_rooms(
+    rooms: Sequence[RoomSpec], image_dir: Path, workers: Optional[int] = None
+) -> ImportResult:
+    """Create or update ``rooms`` and their objects. Raises ``ValueError``."""
+    result = ImportResult()
+    sources = {}
+    for room in rooms:
+        for obj in room.objects:
+            path = (image_dir / obj.image).resolve()
+            if not path.is_file():
+                raise ValueError(f"Image not found: {path}")
+            sources[room.id, obj.title] = str(path)
+    stored = store_images(sources.values(), workers)
+    result.images_stored = sum(created for _, created in stored.values())
+    images = {key: stored[path][0] for key, path in sources.items()}
+
+    # Imported rooms may sit outside their shard until rebalance_shards runs
+    located = {}
+    for alias in room_databases():
+        located.update(
+            (room.pk, room)
+            for room in VotingRoom.objects.using(alias).filter(
+                pk__in=[spec.id for spec in rooms]
+            )
+        )
+    databases = {
+        located[spec.id]._state.db if spec.id in located else shard_for_room(spec.id)
+        for spec in rooms
+    }
+
+    with ExitStack() as stack:
+        for alias in sorted(databases):
+            stack.enter_context(transaction.atomic(using=alias))
+        saved = _write_rooms(rooms, located, result)
+        changed = _write_objects(rooms, saved, images, result)
+
+    # bulk_create/bulk_update skip the post_save handler that makes variants
+    for _, error in backfill_variants(changed, workers=workers):
+        if error:
+            result.variant_errors.append(error)
+        else:
+            result.variants_generated += 1
+    return result
+
+
+def _write_rooms(rooms, located, result) -> Dict[uuid.UUID, VotingRoom]:
+    created, updated, rebuild = [], {}, []
+    for spec in rooms:
+        room = located.get(spec.id)
+        if room is None:
+            created.append(VotingRoom(id=spec.id, **spec.fields))
+            continue
+        changed = [
+            key for key, value in spec.fields.items() if getattr(room, key) != value
+        ]
+        if not changed:
+            continue
+        if "ranking_method" in changed:
+            rebuild.append(room.pk)
+        for key in changed:
+            setattr(room, key, spec.fields[key])
+        updated.setdefault(room._state.db, []).append(room)
+
+    VotingRoom.objects.bulk_create(created)
+    for alias, group in updated.items():
+        VotingRoom.objects.using(alias).bulk_update(group, ROOM_FIELDS)
+    for room_id in rebuild:
+        transaction.on_commit(
+            lambda room_id=room_id: enqueue_ranking(room_id, full_rebuild=True)
+        )
+    result.rooms_created = len(created)
+    result.rooms_updated = sum(len(group) for group in updated.values())
+    return {**located, **{room.pk: room for room in created}}
+
+
+def _write_objects(rooms, saved, images, result) -> List[Tuple[str, int]]:
+    existing = {}
+    room_ids_by_db: Dict[str, List[uuid.UUID]] = {}
+    for spec in rooms:
+        room_ids_by_db.setdefault(saved[spec.id]._state.db, []).append(spec.id)
+    for alias, room_ids in room_ids_by_db.items():
+        objects = VotingObject.objects.using(alias).filter(room_id__in=room_ids)
+        for obj in objects:
+            existing[obj.room_id, obj.title] = obj
+
+    # bulk_create skips VotingObject.save(), which reserves the slot
+    next_slot = {}
+    for spec in rooms:
+        new = sum((spec.id, obj.title) not in existing for obj in spec.objects)
+        if new:
+            next_slot[spec.id] = VotingRoom.reserve_slots(
+                spec.id, new, using=saved[spec.id]._state.db
+            )
+
+    created: Dict[str, List[VotingObject]] = {}
+    updated: Dict[str, List[VotingObject]] = {}
+    changed_rooms: Dict[str, set] = {}
+    for spec in rooms:
+        room = saved[spec.id]
+        alias = room._state.db
+        for obj_spec in spec.objects:
+            image = images[spec.id, obj_spec.title]
+            obj = existing.get((spec.id, obj_spec.title))
+            if obj is None:
+                slot = next_slot[spec.id]
+                next_slot[spec.id] = slot + 1
+                obj = VotingObject(
+                    room=room,
+                    title=obj_spec.title,
+                    content=obj_spec.content,
+                    image=image,
+                    slot=slot,
+                )
+                created.setdefault(alias, []).append(obj)
+            elif obj.content != obj_spec.content or obj.image.name != image:
+                obj.content = obj_spec.content
+                obj.image = image
+                updated.setdefault(alias, []).append(obj)
+            else:
+                continue
+            changed_rooms.setdefault(alias, set()).add(spec.id)
+
+    for alias, objects in created.items():
+        VotingObject.objects.using(alias).bulk_create(objects)
+    for alias, objects in updated.items():
+        VotingObject.objects.using(alias).bulk_update(objects, ["content", "image"])
+    # Cached results list object titles and images
+    for alias, room_ids in changed_rooms.items():
+        VotingRoom.objects.using(alias).filter(pk__in=room_ids).update(
+            ballot_revision=F("ballot_revision") + 1
+        )
+    result.objects_created = sum(len(objects) for objects in created.values())
+    result.objects_updated = sum(len(objects) for objects in updated.values())
+    return [
+        (alias, obj.pk)
+        for group in (created, updated)
+        for alias, objects in group.items()
+        for obj in objects
+        if needs_variants(obj)
+    ]
@@ -1,27 +1,27 @@
 from rest_framework import serializers
 
+from .images import needs_variants, picture
 from .models import NickName, VotingObject, VotingRoom
 
 
 class VotingRoomSerializer(serializers.ModelSerializer):
-    participants_count = serializers.SerializerMethodField()
+    # Annotated by the views, see VotingRoomViewSet.get_queryset
+    participants_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = VotingRoom
         fields = ["id", "name", "description", "is_active", "participants_count"]
 
-    def get_participants_count(self, obj):
-        return obj.participants.count()
-
 
 class VotingObjectSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source="title")  # Map title to name for frontend
     description = serializers.CharField(source="content")  # Map content to description
     image_url = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = VotingObject
-        fields = ["id", "name", "description", "image_url", "room"]
+        fields = ["id", "name", "description", "image_url", "image", "room"]
 
     def get_image_url(self, obj):
         if obj.image:
@@ -31,6 +31,20 @@ class VotingObjectSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image(self, obj):
+        """Resized variants as srcset strings, None until they are generated."""
+        if not obj.image or needs_variants(obj):
+            return None
+        storage = obj.image.storage
+        request = self.context.get("request")
+
+        def url(name):
+            if request:
+                return request.build_absolute_uri(storage.url(name))
+            return storage.url(name)
+
+        return picture(obj.image_variants, url)
+
 
 # DiscoCatDjango/backend/voting/serializers.py
 class NickNameSerializer(serializers.ModelSerializer):
@@ -1,7 +1,54 @@
 from __future__ import annotations
 
+import heapq
 import math
-from typing import Any, Dict, List, Tuple, Union, cast
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from voting.codecs import BALLOT_DTYPE, MAX_SLOT, decode_ballot
+from voting.engines import (
+    BallotMatrices,
+    build_matrices,
+    get_ranking_method,
+    register_method,
+    restrict,
+)
+from voting.sharding import room_db
+
+SkatingEngine = Callable[[List[List[str]]], List[Tuple[str, int]]]
+
+# Default ranking method, the only one the incremental aggregate can serve
+SKATING = "skating"
+
+# Revisions only ever move forward, so cached results just need to outlive
+# spectators polling the same revision
+RESULTS_CACHE_TIMEOUT = 60 * 60
+
+# Leaderboard lengths cached apart from the full results, see
+# get_room_leaderboard
+LEADERBOARD_SIZES = (10, 25, 50, 100)
+
+# Confirmed ballots fetched per database round trip when streaming
+BALLOT_CHUNK_SIZE = 2000
+
+# Rank-count histogram: object ID -> number of ballots placing it at rank 1, 2, ...
+Histogram = Dict[str, List[int]]
 
 
 def calculate_room_ranking(room) -> Dict[str, Dict[str, object]]:
@@ -13,70 +60,321 @@ def calculate_room_ranking(room) -> Dict[str, Dict[str, object]]:
     - Tie breaking with proper competition-style ranking
     - Majority consensus rather than simple averages
 
+    This is the full recompute: it re-reads every confirmed ballot and also
+    rebuilds the room's ``RoomRankingAggregate``, so it doubles as the repair path
+    for the incremental updates done by :func:`apply_ballot_delta` and
+    :func:`refresh_room_ranking`.
+
     Returns a dictionary mapping object IDs to their ranking details.
     """
-    from voting.models import RoomParticipant, VotingObject
+    method = getattr(room, "ranking_method", SKATING)
+    if method != SKATING:
+        return _calculate_with_method(room, method)
+
+    object_id_to_title, slot_by_object_id = get_room_objects(room)
+    object_id_by_slot = {slot: obj_id for obj_id, slot in slot_by_object_id.items()}
+
+    # Ballot-based engines (the pure Python reference) need every ballot in
+    # memory, the default engine ranks straight from the streamed counts.
+    engine_name = getattr(settings, "VOTING_SKATING_ENGINE", "numpy")
+    keep_ballots = engine_name != "numpy"
+
+    # Read the ballots and replace the aggregate in one transaction so a
+    # concurrent apply_ballot_delta() cannot be lost or counted twice.
+    with transaction.atomic(using=room_db(room)):
+        slot_ballots = iter_confirmed_ballots(room, slot_by_object_id)
+        if keep_ballots:
+            slot_ballots = list(slot_ballots)
+        counts, ballot_count = slot_rank_counts(slot_ballots)
+        histogram = histogram_from_slot_counts(counts, object_id_by_slot)
+        _save_aggregate(room, histogram, ballot_count)
+
+    if not ballot_count:
+        # No valid ballots found
+        return _store_results(room, {})
 
-    confirmed_rankings = RoomParticipant.objects.filter(room=room, vote_confirmed=True)
+    if keep_ballots:
+        ballots = [
+            [object_id_by_slot[slot] for slot in ballot.tolist()]
+            for ballot in slot_ballots
+        ]
+        skating_results = get_skating_engine(engine_name)(ballots)
+        results = build_results(skating_results, histogram, object_id_to_title)
+    else:
+        results = rank_from_histogram(histogram, object_id_to_title)
+    return _store_results(room, results)
+
+
+def _calculate_with_method(room, method: str) -> Dict[str, Dict[str, object]]:
+    """Full recompute with one of the pairwise ranking methods."""
+    rank = get_ranking_method(method)
+    object_id_to_title, slot_by_object_id = get_room_objects(room)
+    object_id_by_slot = {slot: obj_id for obj_id, slot in slot_by_object_id.items()}
+    n_slots = max(slot_by_object_id.values(), default=-1) + 1
+
+    with transaction.atomic(using=room_db(room)):
+        matrices = build_matrices(
+            iter_confirmed_ballots(room, slot_by_object_id), n_slots
+        )
+        histogram = histogram_from_slot_counts(matrices.counts, object_id_by_slot)
+        _save_aggregate(room, histogram, matrices.ballot_count)
 
-    if not confirmed_rankings.exists():
-        # No confirmed rankings yet
-        if hasattr(room, "final_results"):
-            room.final_results = {}
-            room.save()
-        return {}
+    if not matrices.ballot_count:
+        return _store_results(room, {})
+
+    present = np.asarray(sorted(object_id_by_slot), dtype=np.int64)
+    order, places = rank(restrict(matrices, present))
+    placements = [
+        (object_id_by_slot[int(present[i])], int(place))
+        for i, place in zip(order, places)
+    ]
+    return _store_results(
+        room, build_results(placements, histogram, object_id_to_title)
+    )
 
-    # Get all objects in this room
-    objects = VotingObject.objects.filter(room=room)
-    object_id_to_title = {str(obj.id): obj.title for obj in objects}
 
-    # Convert participant vote data into ballots for the skating system
-    # Each ballot is a list of object IDs ranked from best to worst
-    ballots: List[List[str]] = []
+def iter_confirmed_ballots(
+    room, slot_by_object_id: Dict[str, int], chunk_size: int = BALLOT_CHUNK_SIZE
+) -> Iterator[np.ndarray]:
+    """
+    Yield the room's confirmed ballots one at a time as arrays of object slots
+    ordered from best to worst.
+
+    Only the packed ``ballot`` column is read, in chunks, so memory does not grow
+    with the number of ballots. ``vote_data`` is only read and parsed for
+    ballots that were never packed.
 
-    for ranking in confirmed_rankings:
-        if not ranking.vote_data:
+    Objects deleted since a ballot was cast are dropped and the objects below
+    them move up, so every engine ranks the same ballots.
+    """
+    from voting.models import RoomParticipant
+
+    live = np.zeros(MAX_SLOT + 1, dtype=bool)
+    live[list(slot_by_object_id.values())] = True
+    confirmed = RoomParticipant.objects.filter(room=room, vote_confirmed=True)
+    for packed in (
+        confirmed.filter(ballot__isnull=False)
+        .values_list("ballot", flat=True)
+        .iterator(chunk_size=chunk_size)
+    ):
+        ballot = decode_ballot(packed)
+        keep = live[ballot]
+        yield ballot if keep.all() else ballot[keep]
+
+    for vote_data in (
+        confirmed.filter(ballot__isnull=True)
+        .values_list("vote_data", flat=True)
+        .iterator(chunk_size=chunk_size)
+    ):
+        if vote_data:
+            # Objects deleted since the vote was cast have no slot any more
+            yield np.asarray(
+                [
+                    slot_by_object_id[obj_id]
+                    for obj_id in ballot_from_vote_data(vote_data)
+                    if obj_id in slot_by_object_id
+                ],
+                dtype=BALLOT_DTYPE,
+            )
+
+
+def slot_rank_counts(
+    ballots: Iterable[np.ndarray], chunk_size: int = BALLOT_CHUNK_SIZE
+) -> Tuple[np.ndarray, int]:
+    """
+    Count how many ballots place each slot at each rank.
+
+    Ballots are consumed in chunks and counted with one ``np.bincount`` per
+    chunk. Returns the slots x ranks count matrix and the number of ballots.
+    """
+    counts = np.zeros((0, 0), dtype=np.int64)
+    ballot_count = 0
+    iterator = iter(ballots)
+    while chunk := list(islice(iterator, chunk_size)):
+        chunk = [ballot for ballot in chunk if len(ballot)]
+        if not chunk:
             continue
+        lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk))
+        slots = np.concatenate(chunk).astype(np.int64)
+        ranks = np.arange(len(slots)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
 
-        # Convert the vote data format from {obj_id: position} to an ordered list
-        # First create a list of (object_id, position) tuples
-        positions = [
-            (obj_id, int(position)) for obj_id, position in ranking.vote_data.items()
-        ]
-        # Sort by position (ascending order - lower position is better)
-        positions.sort(key=lambda x: x[1])
-        # Extract just the object IDs in their ranked order
-        ballot = [obj_id for obj_id, _ in positions]
-        ballots.append(ballot)
-
-    # Use the skating system to determine the final rankings
-    if not ballots:
-        # No valid ballots found
-        if hasattr(room, "final_results"):
-            room.final_results = {}
-            room.save()
+        shape = (
+            max(counts.shape[0], int(slots.max()) + 1),
+            max(counts.shape[1], int(lengths.max())),
+        )
+        chunk_counts = np.bincount(
+            slots * shape[1] + ranks, minlength=shape[0] * shape[1]
+        ).reshape(shape)
+        chunk_counts[: counts.shape[0], : counts.shape[1]] += counts
+        counts = chunk_counts
+        ballot_count += len(chunk)
+    return counts, ballot_count
+
+
+def histogram_from_slot_counts(
+    counts: np.ndarray, object_id_by_slot: Dict[int, str]
+) -> Histogram:
+    """Convert a slots x ranks count matrix into an object ID keyed histogram."""
+    histogram: Histogram = {}
+    for slot in np.flatnonzero(counts.any(axis=1)).tolist():
+        obj_id = object_id_by_slot.get(slot)
+        if obj_id is not None:
+            row = counts[slot]
+            histogram[obj_id] = row[: np.flatnonzero(row)[-1] + 1].tolist()
+    return histogram
+
+
+def get_room_objects(room) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Return ``({object_id: title}, {object_id: slot})`` for the room without
+    loading full objects.
+    """
+    from voting.models import VotingObject
+
+    titles: Dict[str, str] = {}
+    slots: Dict[str, int] = {}
+    for obj_id, title, slot in VotingObject.objects.filter(room=room).values_list(
+        "id", "title", "slot"
+    ):
+        titles[str(obj_id)] = title
+        slots[str(obj_id)] = slot
+    return titles, slots
+
+
+def get_object_titles(room) -> Dict[str, str]:
+    """Map the room's object IDs to their titles without loading full objects."""
+    from voting.models import VotingObject
+
+    return {
+        str(obj_id): title
+        for obj_id, title in VotingObject.objects.filter(room=room).values_list(
+            "id", "title"
+        )
+    }
+
+
+def apply_ballot_delta(
+    room,
+    old_ballot: Optional[List[str]] = None,
+    new_ballot: Optional[List[str]] = None,
+):
+    """
+    Fold a single changed ballot into the room's stored rank-count histogram.
+
+    ``old_ballot`` is subtracted and ``new_ballot`` added. Placements are not
+    recomputed here, see :func:`refresh_room_ranking`. Returns the updated
+    ``RoomRankingAggregate``, or ``None`` when the room has no aggregate yet and
+    needs a full rebuild.
+    """
+    from voting.models import RoomRankingAggregate
+
+    with transaction.atomic(using=room_db(room)):
+        aggregate = (
+            RoomRankingAggregate.objects.select_for_update().filter(room=room).first()
+        )
+        if aggregate is None:
+            return None
+
+        histogram: Histogram = aggregate.histogram or {}
+        ballot_count = aggregate.ballot_count
+        if old_ballot:
+            add_ballot(histogram, old_ballot, -1)
+            ballot_count -= 1
+        if new_ballot:
+            add_ballot(histogram, new_ballot)
+            ballot_count += 1
+
+        aggregate.histogram = histogram
+        aggregate.ballot_count = ballot_count
+        aggregate.save(update_fields=["histogram", "ballot_count", "updated_at"])
+        return aggregate
+
+
+def refresh_room_ranking(room) -> Dict[str, Dict[str, object]]:
+    """
+    Recompute and store the room's final placements from its aggregate alone.
+
+    Falls back to the full :func:`calculate_room_ranking` when the room has no
+    aggregate yet.
+    """
+    from voting.models import RoomRankingAggregate
+
+    aggregate = RoomRankingAggregate.objects.filter(room=room).first()
+    # Only the skating placements can be derived from the rank counts alone
+    if aggregate is None or getattr(room, "ranking_method", SKATING) != SKATING:
+        return calculate_room_ranking(room)
+
+    results = rank_from_histogram(aggregate.histogram or {}, get_object_titles(room))
+    return _store_results(room, results)
+
+
+def ballot_from_vote_data(vote_data: Dict[str, Any]) -> List[str]:
+    """
+    Convert the vote data format from {obj_id: position} to a list of object IDs
+    ordered from best to worst.
+    """
+    # Sort by position (ascending order - lower position is better)
+    positions = sorted(vote_data.items(), key=lambda item: int(item[1]))
+    return [obj_id for obj_id, _ in positions]
+
+
+def add_ballot(histogram: Histogram, ballot: List[str], weight: int = 1) -> None:
+    """Add ``weight`` times the ballot's placements to the histogram in place."""
+    for rank, obj_id in enumerate(ballot):
+        counts = histogram.setdefault(obj_id, [])
+        if len(counts) <= rank:
+            counts.extend([0] * (rank + 1 - len(counts)))
+        counts[rank] += weight
+
+    # Drop objects that are no longer placed on any ballot
+    if weight < 0:
+        for obj_id in ballot:
+            if obj_id in histogram and not any(histogram[obj_id]):
+                del histogram[obj_id]
+
+
+def histogram_matrix(histogram: Histogram) -> Tuple[List[str], np.ndarray]:
+    """Return the histogram as (labels, dense couples x ranks count matrix)."""
+    labels = list(histogram)
+    max_rank = max((len(row) for row in histogram.values()), default=0)
+    counts = np.zeros((len(labels), max_rank), dtype=np.int64)
+    for i, row in enumerate(histogram.values()):
+        counts[i, : len(row)] = row
+    # Trailing ranks nobody was placed at do not exist on any ballot
+    while counts.shape[1] and not counts[:, -1].any():
+        counts = counts[:, :-1]
+    return labels, counts
+
+
+def rank_from_histogram(
+    histogram: Histogram, object_id_to_title: Dict[str, str]
+) -> Dict[str, Dict[str, Any]]:
+    """Compute the ranking details from a rank-count histogram alone."""
+    if not histogram:
         return {}
+    labels, counts = histogram_matrix(histogram)
+    order, places = skating_placements(counts)
+    skating_results = [(labels[i], int(place)) for i, place in zip(order, places)]
+    return build_results(skating_results, histogram, object_id_to_title)
 
-    skating_results = skating_system(ballots)
 
-    # Convert skating results to the required output format
+def build_results(
+    skating_results: List[Tuple[str, int]],
+    histogram: Histogram,
+    object_id_to_title: Dict[str, str],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Convert skating results to the stored ``final_results`` format.
+    """
     results: Dict[str, Dict[str, Any]] = {}
 
-    # Create a mapping of object_id -> details about votes
-    vote_details: Dict[str, Dict[str, int]] = {str(obj.id): {} for obj in objects}
-    for ballot in ballots:
-        for rank, obj_id in enumerate(ballot, start=1):
-            vote_details[obj_id][rank] = vote_details[obj_id].get(rank, 0) + 1
-
     # Process each object's skating result
     for obj_id, final_rank in skating_results:
-        # Calculate the average position from the raw vote data
-        positions = []
-        for rank, count in vote_details[obj_id].items():
-            positions.extend([rank] * count)
-
-        avg_position = sum(positions) / len(positions) if positions else 0
-        vote_count = len(positions)
+        # Calculate the average position from the vote counts
+        counts = histogram.get(obj_id, [])
+        vote_count = sum(counts)
+        position_sum = sum(rank * count for rank, count in enumerate(counts, start=1))
+        avg_position = position_sum / vote_count if vote_count else 0
 
         results[obj_id] = {
             "final_rank": final_rank,
@@ -85,35 +383,161 @@ def calculate_room_ranking(room) -> Dict[str, Dict[str, object]]:
             ),  # Round to 2 decimal places for readability
             "vote_count": vote_count,
             "title": object_id_to_title.get(obj_id, "Unknown"),
-            "vote_distribution": vote_details[
-                obj_id
-            ],  # Include detailed vote breakdown
+            "vote_distribution": {
+                rank: count for rank, count in enumerate(counts, start=1) if count
+            },  # Include detailed vote breakdown
         }
 
     # Include objects with no votes
-    for obj in objects:
-        obj_id = str(obj.id)
+    for obj_id, title in object_id_to_title.items():
         if obj_id not in results:
             results[obj_id] = {
                 "final_rank": len(skating_results)
                 + 1,  # Place after all ranked objects
                 "average_position": 0,
                 "vote_count": 0,
-                "title": obj.title,
+                "title": title,
                 "vote_distribution": {},
             }
 
     # Sort by final rank for consistency
-    sorted_results: Dict[str, Dict[str, Any]] = {
+    return {
         k: v for k, v in sorted(results.items(), key=lambda item: item[1]["final_rank"])
     }
 
+
+def _results_key(room, revision: int) -> str:
+    method = getattr(room, "ranking_method", SKATING)
+    return f"voting:results:{room.pk}:{method}:{revision}"
+
+
+def _results_list(ranking: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"id": obj_id, **details} for obj_id, details in ranking.items()]
+
+
+def cached_room_results(room, revision: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Return the room's ranking for the given ballot revision as a list ordered by
+    final rank, or ``None`` while the ranking worker recomputes it.
+
+    Results are computed from the room aggregate once per revision and kept in
+    the shared cache, so every worker serves the same payload. The other
+    methods, and rooms without an aggregate, need a full recompute: it is
+    queued for the ranking worker (marks collapse into one job) rather than
+    run by the request, and the worker caches its results.
+    """
+    from voting.jobs import enqueue_ranking
+    from voting.models import RoomRankingAggregate
+
+    key = _results_key(room, revision)
+    results = cache.get(key)
+    if results is not None:
+        return results
+    aggregate = None
+    if getattr(room, "ranking_method", SKATING) == SKATING:
+        aggregate = RoomRankingAggregate.objects.filter(room=room).first()
+    if aggregate is None:
+        enqueue_ranking(room, full_rebuild=True)
+        return None
+    ranking = rank_from_histogram(aggregate.histogram or {}, get_object_titles(room))
+    results = _results_list(ranking)
+    cache.set(key, results, RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+def stored_room_results(room) -> List[Dict[str, Any]]:
+    """The ranking the last full recompute stored in ``room.final_results``."""
+    return _results_list(room.final_results or {})
+
+
+def cache_room_results(room, revision: int, ranking: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Cache a recomputed ``ranking`` for ``revision``, unless it already is.
+    Returns whether it was added.
+    """
+    return cache.add(
+        _results_key(room, revision), _results_list(ranking), RESULTS_CACHE_TIMEOUT
+    )
+
+
+def get_room_results(room, revision: int) -> List[Dict[str, Any]]:
+    """
+    :func:`cached_room_results`, or the last stored ranking while the ranking
+    worker recomputes it.
+    """
+    results = cached_room_results(room, revision)
+    if results is None:
+        results = stored_room_results(room)
+    return results
+
+
+def get_room_leaderboard(
+    room, revision: int, top: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Like :func:`cached_room_results`, but only the objects placed within the top
+    ``top`` (objects tied at the cut-off are all included).
+
+    Served from the full cached results when they exist, ``None`` while the
+    ranking worker recomputes them. Otherwise skating rooms are ranked straight
+    from the aggregate with
+    :func:`top_skating_placements`, which only builds tie-break keys for the
+    objects that can still reach the top. That ranking is cached for the
+    smallest of ``LEADERBOARD_SIZES`` holding ``top`` and sliced, so clients
+    can't create a cache entry per value of ``top``.
+    """
+    from voting.models import RoomRankingAggregate, VotingObject
+
+    method = getattr(room, "ranking_method", SKATING)
+    results = cache.get(_results_key(room, revision))
+    size = next((size for size in LEADERBOARD_SIZES if size >= top), None)
+    if results is None and method == SKATING and size is not None:
+        key = f"voting:top:{room.pk}:{revision}:{size}"
+        results = cache.get(key)
+
+        aggregate = None
+        if results is None:
+            aggregate = RoomRankingAggregate.objects.filter(room=room).first()
+        histogram = aggregate.histogram if aggregate is not None else None
+        # Unvoted objects only make the cut when there are fewer voted ones
+        if histogram and size < len(histogram):
+            labels, counts = histogram_matrix(histogram)
+            order, places = top_skating_placements(counts, size)
+            placements = [(labels[i], int(place)) for i, place in zip(order, places)]
+            titles = {
+                str(obj_id): title
+                for obj_id, title in VotingObject.objects.filter(
+                    room=room, id__in=[obj_id for obj_id, _ in placements]
+                ).values_list("id", "title")
+            }
+            titles = {obj_id: titles.get(obj_id, "Unknown") for obj_id, _ in placements}
+            ranking = build_results(placements, histogram, titles)
+            results = _results_list(ranking)
+            cache.set(key, results, RESULTS_CACHE_TIMEOUT)
+
+    if results is None:
+        results = cached_room_results(room, revision)
+    if results is None:
+        return None
+    return [entry for entry in results if entry["final_rank"] <= top]
+
+
+def _store_results(room, results: Dict[str, Dict[str, Any]]):
     # Store results in room
     if hasattr(room, "final_results"):
-        room.final_results = sorted_results
-        room.save()
+        room.final_results = results
+        # Only touch final_results so a stale ballot_revision is never written back
+        room.save(update_fields=["final_results"])
+    return results
 
-    return sorted_results
+
+def _save_aggregate(room, histogram: Histogram, ballot_count: int) -> None:
+    from voting.models import RoomRankingAggregate
+
+    RoomRankingAggregate.objects.update_or_create(
+        room=room,
+        defaults={"histogram": histogram, "ballot_count": ballot_count},
+    )
 
 
 def skating_system(ballots: List[List[str]]) -> List[Tuple[str, int]]:
@@ -215,6 +639,134 @@ def skating_system(ballots: List[List[str]]) -> List[Tuple[str, int]]:
     return ranking
 
 
+def placement_matrix(ballots: List[List[str]]) -> Tuple[List[str], np.ndarray]:
+    """
+    Turn ballots into a dense couples x ranks count matrix.
+
+    Row ``i`` of the returned matrix belongs to ``labels[i]`` and column ``r``
+    holds the number of ballots that placed that couple at rank ``r + 1``.
+
+    :param ballots: List of ballots (each ballot is a list of couple IDs in ranked order)
+    :return: A tuple (labels, counts)
+    """
+    index: Dict[str, int] = {}
+    rows: List[int] = []
+    ranks: List[int] = []
+    for ballot in ballots:
+        for rank, couple in enumerate(ballot):
+            rows.append(index.setdefault(couple, len(index)))
+            ranks.append(rank)
+
+    labels = list(index)
+    max_rank = max((len(ballot) for ballot in ballots), default=0)
+    if not labels:
+        return labels, np.zeros((0, max_rank), dtype=np.int64)
+
+    flat = np.asarray(rows, dtype=np.int64) * max_rank + np.asarray(ranks)
+    counts = np.bincount(flat, minlength=len(labels) * max_rank)
+    return labels, counts.reshape(len(labels), max_rank)
+
+
+def majority_ranks(counts: np.ndarray) -> np.ndarray:
+    """
+    Return the 1-indexed minimal majority rank for every row of ``counts``.
+
+    Rows that never reach their majority get ``max_rank + 1`` so they sort last,
+    mirroring the ``math.inf`` used by :func:`skating_system`.
+    """
+    max_rank = counts.shape[1]
+    totals = counts.sum(axis=1)
+    threshold = totals // 2 + 1
+    reached = np.cumsum(counts, axis=1) >= threshold[:, None]
+    return np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, max_rank + 1)
+
+
+def skating_placements(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rank the rows of a couples x ranks count matrix with the Skating rules.
+
+    :param counts: Count matrix as built by :func:`placement_matrix`
+    :return: A tuple (order, places): row indices from best to worst and the
+             competition-style placement of each of those rows.
+    """
+    n = counts.shape[0]
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    keys = np.column_stack([majority_ranks(counts), -counts])
+    # np.lexsort treats the last key as the primary one.
+    order = np.lexsort(keys.T[::-1])
+
+    sorted_keys = keys[order]
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    places = np.maximum.accumulate(np.where(starts, np.arange(n), 0)) + 1
+    return order, places
+
+
+def top_skating_placements(
+    counts: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The rows of :func:`skating_placements` placed within the top ``k``.
+
+    A heap over the majority ranks finds the ``k``-th best one; only the rows
+    at or above it can still make the top ``k``, so the tie-break keys and the
+    lexsort are limited to those candidates.
+    """
+    if k >= counts.shape[0]:
+        order, places = skating_placements(counts)
+    else:
+        majority = majority_ranks(counts)
+        cutoff = heapq.nsmallest(k, majority.tolist())[-1] if k > 0 else 0
+        candidates = np.flatnonzero(majority <= cutoff)
+        order, places = skating_placements(counts[candidates])
+        order = candidates[order]
+    keep = places <= k
+    return order[keep], places[keep]
+
+
+def skating_system_numpy(ballots: List[List[str]]) -> List[Tuple[str, int]]:
+    """
+    Vectorized equivalent of :func:`skating_system`.
+
+    Builds the placement counts as a dense matrix, finds the majority ranks with
+    a cumulative sum and ``argmax`` and breaks ties with a single lexsort.
+
+    :param ballots: List of ballots (each ballot is a list of couple IDs in ranked order)
+    :return: A list of tuples (couple, placement)
+    """
+    labels, counts = placement_matrix(ballots)
+    order, places = skating_placements(counts)
+    return [(labels[i], int(place)) for i, place in zip(order, places)]
+
+
+@register_method(SKATING)
+def skating(matrices: BallotMatrices) -> Tuple[np.ndarray, np.ndarray]:
+    """Skating system as a ranking method, see :func:`skating_placements`."""
+    return skating_placements(matrices.counts)
+
+
+SKATING_ENGINES: Dict[str, SkatingEngine] = {
+    "python": skating_system,
+    "numpy": skating_system_numpy,
+}
+
+
+def get_skating_engine(name: str | None = None) -> SkatingEngine:
+    """
+    Return the skating implementation selected by ``VOTING_SKATING_ENGINE``.
+    """
+    name = name or getattr(settings, "VOTING_SKATING_ENGINE", "numpy")
+    try:
+        return SKATING_ENGINES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown skating engine {name!r}, expected one of {sorted(SKATING_ENGINES)}"
+        ) from None
+
+
 # # ---------------------------
 # # Example usage and test
 if __name__ == "__main__":
@@ -0,0 +1,273 @@
+"""
+Optional per-room database sharding.
+
+With ``VOTING_SHARDS`` set to a list of database aliases, every
+:class:`~voting.models.VotingRoom` lives in one of those databases together
+with its objects, participants and ranking aggregate, so the write load of a
+busy room stays in its own file. The shard is picked by rendezvous hashing of
+the room UUID: adding a shard only moves the rooms that hash to the new one.
+Users, tokens, nicknames and the ranking job queue stay in ``default``.
+
+Routing works in three places:
+
+- :class:`RoomShardRouter` routes saves, deletes and related lookups by the
+  room of the instance involved,
+- :class:`RoomShardQuerySet` routes querysets filtered on a single room
+  (``room=``, ``room_id=``, or ``pk=`` for rooms),
+- queries spanning rooms loop over :func:`room_databases`. A query that names
+  no room and no database (``VotingRoom.objects.count()``) only reads
+  ``default``, which holds no rooms once sharding is on. The admin picks the
+  database with a changelist filter.
+
+Every database gets the full schema, so migrations run unchanged with
+``migrate --database <alias>``. Foreign keys between the two sides are kept
+without database constraints. Rooms created before sharding was turned on, or
+before the shard list changed, are moved by ``manage.py rebalance_shards``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+
+SHARDED_MODELS = {
+    "votingroom",
+    "votingobject",
+    "roomparticipant",
+    "roomrankingaggregate",
+}
+
+
+def shard_aliases() -> List[str]:
+    return list(getattr(settings, "VOTING_SHARDS", None) or [])
+
+
+def sharding_enabled() -> bool:
+    return bool(shard_aliases())
+
+
+def room_databases() -> List[str]:
+    """Every database that can hold rooms."""
+    return shard_aliases() or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model) -> bool:
+    return (
+        model._meta.app_label == "voting"
+        and model._meta.model_name in SHARDED_MODELS
+    )
+
+
+def shard_for_room(room_id, shards: Optional[List[str]] = None) -> str:
+    """
+    The database of the room ``room_id`` (a UUID or its string).
+
+    Raises ``ValueError`` for something that isn't a UUID.
+    """
+    shards = shard_aliases() if shards is None else shards
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    key = uuid.UUID(str(room_id)).bytes
+    return max(
+        shards,
+        key=lambda alias: hashlib.blake2b(
+            key, digest_size=8, key=alias.encode()
+        ).digest(),
+    )
+
+
+def room_db(room) -> str:
+    """The database holding ``room`` (an instance or a room ID) and its rows."""
+    state = getattr(room, "_state", None)
+    if state is not None and state.db:
+        return state.db
+    return shard_for_room(getattr(room, "pk", room))
+
+
+def _instance_room_id(instance):
+    if instance is None:
+        return None
+    if instance._meta.label_lower == "voting.votingroom":
+        return instance.pk
+    return getattr(instance, "room_id", None)
+
+
+class RoomShardRouter:
+    """Send room-scoped models to their room's shard, everything else to default."""
+
+    def _db_for(self, model, **hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        room_id = _instance_room_id(hints.get("instance"))
+        if room_id is None:
+            return None
+        return shard_for_room(room_id)
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class RoomShardQuerySet(models.QuerySet):
+    """
+    QuerySet that picks its room's shard when filtered on a single room.
+
+    Queries that don't name a room (or already chose a database with
+    ``using()``) are left alone.
+    """
+
+    def _room_lookups(self):
+        if self.model._meta.label_lower == "voting.votingroom":
+            return ("pk", "id")
+        return ("room", "room_id", "room__pk", "room__id")
+
+    def _route(self, kwargs):
+        if self._db is not None or not sharding_enabled():
+            return self
+        for lookup in self._room_lookups():
+            if lookup in kwargs:
+                room_id = getattr(kwargs[lookup], "pk", kwargs[lookup])
+                try:
+                    return self.using(shard_for_room(room_id))
+                except (TypeError, ValueError):
+                    # Not a UUID: the query itself will reject it
+                    return self
+        return self
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        if negate:
+            return clone
+        return clone._route(kwargs)
+
+    def create(self, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().create(**kwargs)
+        # Route by the instance, new rooms only get their UUID here
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=shard_for_room(_instance_room_id(obj)))
+        return obj
+
+    def get_or_create(self, defaults=None, **kwargs):
+        routed = self._route(kwargs)
+        if routed is not self:
+            return routed.get_or_create(defaults, **kwargs)
+        return super().get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, create_defaults=None, **kwargs):
+        routed = self._route(kwargs)
+        if routed is not self:
+            return routed.update_or_create(defaults, create_defaults, **kwargs)
+        return super().update_or_create(defaults, create_defaults, **kwargs)
+
+    def _by_shard(self, objs) -> Dict[str, list]:
+        groups: Dict[str, list] = {}
+        for obj in objs:
+            groups.setdefault(shard_for_room(_instance_room_id(obj)), []).append(obj)
+        return groups
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        for alias, group in self._by_shard(objs).items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        return sum(
+            self.using(alias).bulk_update(group, fields, *args, **kwargs)
+            for alias, group in self._by_shard(objs).items()
+        )
+
+
+def _remap_keys(data, id_map: Dict[str, str]):
+    if not isinstance(data, dict):
+        return data
+    return {id_map.get(key, key): value for key, value in data.items()}
+
+
+def move_room(room_id, source: str, target: str) -> Dict[str, int]:
+    """
+    Move a room and its rows from the ``source`` database to ``target``.
+
+    Object and participant IDs are only unique per database, so the copies get
+    new IDs and every ballot, aggregate and stored result keyed by object ID is
+    rewritten. Buffered drafts are flushed first. Run with the app stopped: a
+    page left open would still post the old object IDs. Returns the number of
+    rows moved per model.
+    """
+    from voting.drafts import flush_drafts
+    from voting.models import (
+        RoomParticipant,
+        RoomRankingAggregate,
+        VotingObject,
+        VotingRoom,
+    )
+
+    room = VotingRoom.objects.using(source).get(pk=room_id)
+    participants = RoomParticipant.objects.using(source).filter(room_id=room_id)
+    flush_drafts(participants.values_list("id", flat=True), using=[source])
+    participants = list(participants.order_by("id"))
+    objects = list(
+        VotingObject.objects.using(source).filter(room_id=room_id).order_by("slot")
+    )
+    aggregate = RoomRankingAggregate.objects.using(source).filter(room_id=room_id)
+    aggregate = aggregate.first()
+
+    with transaction.atomic(using=target):
+        # Left over from a move that failed before the source was cleaned up
+        VotingRoom.objects.using(target).filter(pk=room_id).delete()
+        room.ballot_revision += 1  # results cached before the move are stale
+        room.save(using=target, force_insert=True)
+
+        old_ids = [str(obj.pk) for obj in objects]
+        for obj in objects:
+            obj.pk = None
+        VotingObject.objects.using(target).bulk_create(objects)
+        id_map = {old: str(obj.pk) for old, obj in zip(old_ids, objects)}
+        if room.final_results:
+            room.final_results = _remap_keys(room.final_results, id_map)
+            room.save(using=target, update_fields=["final_results"])
+
+        for participant in participants:
+            participant.pk = None
+            participant.vote_data = _remap_keys(participant.vote_data, id_map)
+        RoomParticipant.objects.using(target).bulk_create(participants)
+
+        if aggregate is not None:
+            aggregate.pk = None
+            aggregate.histogram = _remap_keys(aggregate.histogram, id_map)
+            aggregate.save(using=target, force_insert=True)
+
+    VotingRoom.objects.using(source).filter(pk=room_id).delete()
+    return {
+        "objects": len(objects),
+        "participants": len(participants),
+        "aggregates": int(aggregate is not None),
+    }
+
+
+def misplaced_rooms(databases: Optional[Iterable[str]] = None):
+    """Yield ``(room_id, source, target)`` for rooms outside their home database."""
+    from voting.models import VotingRoom
+
+    if databases is None:
+        databases = dict.fromkeys([DEFAULT_DB_ALIAS, *room_databases()])
+    for alias in databases:
+        for room_id in VotingRoom.objects.using(alias).values_list("pk", flat=True):
+            target = shard_for_room(room_id)
+            if target != alias:
+                yield room_id, alias, target
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from users.models import CustomUser
+
+from .codecs import encode_vote_data
+from .images import needs_variants
+from .jobs import enqueue_ranking
+from .models import RankingJob, RoomParticipant, VotingObject, VotingRoom
+from .service import apply_ballot_delta, ballot_from_vote_data
+from .sharding import room_databases, sharding_enabled
+
+
+@receiver(post_save, sender=RoomParticipant)
+@receiver(post_delete, sender=RoomParticipant)
+def bump_ballot_revision(sender, instance, **kwargs):
+    """Invalidate cached room results whenever a participant's ballot changes."""
+    # The participant's database, even for a room awaiting rebalance_shards
+    rooms = VotingRoom.objects.using(instance._state.db)
+    rooms.filter(pk=instance.room_id).update(ballot_revision=F("ballot_revision") + 1)
+
+
+def _saved_ballot(instance):
+    """``(vote_confirmed, vote_data, ballot)`` as loaded, ``None`` if deferred."""
+    deferred = instance.get_deferred_fields()
+    if "vote_confirmed" in deferred or "vote_data" in deferred:
+        return None
+    vote_data = instance.vote_data
+    return (
+        instance.vote_confirmed,
+        dict(vote_data) if isinstance(vote_data, dict) else vote_data,
+        None if "ballot" in deferred else instance.ballot,
+    )
+
+
+@receiver(post_init, sender=RoomParticipant)
+def remember_saved_ballot(sender, instance, **kwargs):
+    instance._saved_ballot = _saved_ballot(instance)
+
+
+@receiver(pre_save, sender=RoomParticipant)
+def pack_ballot(sender, instance, raw=False, **kwargs):
+    """Keep the packed ``ballot`` in step with ``vote_data``, however it is saved."""
+    if raw:
+        return
+    if not instance.vote_confirmed:
+        instance.ballot = None
+        return
+    saved = None if instance._state.adding else instance._saved_ballot
+    if saved is not None and saved[0] and saved[1] == instance.vote_data:
+        return
+    # The voting views pack the ballot themselves
+    if saved is not None and instance.ballot not in (None, saved[2]):
+        return
+    slot_by_object_id = {
+        str(obj_id): slot
+        for obj_id, slot in VotingObject.objects.filter(
+            room_id=instance.room_id
+        ).values_list("id", "slot")
+    }
+    instance.ballot = encode_vote_data(instance.vote_data or {}, slot_by_object_id)
+
+
+def _fold_ballot_change(instance, saved, confirmed, vote_data):
+    """Apply the change from the ``saved`` ballot to the new one to the aggregate."""
+    if saved is None:
+        # Unknown previous ballot
+        enqueue_ranking(instance.room_id, full_rebuild=True)
+        return
+    was_confirmed, old_vote_data = saved[0], saved[1]
+    if was_confirmed == confirmed and (not confirmed or old_vote_data == vote_data):
+        return
+    aggregate = apply_ballot_delta(
+        instance.room,
+        old_ballot=(
+            ballot_from_vote_data(old_vote_data)
+            if was_confirmed and old_vote_data
+            else None
+        ),
+        new_ballot=(
+            ballot_from_vote_data(vote_data) if confirmed and vote_data else None
+        ),
+    )
+    enqueue_ranking(instance.room_id, full_rebuild=aggregate is None)
+
+
+@receiver(post_save, sender=RoomParticipant)
+def update_aggregate_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Fold a confirmed, changed or withdrawn ballot into the room aggregate, from
+    the voting views as well as the admin or a shell.
+    """
+    if raw:
+        return
+    saved = (False, None, None) if created else instance._saved_ballot
+    _fold_ballot_change(instance, saved, instance.vote_confirmed, instance.vote_data)
+    instance._saved_ballot = _saved_ballot(instance)
+
+
+@receiver(post_delete, sender=RoomParticipant)
+def update_aggregate_on_delete(sender, instance, origin=None, **kwargs):
+    """Take a deleted participant's ballot out of the room aggregate."""
+    # Deleting the room takes its aggregate along
+    if isinstance(origin, VotingRoom) or (
+        isinstance(origin, QuerySet) and origin.model is VotingRoom
+    ):
+        return
+    _fold_ballot_change(instance, instance._saved_ballot, False, None)
+
+
+@receiver(post_delete, sender=VotingRoom)
+def delete_room_central_rows(sender, instance, using, **kwargs):
+    """
+    With sharding, deleting a room only cascades within its shard: delete its
+    ranking job and user links from the default database here.
+    """
+    if not sharding_enabled():
+        return
+    # Moved by rebalance_shards rather than deleted
+    if any(
+        VotingRoom.objects.using(alias).filter(pk=instance.pk).exists()
+        for alias in room_databases()
+    ):
+        return
+    RankingJob.objects.filter(room_id=instance.pk).delete()
+    CustomUser.vote_rooms.through.objects.filter(votingroom_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_user_participations(sender, instance, **kwargs):
+    """With sharding, a deleted user's participations live in the shards."""
+    if not sharding_enabled():
+        return
+    for alias in room_databases():
+        RoomParticipant.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=VotingObject)
+def queue_image_variants(sender, instance, raw=False, **kwargs):
+    """Have the ranking worker resize a new or replaced image once committed."""
+    if raw or not getattr(settings, "VOTING_IMAGE_VARIANTS_ON_SAVE", True):
+        return
+    if not needs_variants(instance):
+        return
+    transaction.on_commit(
+        lambda: enqueue_ranking(instance.room_id, ranking=False, variants=True),
+        using=instance._state.db,
+    )
@@ -0,0 +1,130 @@
+"""
+Server-Sent Events stream of a room's updates.
+
+For clients that can't use the WebSocket (proxies without upgrade support,
+kiosk browsers), ``GET /api/voting/rooms/<id>/events/`` streams the same
+updates as :mod:`voting.realtime` as ``text/event-stream``.
+
+Each process runs at most one producer per room: a task that joins the
+room's channel group, computes the current snapshot once and hands every
+update to all of the room's listeners. The producer stops with its last
+listener. Every update is a full snapshot, so a listener only ever needs
+the latest one: a slow client skips intermediate updates, and a client
+resuming with ``Last-Event-ID`` (the ballot revision) gets the current
+snapshot unless it already has it. Comment lines keep idle connections
+open through proxies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from voting.realtime import ROOM_UPDATE, latest_room_update, room_group, room_update
+
+HEARTBEAT_INTERVAL = 15  # seconds
+RETRY_INTERVAL = 3000  # milliseconds, sent to EventSource as "retry:"
+
+Update = Tuple[int, str]
+
+
+class RoomStream:
+    """The producer of one room's updates and the queues of its listeners."""
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.listeners: Set[asyncio.Queue] = set()
+        self.latest: Optional[Update] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.listeners.add(queue)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> bool:
+        """Drop a listener, stopping the producer after the last one."""
+        self.listeners.discard(queue)
+        if self.listeners:
+            return False
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        return True
+
+    def publish(self, text: str) -> None:
+        update = (json.loads(text)["revision"], text)
+        self.latest = update
+        for queue in self.listeners:
+            if queue.full():  # the listener hasn't sent the previous one yet
+                queue.get_nowait()
+            queue.put_nowait(update)
+
+    async def run(self) -> None:
+        layer = get_channel_layer()
+        group = room_group(self.room_id)
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        try:
+            snapshot = await database_sync_to_async(room_update)(self.room_id)
+            if snapshot is not None:
+                self.publish(snapshot)
+            while True:
+                message = await layer.receive(channel)
+                if message.get("type") != ROOM_UPDATE:
+                    continue
+                text = await database_sync_to_async(latest_room_update)(
+                    self.room_id, message["revision"]
+                )
+                if text is not None:
+                    self.publish(text)
+        finally:
+            await layer.group_discard(group, channel)
+
+
+_streams: Dict[str, RoomStream] = {}
+
+
+def format_event(update: Update) -> str:
+    revision, text = update
+    return f"id: {revision}\ndata: {text}\n\n"
+
+
+def parse_last_event_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def room_events(room_id, last_event_id=None) -> AsyncIterator[str]:
+    """The event stream of one listener of the room."""
+    key = str(room_id)
+    stream = _streams.get(key)
+    if stream is None:
+        stream = _streams[key] = RoomStream(room_id)
+    queue = stream.subscribe()
+    sent = parse_last_event_id(last_event_id)
+    try:
+        yield f"retry: {RETRY_INTERVAL}\n\n"
+        while True:
+            try:
+                update = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if update[0] == sent:
+                continue
+            sent = update[0]
+            yield format_event(update)
+    finally:
+        if stream.unsubscribe(queue) and _streams.get(key) is stream:
+            del _streams[key]
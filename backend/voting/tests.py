@@ -1,3 +1,1405 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import random
+import tempfile
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    OperationalError,
+    connection,
+    connections,
+)
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from evaluator.asgi import application
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import CustomUser, generate_user_ids
+from users.token_cache import token_cache
+
+from voting import streams
+from voting.agreement import position_matrix, spearman_matrix
+from voting.analysis import (
+    ballot_influence,
+    bootstrap_placements,
+    placement_stability,
+    skating_places_batch,
+)
+from voting.benchmarks.sqlite_stress import run_stress
+from voting.codecs import decode_to_object_ids, encode_vote_data
+from voting.drafts import draft_key, flush_drafts
+from voting.engines import build_matrices, get_ranking_method
+from voting.jobs import (
+    claim_next_job,
+    enqueue_ranking,
+    requeue_stale_jobs,
+    run_job,
+    run_pending_jobs,
+)
+from voting.models import (
+    RankingJob,
+    RoomParticipant,
+    RoomRankingAggregate,
+    VotingObject,
+    VotingRoom,
+)
+from voting.provisioning import RosterEntry, provision_users
+from voting.query_budget import QueryBudgetTestMixin
+from voting.realtime import room_group
+from voting.room_import import ROOM_NAMESPACE
+from voting.serializers import VotingObjectSerializer
+from voting.service import (
+    calculate_room_ranking,
+    get_room_leaderboard,
+    get_room_results,
+    refresh_room_ranking,
+    skating_placements,
+    skating_system,
+    skating_system_numpy,
+    top_skating_placements,
+)
+from voting.sharding import (
+    RoomShardQuerySet,
+    move_room,
+    room_databases,
+    room_db,
+    shard_for_room,
+)
+
+
+LOCMEM_CACHES = {
+    alias: {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": alias,
+    }
+    for alias in ("default", "drafts", "auth_tokens")
+}
+
+
+class RoomTestCase(TestCase):
+    # Room rows live in the shard databases when VOTING_SHARDS is set
+    databases = "__all__"
+
+    @classmethod
+    @contextmanager
+    def captureOnCommitCallbacks(cls, *, using=DEFAULT_DB_ALIAS, execute=False):
+        # Room writes register their callbacks on the room's database
+        with ExitStack() as stack:
+            callbacks = stack.enter_context(
+                super().captureOnCommitCallbacks(using=using, execute=execute)
+            )
+            for alias in room_databases():
+                if alias != using:
+                    stack.enter_context(
+                        super().captureOnCommitCallbacks(using=alias, execute=execute)
+                    )
+            yield callbacks
+
+    @contextmanager
+    def assertQueriesEverywhere(self, num):
+        """``assertNumQueries`` summed over every database."""
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections
+            ]
+            yield
+        self.assertEqual(sum(len(queries) for queries in captured), num)
+
+
+class SkatingEngineTests(SimpleTestCase):
+    def assertSamePlacements(self, ballots):
+        self.assertEqual(
+            dict(skating_system(ballots)), dict(skating_system_numpy(ballots))
+        )
+
+    def test_example_ballots(self):
+        self.assertSamePlacements(
+            [
+                ["A", "B", "C"],
+                ["B", "A", "C"],
+                ["A", "C"],
+                ["B", "C", "A"],
+            ]
+        )
+
+    def test_empty(self):
+        self.assertEqual(skating_system_numpy([]), [])
+
+    def test_top_k_matches_full_ranking(self):
+        rng = np.random.default_rng(8)
+        for _ in range(100):
+            counts = rng.integers(0, 4, size=(rng.integers(1, 15), 6))
+            k = int(rng.integers(0, 16))
+            order, places = skating_placements(counts)
+            top_order, top_places = top_skating_placements(counts, k)
+            self.assertEqual(
+                sorted(zip(top_places.tolist(), top_order.tolist())),
+                sorted(
+                    (place, row)
+                    for place, row in zip(places.tolist(), order.tolist())
+                    if place <= k
+                ),
+            )
+
+    def test_random_rooms_with_ties_and_incomplete_ballots(self):
+        rng = random.Random(1234)
+        for _ in range(200):
+            couples = [str(i) for i in range(rng.randint(1, 12))]
+            ballots = []
+            for _ in range(rng.randint(1, 9)):
+                ballot = rng.sample(couples, rng.randint(1, len(couples)))
+                ballots.append(ballot)
+            self.assertSamePlacements(ballots)
+
+
+class RankingMethodTests(SimpleTestCase):
+    # Schulze example from the method's original description: 45 voters over
+    # candidates A..E, with E > A > C > B > D
+    SCHULZE_BALLOTS = [
+        (5, "ACBED"),
+        (5, "ADECB"),
+        (8, "BEDAC"),
+        (3, "CABED"),
+        (7, "CAEBD"),
+        (2, "CBADE"),
+        (7, "DCEBA"),
+        (8, "EBADC"),
+    ]
+
+    def matrices(self, ballots):
+        return build_matrices(
+            (np.array([ord(c) - ord("A") for c in order]) for order in ballots), 5
+        )
+
+    def test_schulze_example(self):
+        ballots = [order for weight, order in self.SCHULZE_BALLOTS for _ in range(weight)]
+        order, places = get_ranking_method("schulze")(self.matrices(ballots))
+        self.assertEqual("".join(chr(ord("A") + i) for i in order), "EACBD")
+        self.assertEqual(list(places), [1, 2, 3, 4, 5])
+
+    def test_pairwise_matrix_matches_naive_count(self):
+        rng = random.Random(7)
+        ballots = ["".join(rng.sample("ABCDE", rng.randint(1, 5))) for _ in range(50)]
+        pairwise = self.matrices(ballots).pairwise
+        for i in range(5):
+            for j in range(5):
+                a, b = chr(ord("A") + i), chr(ord("A") + j)
+                expected = sum(
+                    a in order and (b not in order or order.index(a) < order.index(b))
+                    for order in ballots
+                )
+                self.assertEqual(pairwise[i, j], expected, (a, b))
+
+    def test_borda_and_copeland_ties_share_a_place(self):
+        matrices = self.matrices(["AB", "BA", "C"])
+        for method in ("borda", "copeland"):
+            order, places = get_ranking_method(method)(matrices)
+            self.assertEqual(sorted(places), [1, 1, 3, 4, 4], method)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            get_ranking_method("approval")
+
+
+class IncrementalRankingTests(RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        self.objects = [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(5)
+        ]
+
+    def confirm(self, index, order):
+        user = CustomUser.objects.create(username=f"voter{index}")
+        vote_data = {str(self.objects[i].id): pos for pos, i in enumerate(order, 1)}
+        RoomParticipant.objects.create(
+            user=user, room=self.room, vote_data=vote_data, vote_confirmed=True
+        )
+        # voting.signals folds the new ballot into the aggregate
+        return refresh_room_ranking(self.room)
+
+    def test_incremental_matches_full_recompute(self):
+        rng = random.Random(42)
+        for index in range(15):
+            order = list(range(5))
+            rng.shuffle(order)
+            incremental = self.confirm(index, order)
+
+        full = calculate_room_ranking(self.room)
+        self.assertEqual(
+            {k: v["final_rank"] for k, v in incremental.items()},
+            {k: v["final_rank"] for k, v in full.items()},
+        )
+        self.assertEqual(incremental, full)
+        aggregate = RoomRankingAggregate.objects.get(room=self.room)
+        self.assertEqual(aggregate.ballot_count, 15)
+
+    def test_deleting_a_confirmed_participant(self):
+        for index in range(3):
+            self.confirm(index, [0, 1, 2, 3, 4])
+        self.confirm(3, [4, 3, 2, 1, 0])
+        RoomParticipant.objects.get(
+            room=self.room, user=CustomUser.objects.get(username="voter3")
+        ).delete()
+
+        aggregate = RoomRankingAggregate.objects.get(room=self.room)
+        self.assertEqual(aggregate.ballot_count, 3)
+        self.assertEqual(aggregate.histogram[str(self.objects[4].id)], [0, 0, 0, 0, 3])
+        self.assertEqual(
+            refresh_room_ranking(self.room), calculate_room_ranking(self.room)
+        )
+
+    def test_edits_outside_the_views_repack_the_ballot(self):
+        self.confirm(0, [0, 1, 2, 3, 4])
+        participant = RoomParticipant.objects.get(room=self.room)
+        order = [str(self.objects[i].id) for i in [4, 3, 2, 1, 0]]
+        participant.vote_data = {obj_id: pos for pos, obj_id in enumerate(order, 1)}
+        participant.save()
+
+        participant.refresh_from_db()
+        object_id_by_slot = {obj.slot: str(obj.id) for obj in self.objects}
+        self.assertEqual(
+            decode_to_object_ids(participant.ballot, object_id_by_slot), order
+        )
+        aggregate = RoomRankingAggregate.objects.get(room=self.room)
+        self.assertEqual(aggregate.histogram[order[0]], [1])
+
+        participant.vote_confirmed = False
+        participant.save()
+        participant.refresh_from_db()
+        self.assertIsNone(participant.ballot)
+        aggregate.refresh_from_db()
+        self.assertEqual((aggregate.ballot_count, aggregate.histogram), (0, {}))
+
+    def test_engines_agree_after_an_object_is_deleted(self):
+        rng = random.Random(7)
+        for index in range(9):
+            order = list(range(5))
+            rng.shuffle(order)
+            self.confirm(index, order)
+        self.assertFalse(RoomParticipant.objects.filter(ballot=None).exists())
+        deleted = str(self.objects[1].id)
+        self.objects[1].delete()
+
+        with override_settings(VOTING_SKATING_ENGINE="python"):
+            python = calculate_room_ranking(self.room)
+        with override_settings(VOTING_SKATING_ENGINE="numpy"):
+            numpy = calculate_room_ranking(self.room)
+        self.assertEqual(python, numpy)
+        self.assertNotIn(deleted, numpy)
+        # The objects below the deleted one moved up a rank
+        self.assertTrue(
+            all(max(entry["vote_distribution"]) <= 4 for entry in numpy.values())
+        )
+
+    def test_slots_of_deleted_objects_are_not_reused(self):
+        self.confirm(0, [4, 3, 2, 1, 0])
+        self.objects[4].delete()
+        newcomer = VotingObject.objects.create(
+            room=self.room, title="Newcomer", image="x.png"
+        )
+        self.assertEqual(newcomer.slot, 5)
+
+        results = calculate_room_ranking(self.room)
+        self.assertEqual(results[str(newcomer.id)]["vote_count"], 0)
+        self.assertEqual(results[str(self.objects[3].id)]["final_rank"], 1)
+
+    def test_pairwise_method_room(self):
+        self.room.ranking_method = "copeland"
+        self.room.save(update_fields=["ranking_method"])
+        for index in range(3):
+            self.confirm(index, [4, 3, 2, 1, 0])
+        results = calculate_room_ranking(self.room)
+        self.assertEqual(results[str(self.objects[4].id)]["final_rank"], 1)
+        self.assertEqual(results[str(self.objects[0].id)]["final_rank"], 5)
+        self.assertEqual(refresh_room_ranking(self.room), results)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BallotInfluenceTests(RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        self.objects = [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(6)
+        ]
+        rng = random.Random(5)
+        for index in range(9):
+            order = rng.sample(range(6), rng.randint(3, 6))
+            RoomParticipant.objects.create(
+                user=CustomUser.objects.create(username=f"voter{index}"),
+                room=self.room,
+                vote_data={
+                    str(self.objects[i].id): pos for pos, i in enumerate(order, 1)
+                },
+                vote_confirmed=True,
+            )
+
+    def places(self):
+        return {
+            obj_id: details["final_rank"]
+            for obj_id, details in calculate_room_ranking(self.room).items()
+        }
+
+    def test_matches_recompute_without_each_ballot(self):
+        for method in ("skating", "schulze"):
+            self.room.ranking_method = method
+            baseline = self.places()
+            report = ballot_influence(self.room)
+            self.assertEqual(report["ballot_count"], 9)
+            for entry in report["ballots"]:
+                participant = RoomParticipant.objects.filter(
+                    room=self.room, pk=entry["participant_id"]
+                )
+                participant.update(vote_confirmed=False)
+                without = self.places()
+                participant.update(vote_confirmed=True)
+                self.assertEqual(
+                    {
+                        change["object_id"]: change["place_without"]
+                        for change in entry["changes"]
+                    },
+                    {
+                        obj_id: place
+                        for obj_id, place in without.items()
+                        if place != baseline[obj_id]
+                    },
+                    (method, entry["user"]),
+                )
+
+    def test_staff_only(self):
+        url = reverse("ballot_influence", args=[self.room.id])
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.get(username="voter0"))
+        self.assertEqual(client.get(url).status_code, 403)
+
+        admin = CustomUser.objects.create(username="admin", is_staff=True)
+        client.force_authenticate(admin)
+        response = client.get(url)
+        # Computed by the ranking worker, not in the request
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["influence"], "pending")
+        self.assertTrue(RankingJob.objects.get(room=self.room).influence)
+        run_pending_jobs()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["ballots"]), 9)
+
+    def test_admin_page(self):
+        admin = CustomUser.objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(admin)
+        url = reverse("admin:voting_votingroom_influence", args=[self.room.id])
+        self.assertContains(self.client.get(url), "being computed", status_code=202)
+        run_pending_jobs()
+        self.assertContains(self.client.get(url), "voter0")
+
+
+class BootstrapStabilityTests(RoomTestCase):
+    def test_batch_matches_single_skating(self):
+        rng = np.random.default_rng(3)
+        counts = rng.integers(0, 3, size=(40, 7, 7))
+        places = skating_places_batch(counts)
+        for sample in range(len(counts)):
+            order, expected = skating_placements(counts[sample])
+            self.assertEqual(places[sample][order].tolist(), expected.tolist())
+
+    def test_seeded_result_does_not_depend_on_workers(self):
+        rng = np.random.default_rng(4)
+        ballots = [rng.permutation(6)[: rng.integers(2, 7)] for _ in range(30)]
+        serial = bootstrap_placements(ballots, 6, samples=600, seed=9, workers=1)
+        parallel = bootstrap_placements(ballots, 6, samples=600, seed=9, workers=2)
+        self.assertEqual(serial.shape, (600, 6))
+        self.assertTrue((serial == parallel).all())
+
+    def test_unanimous_room_is_fully_stable(self):
+        room = VotingRoom.objects.create(name="Room")
+        objects = [
+            VotingObject.objects.create(room=room, title=f"Cat {i}", image="x.png")
+            for i in range(3)
+        ]
+        for index in range(5):
+            RoomParticipant.objects.create(
+                user=CustomUser.objects.create(username=f"voter{index}"),
+                room=room,
+                vote_data={str(obj.id): pos for pos, obj in enumerate(objects, 1)},
+                vote_confirmed=True,
+            )
+        stability = placement_stability(room, samples=100, workers=1)
+        self.assertEqual(
+            stability[str(objects[1].id)],
+            {"placement_interval": [2, 2], "confidence": 1.0},
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AgreementTests(RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        objects = [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(4)
+        ]
+        orders = {
+            "same1": [0, 1, 2, 3],
+            "same2": [0, 1, 2, 3],
+            "reverse": [3, 2, 1, 0],
+        }
+        for username, order in orders.items():
+            RoomParticipant.objects.create(
+                user=CustomUser.objects.create(username=username),
+                room=self.room,
+                vote_data={str(objects[i].id): pos for pos, i in enumerate(order, 1)},
+                vote_confirmed=True,
+            )
+        # Shares a single object with everyone else: no defined correlation
+        RoomParticipant.objects.create(
+            user=CustomUser.objects.create(username="partial"),
+            room=self.room,
+            vote_data={str(objects[0].id): 1},
+            vote_confirmed=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="admin", is_staff=True)
+        )
+
+    def test_matrices(self):
+        for method in ("spearman", "kendall"):
+            response = self.client.get(
+                reverse("room_agreement", args=[self.room.id]), {"method": method}
+            )
+            self.assertEqual(response.status_code, 200)
+            users = [voter["user"] for voter in response.data["voters"]]
+            matrix = dict(zip(users, response.data["matrix"]))
+            self.assertEqual(matrix["same1"][users.index("same2")], 1.0)
+            self.assertEqual(matrix["same1"][users.index("reverse")], -1.0)
+            self.assertIsNone(matrix["partial"][users.index("same1")])
+
+    def test_csv_download(self):
+        response = self.client.get(
+            reverse("room_agreement_csv", args=[self.room.id]), {"method": "kendall"}
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        header = response.content.decode().splitlines()[0]
+        self.assertEqual(header, "user,same1,same2,reverse,partial")
+
+    def test_spearman_reranks_the_common_objects(self):
+        ballots = [[0, 1, 2, 3], [0, 2, 3], [3, 2, 0], [1, 0]]
+        rho = spearman_matrix(position_matrix([np.array(b) for b in ballots], 4))
+        # Object 1, which the second voter left out, doesn't count against them
+        self.assertAlmostEqual(rho[0, 1], 1.0)
+        self.assertAlmostEqual(rho[0, 2], -1.0)
+        self.assertAlmostEqual(rho[1, 2], -1.0)
+        self.assertAlmostEqual(rho[0, 3], -1.0)
+        self.assertTrue(np.isnan(rho[1, 3]))
+        np.testing.assert_allclose(rho, rho.T)
+
+
+class RankingJobTests(RoomTestCase):
+    def test_repeated_marks_collapse_into_one_recompute(self):
+        room = VotingRoom.objects.create(name="Room")
+        for _ in range(5):
+            enqueue_ranking(room)
+
+        self.assertEqual(RankingJob.objects.count(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job = RankingJob.objects.get(room=room)
+        self.assertEqual(job.status, RankingJob.DONE)
+        self.assertEqual(job.processed, 5)
+        self.assertEqual(run_pending_jobs(), 0)
+
+    def test_mark_during_a_running_job_is_not_claimed_twice(self):
+        room = VotingRoom.objects.create(name="Room")
+        enqueue_ranking(room)
+        job = claim_next_job()
+        enqueue_ranking(room, full_rebuild=True)
+
+        self.assertIsNone(claim_next_job())
+        marked = RankingJob.objects.get(pk=job.pk)
+        self.assertEqual((marked.status, marked.requested), (RankingJob.RUNNING, 2))
+        self.assertTrue(marked.full_rebuild)
+
+        run_job(job)
+        self.assertEqual(RankingJob.objects.get(pk=job.pk).status, RankingJob.PENDING)
+        self.assertEqual(claim_next_job().pk, job.pk)
+
+    def test_resume_only_requeues_abandoned_jobs(self):
+        now = timezone.now()
+        started = {"abandoned": now - timedelta(hours=1), "live": now}
+        for name, started_at in started.items():
+            room = VotingRoom.objects.create(name=name)
+            RankingJob.objects.create(
+                room=room, status=RankingJob.RUNNING, started_at=started_at
+            )
+
+        self.assertEqual(requeue_stale_jobs(timeout=600), 1)
+        self.assertEqual(
+            RankingJob.objects.get(status=RankingJob.PENDING).room.name, "abandoned"
+        )
+        self.assertEqual(
+            RankingJob.objects.get(status=RankingJob.RUNNING).room.name, "live"
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoomResultsTests(RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        self.object = VotingObject.objects.create(
+            room=self.room, title="Cat", image="x.png"
+        )
+        self.user = CustomUser.objects.create(username="spectator")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("room_results", args=[self.room.id])
+
+    def test_etag_changes_with_ballot_revision(self):
+        # No aggregate yet: the request queues a full recompute, never runs it
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["results"], [])
+        self.assertTrue(response.data["pending"])
+        self.assertNotIn("ETag", response)
+        self.assertFalse(RoomRankingAggregate.objects.filter(room=self.room).exists())
+        self.assertTrue(RankingJob.objects.get(room=self.room).full_rebuild)
+
+        run_pending_jobs()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(
+            reverse("update_ranking", args=[self.room.id]),
+            {"vote_data": {str(self.object.id): 1}, "vote_confirmed": True},
+            format="json",
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["results"][0]["vote_count"], 1)
+
+    def test_leaderboard_from_aggregate(self):
+        objects = [self.object] + [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(4)
+        ]
+        for index in range(3):
+            RoomParticipant.objects.create(
+                user=CustomUser.objects.create(username=f"voter{index}"),
+                room=self.room,
+                vote_data={str(obj.id): pos for pos, obj in enumerate(objects, 1)},
+                vote_confirmed=True,
+            )
+        calculate_room_ranking(self.room)
+        self.room.refresh_from_db()
+        revision = self.room.ballot_revision
+
+        top = get_room_leaderboard(self.room, revision, 2)
+        self.assertEqual(
+            [entry["id"] for entry in top], [str(objects[0].id), str(objects[1].id)]
+        )
+        self.assertEqual(top, get_room_results(self.room, revision)[:2])
+
+        response = self.client.get(self.url, {"top": "2"})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIn("-top2", response["ETag"])
+        self.assertEqual(self.client.get(self.url, {"top": "x"}).status_code, 400)
+
+    def test_leaderboard_cache_does_not_grow_with_top(self):
+        objects = [self.object] + [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(11)
+        ]
+        RoomParticipant.objects.create(
+            user=CustomUser.objects.create(username="voter"),
+            room=self.room,
+            vote_data={str(obj.id): pos for pos, obj in enumerate(objects, 1)},
+            vote_confirmed=True,
+        )
+        calculate_room_ranking(self.room)
+        self.room.refresh_from_db()
+        revision = self.room.ballot_revision
+
+        for top in (1, 3, 7, 10):
+            self.assertEqual(len(get_room_leaderboard(self.room, revision, top)), top)
+        prefix = f"voting:top:{self.room.pk}:{revision}"
+        self.assertEqual(len(caches["default"].get(f"{prefix}:10")), 10)
+        self.assertIsNone(caches["default"].get(f"{prefix}:3"))
+
+    @override_settings(VOTING_BOOTSTRAP_SAMPLES=50, VOTING_BOOTSTRAP_WORKERS=1)
+    def test_stability_mode(self):
+        self.client.post(
+            reverse("update_ranking", args=[self.room.id]),
+            {"vote_data": {str(self.object.id): 1}, "vote_confirmed": True},
+            format="json",
+        )
+        run_pending_jobs()
+        plain = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, {"stability": "1"}).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url, {"stability": "1"})
+        # Bootstrapped by the ranking worker, never in the request
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["stability"], "pending")
+        self.assertTrue(RankingJob.objects.get(room=self.room).stability)
+
+        run_pending_jobs()
+        response = self.client.get(self.url, {"stability": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], plain["ETag"])
+        self.assertEqual(response.data["results"][0]["placement_interval"], [1, 1])
+        self.assertEqual(response.data["results"][0]["confidence"], 1.0)
+        self.assertFalse(RankingJob.objects.get(room=self.room).stability)
+
+
+class RoomBootstrapTests(RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        for i in range(5):
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+        self.user = CustomUser.objects.create(username="voter")
+        RoomParticipant.objects.create(
+            user=self.user, room=self.room, vote_data={}, comments="hi"
+        )
+        RoomParticipant.objects.create(
+            user=CustomUser.objects.create(username="other"), room=self.room
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("votingroom-bootstrap", args=[self.room.id])
+
+    def test_bootstrap_payload_in_fixed_queries(self):
+        with self.assertNumQueries(2, using=room_db(self.room)):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["room"]["participants_count"], 2)
+        self.assertEqual(len(response.data["objects"]), 5)
+        self.assertTrue(response.data["objects"][0]["image_url"].endswith("x.png"))
+        self.assertEqual(response.data["participant"]["comments"], "hi")
+
+    def test_not_a_participant(self):
+        self.client.force_authenticate(CustomUser.objects.create(username="stranger"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(QueryBudgetTestMixin, RoomTestCase):
+    def setUp(self):
+        self.rooms = [VotingRoom.objects.create(name=f"Room {i}") for i in range(3)]
+        self.user = CustomUser.objects.create(username="voter")
+        for room in self.rooms:
+            for i in range(4):
+                VotingObject.objects.create(room=room, title=f"Cat {i}", image="x.png")
+            RoomParticipant.objects.create(user=self.user, room=room)
+            for index in range(3):
+                RoomParticipant.objects.create(
+                    user=CustomUser.objects.create(username=f"{room.name}-{index}"),
+                    room=room,
+                )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_room_list_and_detail(self):
+        response = self.assertWithinQueryBudget("GET", reverse("votingroom-list"))
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]["participants_count"], 4)
+
+        room = self.rooms[0]
+        for name in ("votingroom-detail", "votingroom-objects", "votingroom-bootstrap"):
+            url = reverse(name, args=[room.id])
+            response = self.assertWithinQueryBudget("GET", url)
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_voting_flow(self):
+        room = self.rooms[0]
+        self.assertWithinQueryBudget(
+            "GET", reverse("participant_status", args=[room.id])
+        )
+        vote_data = {
+            str(obj_id): pos
+            for pos, obj_id in enumerate(
+                VotingObject.objects.filter(room=room).values_list("id", flat=True), 1
+            )
+        }
+        response = self.assertWithinQueryBudget(
+            "POST",
+            reverse("update_ranking", args=[room.id]),
+            {"vote_data": vote_data, "vote_confirmed": True},
+            format="json",
+        )
+        self.assertTrue(response.data["vote_confirmed"])
+        self.assertWithinQueryBudget("GET", reverse("ranking_status", args=[room.id]))
+        self.assertWithinQueryBudget("GET", reverse("room_results", args=[room.id]))
+
+
+@override_settings(VOTING_DRAFT_BUFFER=False)
+class PatchRankingTests(QueryBudgetTestMixin, RoomTestCase):
+    def setUp(self):
+        self.room = VotingRoom.objects.create(name="Room")
+        self.user = CustomUser.objects.create(username="voter")
+        self.participant = RoomParticipant.objects.create(
+            user=self.user, room=self.room, vote_data={"a": 1, "b": 2}
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("patch_ranking", args=[self.room.id])
+
+    def patch(self, body):
+        return self.assertWithinQueryBudget("PATCH", self.url, body, format="json")
+
+    def test_delta_applies_and_bumps_revision(self):
+        revision = VotingRoom.objects.get(pk=self.room.pk).ballot_revision
+        response = self.patch({"revision": 0, "moves": {"a": 2, "b": 1, "c": 3}})
+        self.assertEqual(response.data, {"revision": 1, "changed": True})
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.vote_data, {"a": 2, "b": 1, "c": 3})
+
+        response = self.patch({"revision": 1, "moves": {"c": None}})
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.vote_data, {"a": 2, "b": 1})
+        # Drafts don't touch the results
+        self.assertEqual(
+            VotingRoom.objects.get(pk=self.room.pk).ballot_revision, revision
+        )
+
+    def test_stale_revision_conflicts(self):
+        self.patch({"revision": 0, "moves": {"a": 2, "b": 1}})
+        response = self.patch({"revision": 0, "moves": {"a": 1}})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["revision"], 1)
+        self.assertEqual(response.data["vote_data"], {"a": 2, "b": 1})
+
+    def test_noop_is_not_written(self):
+        with self.assertNumQueries(1, using=room_db(self.room)):
+            response = self.client.patch(
+                self.url, {"revision": 0, "moves": {"a": 1}}, format="json"
+            )
+        self.assertEqual(response.data, {"revision": 0, "changed": False})
+
+    def test_invalid_position(self):
+        response = self.patch({"revision": 0, "moves": {"a": "first"}})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, VOTING_DRAFT_BUFFER=True)
+class DraftBufferTests(RoomTestCase):
+    def setUp(self):
+        caches["drafts"].clear()
+        self.room = VotingRoom.objects.create(name="Room")
+        self.objects = [
+            VotingObject.objects.create(room=self.room, title=f"Cat {i}", image="x.png")
+            for i in range(2)
+        ]
+        self.user = CustomUser.objects.create(username="voter")
+        self.participant = RoomParticipant.objects.create(
+            user=self.user, room=self.room, vote_data={}
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.a, self.b = (str(obj.id) for obj in self.objects)
+
+    def patch(self, revision, moves):
+        return self.client.patch(
+            reverse("patch_ranking", args=[self.room.id]),
+            {"revision": revision, "moves": moves},
+            format="json",
+        )
+
+    def test_drafts_stay_out_of_the_database_until_flushed(self):
+        self.assertEqual(self.patch(0, {self.a: 1}).data["revision"], 1)
+        self.assertEqual(self.patch(1, {self.b: 2}).data["revision"], 2)
+        self.assertEqual(self.patch(1, {self.b: 1}).status_code, 409)
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.vote_data, {})
+        self.assertEqual(self.participant.revision, 0)
+        status = self.client.get(reverse("participant_status", args=[self.room.id]))
+        self.assertEqual(status.data["vote_data"], {self.a: 1, self.b: 2})
+        self.assertEqual(status.data["revision"], 2)
+
+        key = draft_key(self.participant.pk)
+        self.assertIsNone(caches["drafts"].get(f"{key}:lock"))
+        self.assertEqual(flush_drafts(), 1)
+        self.assertEqual(flush_drafts(), 0)
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.vote_data, {self.a: 1, self.b: 2})
+        self.assertEqual(self.participant.revision, 2)
+        # Written back drafts leave the cache instead of waiting to be culled
+        self.assertIsNone(caches["drafts"].get(key))
+
+    def test_confirmation_saves_the_draft(self):
+        self.patch(0, {self.a: 2, self.b: 1})
+        self.client.patch(
+            reverse("patch_ranking", args=[self.room.id]),
+            {"revision": 1, "comments": "meow"},
+            format="json",
+        )
+        response = self.client.post(
+            reverse("update_ranking", args=[self.room.id]),
+            {"vote_data": {self.a: 2, self.b: 1}, "vote_confirmed": True},
+            format="json",
+        )
+        self.assertTrue(response.data["vote_confirmed"])
+        self.participant.refresh_from_db()
+        self.assertTrue(self.participant.vote_confirmed)
+        self.assertEqual(self.participant.comments, "meow")
+        self.assertEqual(self.participant.revision, 3)
+        # Nothing left for the flusher to overwrite the confirmed vote with
+        self.assertEqual(flush_drafts(), 0)
+
+
+class BallotCodecTests(SimpleTestCase):
+    def test_vote_data_round_trip(self):
+        slots = {"a": 0, "b": 1, "c": 2}
+        packed = encode_vote_data({"c": 1, "a": 2, "b": 3}, slots)
+        self.assertEqual(
+            decode_to_object_ids(packed, {0: "a", 1: "b", 2: "c"}), ["c", "a", "b"]
+        )
+
+    def test_unknown_object_is_not_packed(self):
+        self.assertIsNone(encode_vote_data({"x": 1}, {"a": 0}))
+
+
+class SQLiteProfileTests(RoomTestCase):
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_concurrent_confirmations_do_not_lock(self):
+        report = run_stress("production", workers=4, transactions=50)
+        self.assertEqual(report["lock_errors"], 0)
+        self.assertEqual(report["committed"], 200)
+        self.assertTrue(report["consistent"])
+
+
+class ShardPlacementTests(SimpleTestCase):
+    def test_rooms_stay_in_default_without_shards(self):
+        self.assertEqual(shard_for_room(uuid.uuid4(), shards=[]), "default")
+
+    def test_adding_a_shard_only_moves_rooms_to_it(self):
+        rooms = [uuid.UUID(int=random.Random(i).getrandbits(128)) for i in range(500)]
+        before = {room: shard_for_room(room, ["a", "b", "c"]) for room in rooms}
+        after = {room: shard_for_room(room, ["a", "b", "c", "d"]) for room in rooms}
+        moved = [room for room in rooms if before[room] != after[room]]
+        self.assertTrue(all(after[room] == "d" for room in moved))
+        self.assertLess(len(moved), 200)
+        self.assertEqual(set(before.values()), {"a", "b", "c"})
+
+
+@skipUnless(len(settings.VOTING_SHARDS) >= 2, "run with VOTING_SHARDS=2 or more")
+@override_settings(CACHES=LOCMEM_CACHES)
+class ShardedRoomTests(RoomTestCase):
+    def setUp(self):
+        caches["drafts"].clear()
+        self.room = VotingRoom.objects.create(name="Sharded")
+        self.objects = [
+            VotingObject.objects.create(room=self.room, title=title, image="x.png")
+            for title in ("A", "B")
+        ]
+        self.user = CustomUser.objects.create(username="voter")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def confirm(self, first, second):
+        return self.client.post(
+            reverse("update_ranking", args=[self.room.id]),
+            {
+                "vote_data": {str(first.id): 1, str(second.id): 2},
+                "vote_confirmed": True,
+            },
+            format="json",
+        )
+
+    def test_room_rows_live_in_the_room_shard(self):
+        shard = shard_for_room(self.room.id)
+        self.assertEqual(self.room._state.db, shard)
+        self.assertEqual(self.confirm(*self.objects).status_code, 200)
+        participant = RoomParticipant.objects.get(room=self.room, user=self.user)
+        self.assertEqual(participant._state.db, shard)
+        self.assertFalse(RoomParticipant.objects.using("default").exists())
+        self.assertTrue(RankingJob.objects.using("default").filter(room=self.room))
+
+        run_pending_jobs()
+        self.room.refresh_from_db()
+        results = get_room_results(self.room, self.room.ballot_revision)
+        self.assertEqual(results[0]["title"], "A")
+        rooms = self.client.get(reverse("votingroom-list")).data
+        self.assertEqual([room["id"] for room in rooms], [str(self.room.id)])
+
+    def test_room_admin_lists_the_selected_shard(self):
+        shard = self.room._state.db
+        other = next(alias for alias in settings.VOTING_SHARDS if alias != shard)
+        revision = self.room.ballot_revision
+        self.assertEqual(self.confirm(*self.objects).status_code, 200)
+        self.room.refresh_from_db()
+        self.assertGreater(self.room.ballot_revision, revision)
+
+        admin = CustomUser.objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(admin)
+        url = reverse("admin:voting_votingroom_changelist")
+        self.assertContains(self.client.get(url, {"db": shard}), "Sharded")
+        self.assertNotContains(self.client.get(url, {"db": other}), "Sharded")
+        url = reverse("admin:voting_roomparticipant_changelist")
+        self.assertContains(self.client.get(url, {"db": shard, "q": "vot"}), "voter")
+        change = reverse("admin:voting_votingroom_change", args=[self.room.id])
+        self.assertEqual(self.client.get(change).status_code, 200)
+
+    def test_move_room_rewrites_object_ids(self):
+        source = self.room._state.db
+        target = next(alias for alias in settings.VOTING_SHARDS if alias != source)
+        self.confirm(*reversed(self.objects))
+        run_pending_jobs()
+
+        move_room(self.room.id, source, target)
+        self.assertFalse(VotingRoom.objects.using(source).exists())
+        room = VotingRoom.objects.using(target).get()
+        ids = {obj.title: str(obj.id) for obj in VotingObject.objects.using(target)}
+        participant = RoomParticipant.objects.using(target).get()
+        self.assertEqual(participant.vote_data, {ids["B"]: 1, ids["A"]: 2})
+        self.assertEqual(next(iter(room.final_results)), ids["B"])
+        # The job queue entry belongs to the room, which still exists
+        self.assertTrue(RankingJob.objects.filter(room_id=room.id).exists())
+
+
+class ProvisionUsersTests(RoomTestCase):
+    def setUp(self):
+        self.rooms = [VotingRoom.objects.create(name=f"Room {i}") for i in range(2)]
+        CustomUser.objects.create(username="taken", user_id="AAAAAA")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def provision(self, name, text, *args):
+        path = Path(self.directory.name) / name
+        path.write_text(text)
+        output = Path(self.directory.name) / "codes.csv"
+        call_command(
+            "provision_users",
+            str(path),
+            "--output",
+            str(output),
+            *args,
+            stderr=io.StringIO(),
+        )
+        with output.open() as stream:
+            return list(csv.DictReader(stream))
+
+    def test_csv_roster(self):
+        first, second = (str(room.id) for room in self.rooms)
+        codes = self.provision(
+            "roster.csv",
+            "username,first_name,rooms\n"
+            f"ann,Ann,{second}\n"
+            "bob,Bob,\n"
+            "taken,Dup,\n"
+            "ann,Again,\n",
+            "--room",
+            first,
+            "--batch-size",
+            "1",
+        )
+        self.assertEqual([row["username"] for row in codes], ["ann", "bob"])
+        ann = CustomUser.objects.get(username="ann")
+        self.assertEqual(ann.first_name, "Ann")
+        self.assertFalse(ann.has_usable_password())
+        self.assertEqual(codes[0]["user_id"], ann.user_id)
+        self.assertEqual(Token.objects.get(user=ann).key, codes[0]["token"])
+        for room in self.rooms:
+            participants = RoomParticipant.objects.filter(room=room, user=ann)
+            self.assertTrue(participants.exists())
+        self.assertEqual(RoomParticipant.objects.filter(room=self.rooms[0]).count(), 2)
+        self.assertEqual(len({row["user_id"] for row in codes} | {"AAAAAA"}), 3)
+
+    def test_jsonl_roster_with_unknown_room_creates_nobody(self):
+        roster = json.dumps({"username": "ann", "rooms": [str(uuid.uuid4())]})
+        with self.assertRaisesMessage(CommandError, "Unknown room"):
+            self.provision("roster.jsonl", roster + "\n")
+        self.assertFalse(CustomUser.objects.filter(username="ann").exists())
+
+    def test_failed_participations_roll_back_the_batch(self):
+        entries = [RosterEntry(username="ann", rooms=[str(self.rooms[0].id)])]
+        failure = IntegrityError("participant insert failed")
+        with mock.patch.object(RoomShardQuerySet, "bulk_create", side_effect=failure):
+            with self.assertRaises(IntegrityError):
+                provision_users(entries)
+        self.assertFalse(CustomUser.objects.filter(username="ann").exists())
+        self.assertFalse(Token.objects.filter(user__username="ann").exists())
+
+    def test_generated_ids_avoid_taken_ones(self):
+        taken = {"AAAAAA"}
+        user_ids = generate_user_ids(500, taken)
+        self.assertEqual(len(set(user_ids)), 500)
+        self.assertNotIn("AAAAAA", user_ids)
+        self.assertEqual(len(taken), 501)
+
+
+class ImportRoomsTests(RoomTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.enterContext(override_settings(MEDIA_ROOT=self.directory / "media"))
+        for name, color in (("tom.png", "red"), ("felix.png", "blue")):
+            Image.new("RGB", (4, 4), color).save(self.directory / name)
+
+    def run_import(self, manifest):
+        path = self.directory / "rooms.json"
+        path.write_text(json.dumps(manifest))
+        output = io.StringIO()
+        call_command("import_rooms", str(path), "--workers", "1", stdout=output)
+        return output.getvalue()
+
+    def test_reimport_updates_instead_of_duplicating(self):
+        manifest = {
+            "rooms": [
+                {
+                    "name": "Cats",
+                    "ranking_method": "borda",
+                    "objects": [
+                        {"title": "Tom", "image": "tom.png"},
+                        {"title": "Felix", "image": "felix.png"},
+                    ],
+                }
+            ]
+        }
+        output = self.run_import(manifest)
+        self.assertIn("Objects: 2 created, 0 updated. Images: 2 stored", output)
+        room = VotingRoom.objects.get(pk=uuid.uuid5(ROOM_NAMESPACE, "Cats"))
+        self.assertEqual(room.ranking_method, "borda")
+        objects = list(room.votingobject_set.order_by("slot"))
+        self.assertEqual(
+            [(obj.title, obj.slot) for obj in objects], [("Tom", 0), ("Felix", 1)]
+        )
+        self.assertTrue(objects[0].image.storage.exists(objects[0].image.name))
+
+        self.assertIn("Rooms: 0 created, 0 updated", self.run_import(manifest))
+        objects = manifest["rooms"][0]["objects"]
+        objects[0]["content"] = "Grey"
+        objects.append({"title": "Garfield", "image": "tom.png"})
+        output = self.run_import(manifest)
+        self.assertIn("Objects: 1 created, 1 updated. Images: 0 stored", output)
+        self.assertEqual(
+            sum(VotingRoom.objects.using(alias).count() for alias in room_databases()),
+            1,
+        )
+        self.assertEqual(
+            list(room.votingobject_set.order_by("slot").values_list("title", "slot")),
+            [("Tom", 0), ("Felix", 1), ("Garfield", 2)],
+        )
+
+        # A deleted object's slot is not handed out again
+        room.votingobject_set.filter(title="Garfield").delete()
+        self.run_import(manifest)
+        self.assertEqual(room.votingobject_set.get(title="Garfield").slot, 3)
+
+    def test_invalid_image_aborts(self):
+        (self.directory / "notes.png").write_text("not an image")
+        objects = [{"title": "X", "image": "notes.png"}]
+        manifest = [{"name": "Cats", "objects": objects}]
+        with self.assertRaisesMessage(CommandError, "not a valid image"):
+            self.run_import(manifest)
+        self.assertFalse(VotingRoom.objects.exists())
+
+
+class ImageVariantsTests(RoomTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.room = VotingRoom.objects.create(name="Cats")
+
+    def upload(self, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        with self.captureOnCommitCallbacks(execute=True):
+            return VotingObject.objects.create(
+                room=self.room,
+                title="Tom",
+                image=SimpleUploadedFile("tom.jpg", buffer.getvalue()),
+            )
+
+    def test_upload_makes_variants_without_upscaling(self):
+        obj = self.upload((400, 200))
+        # Resized by the ranking worker, not while handling the upload
+        self.assertEqual(obj.image_variants, {})
+        self.assertTrue(RankingJob.objects.get(room=self.room).variants)
+        run_pending_jobs()
+        obj.refresh_from_db()
+        variants = obj.image_variants
+        self.assertEqual(variants["source"], obj.image.name)
+        self.assertIn("webp", variants["formats"])
+        self.assertEqual([w for w, _ in variants["formats"]["jpeg"]], [160, 320, 400])
+        with default_storage.open(variants["formats"]["webp"][0][1]) as stream:
+            self.assertEqual(Image.open(stream).size, (160, 80))
+
+        image = VotingObjectSerializer(obj).data["image"]
+        self.assertEqual((image["width"], image["height"]), (400, 200))
+        self.assertTrue(image["srcset"].endswith("/400.jpg 400w"))
+        self.assertIn("image/webp", [source["type"] for source in image["sources"]])
+
+    def test_upload_does_not_recompute_the_ranking(self):
+        obj = self.upload((100, 100))
+        self.assertFalse(RankingJob.objects.get(room=self.room).ranking)
+        with mock.patch("voting.service.refresh_room_ranking") as refresh:
+            run_pending_jobs()
+        refresh.assert_not_called()
+        obj.refresh_from_db()
+        self.assertIn("formats", obj.image_variants)
+        self.assertEqual(RankingJob.objects.get(room=self.room).status, "done")
+
+    def test_variants_survive_a_failed_recompute(self):
+        obj = self.upload((100, 100))
+        enqueue_ranking(self.room, full_rebuild=True)
+        failure = OperationalError("disk I/O error")
+        with mock.patch("voting.service.calculate_room_ranking", side_effect=failure):
+            with self.assertLogs("voting.jobs", "ERROR"):
+                run_pending_jobs()
+        obj.refresh_from_db()
+        self.assertIn("formats", obj.image_variants)
+        self.assertEqual(RankingJob.objects.get(room=self.room).status, "failed")
+
+    def test_backfill_command(self):
+        with override_settings(VOTING_IMAGE_VARIANTS_ON_SAVE=False):
+            obj = self.upload((100, 100))
+        self.assertIsNone(VotingObjectSerializer(obj).data["image"])
+        call_command("generate_image_variants", "--workers", "1", stdout=io.StringIO())
+        obj.refresh_from_db()
+        self.assertEqual(obj.image_variants["formats"]["jpeg"][0][0], 100)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TokenCacheTests(RoomTestCase):
+    def setUp(self):
+        token_cache.clear()
+        token_cache.reset_stats()
+        caches["auth_tokens"].clear()
+        self.user = CustomUser.objects.create(username="voter")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.url = reverse("votingroom-list")
+
+    def test_lookups_are_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # The room list only, one query per room database
+        with self.assertQueriesEverywhere(len(room_databases())):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        stats = token_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+        # Another process only finds the lookup in the shared cache
+        token_cache.clear()
+        with self.assertQueriesEverywhere(len(room_databases())):
+            self.client.get(self.url)
+        self.assertEqual(token_cache.stats()["shared_hits"], 1)
+
+    def test_shared_tier_keeps_no_password(self):
+        self.user.set_password("correct horse")
+        self.user.save()
+        self.client.get(self.url)
+        token_cache.clear()
+        for entry in caches["auth_tokens"]._cache.values():
+            self.assertNotIn(self.user.password.encode(), entry)
+        user, token = token_cache.get(self.token.key)
+        self.assertEqual((user.pk, user.username), (self.user.pk, "voter"))
+        self.assertEqual((token.key, token.user), (self.token.key, user))
+        self.assertIn("password", user.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertEqual(user.password, self.user.password)
+
+    def test_deactivation_and_token_deletion_invalidate(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.client.get(self.url)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=2)
+    def test_least_recently_used_is_evicted(self):
+        for key in "abc":
+            token_cache.set(key, (self.user, self.token))
+        token_cache.clear()  # only the shared tier would still have "a"
+        for key in "bc":
+            token_cache.set(key, (self.user, self.token))
+        token_cache.get("b")
+        token_cache.set("d", (self.user, self.token))
+        self.assertEqual(token_cache.stats()["evictions"], 2)
+        self.assertEqual(list(token_cache._entries), ["b", "d"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoomUpdatesTests(RoomTestCase):
+    def setUp(self):
+        caches["drafts"].clear()
+        self.room = VotingRoom.objects.create(name="Live")
+        self.objects = [
+            VotingObject.objects.create(room=self.room, title=title, image="x.png")
+            for title in ("A", "B")
+        ]
+        self.user = CustomUser.objects.create(username="voter")
+        RoomParticipant.objects.create(user=self.user, room=self.room)
+        self.token = Token.objects.create(user=self.user).key
+
+    def follow(self, subprotocols):
+        return WebsocketCommunicator(
+            application,
+            f"/ws/rooms/{self.room.id}/",
+            headers=[(b"origin", b"http://testserver")],
+            subprotocols=subprotocols,
+        )
+
+    def confirm(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        a, b = (str(obj.id) for obj in self.objects)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                reverse("update_ranking", args=[self.room.id]),
+                {"vote_data": {a: 1, b: 2}, "vote_confirmed": True},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_confirmation_is_pushed_to_followers(self):
+        async def follow_room():
+            followers = [self.follow(["token", self.token]) for _ in range(2)]
+            for follower in followers:
+                connected, subprotocol = await follower.connect()
+                self.assertTrue(connected)
+                self.assertEqual(subprotocol, "token")
+                snapshot = await follower.receive_json_from()
+                self.assertEqual(snapshot["participants"], 1)
+                self.assertEqual(snapshot["confirmed"], 0)
+
+            await sync_to_async(self.confirm)()
+            for follower in followers:
+                update = await follower.receive_json_from()
+                self.assertEqual(update["confirmed"], 1)
+                # The room's first ballot: the worker builds the aggregate
+                self.assertTrue(update["pending"])
+
+            await sync_to_async(run_pending_jobs)()
+            for follower in followers:
+                update = await follower.receive_json_from()
+                self.assertNotIn("pending", update)
+                self.assertEqual(update["results"][0]["title"], "A")
+                await follower.disconnect()
+
+        async_to_sync(follow_room)()
+
+    def test_only_the_revision_is_published(self):
+        async def follow_group():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add(room_group(self.room.id), channel)
+            await sync_to_async(self.confirm)()
+            message = await layer.receive(channel)
+            await layer.group_discard(room_group(self.room.id), channel)
+            return message
+
+        message = async_to_sync(follow_group)()
+        self.room.refresh_from_db()
+        self.assertEqual(
+            message,
+            {
+                "type": "room.update",
+                "room": str(self.room.id),
+                "revision": self.room.ballot_revision,
+            },
+        )
+
+    def test_strangers_cannot_follow(self):
+        async def follow_room(subprotocols):
+            follower = self.follow(subprotocols)
+            connected, _ = await follower.connect()
+            await follower.disconnect()
+            return connected
+
+        stranger = CustomUser.objects.create(username="stranger")
+        self.assertFalse(async_to_sync(follow_room)([]))
+        token = Token.objects.create(user=stranger).key
+        self.assertFalse(async_to_sync(follow_room)(["token", token]))
+
+    def test_event_stream_shares_one_producer(self):
+        url = reverse("room_event_stream", args=[self.room.id])
+
+        async def listen(**headers):
+            response = await self.async_client.get(
+                url, {"token": self.token}, headers=headers
+            )
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            events = aiter(response.streaming_content)
+            self.assertEqual(await anext(events), b"retry: 3000\n\n")
+            return events
+
+        async def follow_room():
+            first = await listen()
+            snapshot = (await anext(first)).decode()
+            await self.room.arefresh_from_db()
+            revision = self.room.ballot_revision
+            self.assertTrue(snapshot.startswith(f"id: {revision}\n"))
+            # Already up to date: the resumed stream skips the snapshot
+            second = await listen(last_event_id=str(revision))
+            self.assertEqual(len(streams._streams), 1)
+
+            await sync_to_async(self.confirm)()
+            for events in (first, second):
+                event = (await anext(events)).decode()
+                update = json.loads(event.split("data: ")[1])
+                self.assertEqual(update["confirmed"], 1)
+                # Disconnecting cancels the request while it waits for events
+                waiting = asyncio.ensure_future(anext(events))
+                await asyncio.sleep(0)
+                waiting.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await waiting
+            self.assertEqual(streams._streams, {})
+
+        async_to_sync(follow_room)()
+
+    def test_strangers_cannot_stream(self):
+        stranger = CustomUser.objects.create(username="stranger")
+        url = reverse("room_event_stream", args=[self.room.id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        token = Token.objects.create(user=stranger).key
+        self.assertEqual(self.client.get(url, {"token": token}).status_code, 403)
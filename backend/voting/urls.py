@@ -19,6 +19,41 @@ urlpatterns = [
         views.update_ranking,
         name="update_ranking",
     ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/ranking/",
+        views.patch_ranking,
+        name="patch_ranking",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/ranking-status/",
+        views.ranking_status,
+        name="ranking_status",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/results/",
+        views.room_results,
+        name="room_results",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/events/",
+        views.room_event_stream,
+        name="room_event_stream",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/influence/",
+        views.ballot_influence,
+        name="ballot_influence",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/agreement/",
+        views.room_agreement,
+        name="room_agreement",
+    ),
+    path(
+        "api/voting/rooms/<uuid:room_id>/agreement/csv/",
+        views.room_agreement_csv,
+        name="room_agreement_csv",
+    ),
     path(
         "api/fingerprint/", views.FingerprintAPIView.as_view(), name="fingerprint-api"
     ),
@@ -1,17 +1,49 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef
+from channels.db import database_sync_to_async
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from rest_framework import permissions, status, viewsets
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from users.authentication import UUIDTokenAuthentication
+from users.authentication import (
+    UUIDTokenAuthentication,
+    event_stream_token,
+    token_user,
+)
 
-from .models import NickName, RoomParticipant, VotingObject, VotingRoom
+from .agreement import (
+    AGREEMENT_METHODS,
+    agreement_report,
+    get_room_agreement,
+    write_agreement_csv,
+)
+from .analysis import cached_ballot_influence, cached_placement_stability
+from .codecs import encode_vote_data
+from .drafts import (
+    discard_draft,
+    draft_buffer_enabled,
+    overlay_draft,
+    save_draft,
+)
+from .jobs import enqueue_ranking
+from .models import NickName, RankingJob, RoomParticipant, VotingObject, VotingRoom
+from .query_budget import query_budget
+from .realtime import can_follow_room, publish_room_update_on_commit
 from .serializers import (
     NickNameSerializer,
     VotingObjectSerializer,
     VotingRoomSerializer,
 )
+from .service import cached_room_results, get_room_leaderboard, stored_room_results
+from .sharding import room_databases, room_db
+from .streams import room_events
 
 
 def room_detail_view(request, room_id):
@@ -19,6 +51,7 @@ def room_detail_view(request, room_id):
     return render(request, "voting/room_detail.html")
 
 
+@query_budget(2)
 class VotingRoomViewSet(viewsets.ReadOnlyModelViewSet):
     authentication_classes = [UUIDTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
@@ -26,15 +59,39 @@ class VotingRoomViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         return VotingRoom.objects.filter(
-            roomparticipant__user=self.request.user, is_active=True
-        ).distinct()
+            Exists(
+                RoomParticipant.objects.filter(
+                    room=OuterRef("pk"), user=self.request.user
+                )
+            ),
+            is_active=True,
+        ).annotate(participants_count=Count("roomparticipant"))
 
+    @query_budget(lambda: 1 + len(room_databases()))
+    def list(self, request, *args, **kwargs):
+        # One query per room database, see voting.sharding
+        rooms = [
+            room
+            for alias in room_databases()
+            for room in self.filter_queryset(self.get_queryset()).using(alias)
+        ]
+        return Response(self.get_serializer(rooms, many=True).data)
+
+    @query_budget(3)
     @action(detail=True, methods=["get"])
     def objects(self, request, pk=None):
         """Get all voting objects for a specific room"""
         try:
-            room = self.get_object()
-            objects = VotingObject.objects.filter(room=room)
+            objects = list(
+                VotingObject.objects.filter(
+                    room_id=pk,
+                    room__is_active=True,
+                    room__roomparticipant__user=request.user,
+                )
+            )
+            # Only an empty list needs telling apart from a room we can't see
+            if not objects:
+                self.get_object()
             serializer = VotingObjectSerializer(
                 objects, many=True, context={"request": request}
             )
@@ -42,7 +99,45 @@ class VotingRoomViewSet(viewsets.ReadOnlyModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @query_budget(3)
+    @action(detail=True, methods=["get"])
+    def bootstrap(self, request, pk=None):
+        """
+        Everything the room page needs in one request: the room, its voting
+        objects and the caller's participant state. Two queries after
+        authentication, however many objects the room has.
+        """
+        try:
+            participant = (
+                RoomParticipant.objects.select_related("room")
+                .annotate(room_participants=Count("room__roomparticipant"))
+                .get(room_id=pk, user=request.user, room__is_active=True)
+            )
+        except (RoomParticipant.DoesNotExist, DjangoValidationError):
+            return Response({"error": "Room not found"}, status=404)
+
+        overlay_draft(participant)
+        room = participant.room
+        room.participants_count = participant.room_participants
+        objects = VotingObject.objects.filter(room_id=room.id)
+        context = {"request": request}
+        return Response(
+            {
+                "room": VotingRoomSerializer(room, context=context).data,
+                "objects": VotingObjectSerializer(
+                    objects, many=True, context=context
+                ).data,
+                "participant": {
+                    "vote_data": participant.vote_data or {},
+                    "vote_confirmed": participant.vote_confirmed,
+                    "comments": participant.comments,
+                    "revision": participant.revision,
+                },
+            }
+        )
+
 
+@query_budget(6)
 @api_view(["GET"])
 def participant_status(request, room_id):
     """Get the current status for a participant in a room"""
@@ -53,12 +148,16 @@ def participant_status(request, room_id):
             room=room,
             defaults={"vote_data": {}, "vote_confirmed": False, "comments": ""},
         )
+        if created:
+            publish_room_update_on_commit(room)
+        overlay_draft(participant)
 
         return Response(
             {
                 "vote_data": participant.vote_data,
                 "vote_confirmed": participant.vote_confirmed,
                 "comments": participant.comments,
+                "revision": participant.revision,
             }
         )
     except VotingRoom.DoesNotExist:
@@ -67,6 +166,7 @@ def participant_status(request, room_id):
         return Response({"error": str(e)}, status=400)
 
 
+@query_budget(16)
 @api_view(["POST"])
 def update_ranking(request, room_id):
     """Update the ranking for a participant in a room"""
@@ -79,6 +179,13 @@ def update_ranking(request, room_id):
             room=room,
             defaults={"vote_data": {}, "vote_confirmed": False, "comments": ""},
         )
+        if created:
+            publish_room_update_on_commit(room)
+
+        was_confirmed = participant.vote_confirmed
+        old_vote_data = participant.vote_data
+        # Confirming saves the latest buffered draft along with the vote
+        overlay_draft(participant)
 
         # Don't allow updates if already confirmed
         if participant.vote_confirmed and not request.data.get("vote_confirmed", False):
@@ -94,33 +201,384 @@ def update_ranking(request, room_id):
         if "comments" in request.data:
             participant.comments = request.data["comments"]
 
+        participant.revision += 1
+
         # Only update confirmation status if being set to True
         if request.data.get("vote_confirmed", False):
             # Validate that all objects have been ranked
-            all_objects = VotingObject.objects.filter(room=room)
-            if len(participant.vote_data) != all_objects.count():
+            slot_by_object_id = {
+                str(obj_id): slot
+                for obj_id, slot in VotingObject.objects.filter(room=room).values_list(
+                    "id", "slot"
+                )
+            }
+            if len(participant.vote_data) != len(slot_by_object_id):
                 return Response(
                     {"error": "All objects must be ranked before confirming"},
                     status=400,
                 )
 
             participant.vote_confirmed = True
+            participant.ballot = encode_vote_data(
+                participant.vote_data, slot_by_object_id
+            )
+        elif draft_buffer_enabled() and not participant.vote_confirmed:
+            # Unconfirmed edits stay in the draft buffer
+            if not save_draft(
+                participant,
+                participant.vote_data,
+                participant.comments,
+                participant.revision,
+            ):
+                return _revision_conflict(participant)
+            return Response(
+                {
+                    "success": True,
+                    "vote_confirmed": False,
+                    "revision": participant.revision,
+                }
+            )
 
-        participant.save()
-
-        # If confirmed, recalculate room rankings
-        if participant.vote_confirmed:
-            from voting.service import calculate_room_ranking
+        # Save the ballot and its aggregate delta together so cached results
+        # keyed by the ballot revision never see one without the other
+        with transaction.atomic(using=room_db(room)):
+            # voting.signals folds a confirmed ballot into the room aggregate
+            # and lets the ranking worker recompute the placements
+            participant.save()
 
-            calculate_room_ranking(room)
+            if participant.vote_confirmed and (
+                not was_confirmed or participant.vote_data != old_vote_data
+            ):
+                # Followers are told the new revision instead of polling
+                publish_room_update_on_commit(room)
+        discard_draft(participant)
 
-        return Response({"success": True, "vote_confirmed": participant.vote_confirmed})
+        return Response(
+            {
+                "success": True,
+                "vote_confirmed": participant.vote_confirmed,
+                "revision": participant.revision,
+            }
+        )
     except VotingRoom.DoesNotExist:
         return Response({"error": "Room not found"}, status=404)
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
 
+def _apply_moves(vote_data, moves):
+    """Return ``vote_data`` with the moved objects' positions replaced."""
+    if not isinstance(moves, dict):
+        raise ValueError("moves must map object IDs to positions")
+    vote_data = dict(vote_data or {})
+    for obj_id, position in moves.items():
+        if position is None:
+            vote_data.pop(obj_id, None)
+        elif type(position) is int and position > 0:
+            vote_data[obj_id] = position
+        else:
+            raise ValueError(f"Invalid position for {obj_id}")
+    return vote_data
+
+
+@query_budget(3)
+@api_view(["PATCH"])
+def patch_ranking(request, room_id):
+    """
+    Apply a ranking delta to the participant's draft.
+
+    The body carries the ``revision`` the client last saw and ``moves``, a map
+    of object ID to new position (``null`` to unrank). The update only applies
+    on top of that revision, otherwise it is rejected with 409 and the current
+    draft so the client can rebase. Deltas that change nothing are not written,
+    and with the draft buffer on the others only go to the buffer.
+    """
+    participant = (
+        RoomParticipant.objects.filter(room_id=room_id, user=request.user)
+        .only("id", "vote_data", "comments", "vote_confirmed", "revision")
+        .first()
+    )
+    if participant is None:
+        return Response({"error": "Room not found"}, status=404)
+    if participant.vote_confirmed:
+        return Response(
+            {"error": "Ranking already confirmed and cannot be modified"},
+            status=400,
+        )
+
+    overlay_draft(participant)
+    revision = request.data.get("revision")
+    if revision != participant.revision:
+        return _revision_conflict(participant)
+
+    try:
+        vote_data = _apply_moves(
+            participant.vote_data, request.data.get("moves", {})
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    comments = request.data.get("comments", participant.comments)
+
+    unchanged = vote_data == (participant.vote_data or {})
+    if unchanged and comments == participant.comments:
+        return Response({"revision": participant.revision, "changed": False})
+
+    if draft_buffer_enabled():
+        if not save_draft(participant, vote_data, comments, revision + 1):
+            return _revision_conflict(overlay_draft(participant))
+        return Response({"revision": revision + 1, "changed": True})
+
+    # Conditional on the revision, so a concurrent delta can't be overwritten
+    updated = RoomParticipant.objects.filter(
+        room_id=room_id, pk=participant.pk, revision=revision, vote_confirmed=False
+    ).update(
+        vote_data=vote_data,
+        comments=comments,
+        revision=F("revision") + 1,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        participant.refresh_from_db(fields=["vote_data", "comments", "revision"])
+        return _revision_conflict(participant)
+    return Response({"revision": revision + 1, "changed": True})
+
+
+def _revision_conflict(participant):
+    return Response(
+        {
+            "error": "Ranking was changed elsewhere",
+            "revision": participant.revision,
+            "vote_data": participant.vote_data or {},
+            "comments": participant.comments,
+        },
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+@query_budget(3)
+@api_view(["GET"])
+def ranking_status(request, room_id):
+    """Get the state of the room's queued ranking recompute"""
+    try:
+        room = VotingRoom.objects.get(id=room_id)
+    except VotingRoom.DoesNotExist:
+        return Response({"error": "Room not found"}, status=404)
+
+    job = RankingJob.objects.filter(room=room).first()
+    if job is None:
+        return Response({"status": None})
+
+    return Response(
+        {
+            "status": job.status,
+            "up_to_date": job.status == RankingJob.DONE
+            and job.processed == job.requested,
+            "requested_at": job.requested_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+    )
+
+
+@query_budget(16)
+@api_view(["GET"])
+def room_results(request, room_id):
+    """
+    Get the current ranking of a room, answering 304 while it is unchanged.
+
+    With ``?stability=1`` (staff only) every object also gets a bootstrap
+    placement interval and the confidence of its place (skating rooms only).
+    The ranking worker computes them: until it has, the answer is 202 with the
+    plain results and ``"stability": "pending"``. ``?top=K`` limits the results
+    to the objects placed within the top K, for leaderboard screens.
+
+    Results needing a full recompute (see
+    :func:`voting.service.cached_room_results`) are answered with 202, the last
+    stored ranking and ``"pending": true`` until the worker has run.
+    """
+    room = (
+        VotingRoom.objects.filter(id=room_id)
+        .only("id", "ballot_revision", "ranking_method")
+        .first()
+    )
+    if room is None:
+        return Response({"error": "Room not found"}, status=404)
+
+    stability = request.query_params.get("stability") in ("1", "true")
+    if stability and not request.user.is_staff:
+        return Response(
+            {"error": "Stability intervals are only available to staff"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+    if stability and room.ranking_method != "skating":
+        return Response(
+            {"error": "Stability intervals are only available for skating rooms"},
+            status=400,
+        )
+
+    top = request.query_params.get("top")
+    if top is not None:
+        try:
+            top = int(top)
+        except ValueError:
+            top = 0
+        if top < 1:
+            return Response({"error": "top must be a positive integer"}, status=400)
+
+    etag = f'"{room.id}-{room.ranking_method}-{room.ballot_revision}'
+    if stability:
+        etag += "-stability"
+    if top is not None:
+        etag += f"-top{top}"
+    etag += '"'
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    if top is not None:
+        results = get_room_leaderboard(room, room.ballot_revision, top)
+    else:
+        results = cached_room_results(room, room.ballot_revision)
+    if results is None:
+        # Recomputed by the ranking worker: the last stored ranking meanwhile
+        results = stored_room_results(room)
+        if top is not None:
+            results = [entry for entry in results if entry["final_rank"] <= top]
+        return Response(
+            {
+                "revision": room.ballot_revision,
+                "method": room.ranking_method,
+                "results": results,
+                "pending": True,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Cache-Control": "no-cache"},
+        )
+    if stability:
+        intervals = cached_placement_stability(room, room.ballot_revision)
+        if intervals is None:
+            enqueue_ranking(room, stability=True)
+            return Response(
+                {
+                    "revision": room.ballot_revision,
+                    "method": room.ranking_method,
+                    "results": results,
+                    "stability": "pending",
+                },
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Cache-Control": "no-cache"},
+            )
+        results = [{**entry, **intervals.get(entry["id"], {})} for entry in results]
+    return Response(
+        {
+            "revision": room.ballot_revision,
+            "method": room.ranking_method,
+            "results": results,
+        },
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+
+@require_GET
+async def room_event_stream(request, room_id):
+    """
+    Server-Sent Events stream of the room's progress and results, for clients
+    that can't open the WebSocket. Resumes from ``Last-Event-ID``.
+    """
+    key = event_stream_token(request)
+    user = await token_user(key) if key else await request.auser()
+    if not await database_sync_to_async(can_follow_room)(user, room_id):
+        return HttpResponseForbidden()
+
+    response = StreamingHttpResponse(
+        room_events(room_id, request.headers.get("Last-Event-ID")),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@query_budget(6)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def ballot_influence(request, room_id):
+    """
+    Staff only: how each confirmed ballot moved the room's placements.
+
+    The ranking worker computes the report: until it has, the answer is 202
+    with ``"influence": "pending"``.
+    """
+    room = (
+        VotingRoom.objects.filter(id=room_id)
+        .only("id", "ballot_revision", "ranking_method")
+        .first()
+    )
+    if room is None:
+        return Response({"error": "Room not found"}, status=404)
+
+    report = cached_ballot_influence(room, room.ballot_revision)
+    if report is None:
+        enqueue_ranking(room, influence=True)
+        return Response(
+            {"revision": room.ballot_revision, "influence": "pending"},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Cache-Control": "no-cache"},
+        )
+    return Response({"revision": room.ballot_revision, **report})
+
+
+def _agreement_request(request, room_id):
+    room = VotingRoom.objects.filter(id=room_id).only("id", "ballot_revision").first()
+    if room is None:
+        return None, None, Response({"error": "Room not found"}, status=404)
+
+    method = request.query_params.get("method", "spearman")
+    if method not in AGREEMENT_METHODS:
+        return (
+            None,
+            None,
+            Response(
+                {"error": f"method must be one of {', '.join(AGREEMENT_METHODS)}"},
+                status=400,
+            ),
+        )
+    return room, method, None
+
+
+@query_budget(6)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def room_agreement(request, room_id):
+    """Staff only: voter x voter rank correlation (?method=spearman|kendall)"""
+    room, method, error = _agreement_request(request, room_id)
+    if error is not None:
+        return error
+
+    agreement = get_room_agreement(room, room.ballot_revision)
+    return Response(
+        {"revision": room.ballot_revision, **agreement_report(agreement, method)}
+    )
+
+
+@query_budget(6)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def room_agreement_csv(request, room_id):
+    """Staff only: the agreement matrix as a CSV download"""
+    room, method, error = _agreement_request(request, room_id)
+    if error is not None:
+        return error
+
+    agreement = get_room_agreement(room, room.ballot_revision)
+    response = HttpResponse(content_type="text/csv")
+    response["Content-Disposition"] = (
+        f'attachment; filename="agreement-{room.id}-{method}.csv"'
+    )
+    write_agreement_csv(agreement, method, response)
+    return response
+
+
 def nickname_view(request):
     return render(request, "voting/nickname.html")
 